@@ -1,9 +1,20 @@
 import os
+import re
+import threading
+import time
 import uuid
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from config import Config
+from services import events, metrics, pipeline, speculation, symptom_matcher, tiers, transcript_cache
+from services.ingest import UploadTooLarge, remove_recording
+from services.janitor import Janitor
+from services.session_store import create_store
+from services.symptom_analyzer import NO_SPEECH_PLACEHOLDER, compile_prompt, configure_cache, configure_client, \
+    get_cache_stats
+from services.transcription import configure_model, configure_prepass, fetch_model, model_state, preload_model
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -12,11 +23,126 @@ app.secret_key = Config.SECRET_KEY
 # Ensure upload folder exists
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
 
-# Whisper model will be loaded lazily on first transcription request
-whisper_loaded = False
+# Session storage: in-memory (single worker) or SQLite shared by every worker on the host
+session_store = create_store(Config.SESSION_STORE, Config.SESSION_DB_PATH)
+events.configure(session_store, max_streams=Config.SSE_MAX_STREAMS)
+
+# Transcription jobs start at upload time: ffmpeg extractions run side by side,
+# inference in a pool matching the model's num_workers. Under WHISPER_BATCHING an
+# inference thread only waits on the batch scheduler, so there are enough of them
+# for a full batch to form (CTranslate2 still runs num_workers passes at a time)
+pipeline.configure(max_workers=Config.INFERENCE_THREADS, extract_workers=Config.EXTRACT_WORKERS,
+                   queue_limit=Config.TRANSCRIPTION_QUEUE_LIMIT)
+
+# TRANSCRIPTION_BACKEND=spool: Whisper runs in standalone worker processes
+# (python -m services.worker) fed through a job spool shared by the whole host
+job_spool = None
+if Config.TRANSCRIPTION_BACKEND == 'spool':
+    if Config.SESSION_STORE != 'sqlite':
+        raise ValueError("TRANSCRIPTION_BACKEND=spool needs SESSION_STORE=sqlite")
+    from services.spool import JobSpool
+    job_spool = JobSpool(Config.SPOOL_DIR)
+elif Config.TRANSCRIPTION_BACKEND != 'inline':
+    raise ValueError(f"Unknown transcription backend: {Config.TRANSCRIPTION_BACKEND}")
+
+# A streaming decoder lives in the worker that got an upload's first chunk; with several
+# workers the completion usually lands elsewhere, so decode chunked uploads at completion instead
+stream_decode = Config.STREAMING_DECODE and Config.WEB_CONCURRENCY == 1
+if Config.STREAMING_DECODE and not stream_decode:
+    print(f"[UPLOAD] {Config.WEB_CONCURRENCY} web workers: chunked uploads are decoded when they complete")
+
+# Repeated analyses of identical answers are served from cache
+configure_cache(Config.ANALYSIS_CACHE_SIZE, Config.ANALYSIS_CACHE_TTL, Config.ANALYSIS_CACHE_DB)
+
+# Local keyword matcher: instant provisional results and a fallback when Claude fails
+symptom_matcher.configure(Config.SYMPTOM_CATEGORIES, Config.SYMPTOM_SYNONYMS)
+
+# One pooled Claude client per worker process instead of a new connection per analysis
+configure_client(
+    max_connections=Config.CLAUDE_MAX_CONNECTIONS,
+    max_keepalive_connections=Config.CLAUDE_MAX_KEEPALIVE,
+    timeout=Config.CLAUDE_TIMEOUT,
+    connect_timeout=Config.CLAUDE_CONNECT_TIMEOUT,
+    max_retries=Config.CLAUDE_MAX_RETRIES,
+    base_url=Config.CLAUDE_BASE_URL
+)
+
+# Render the static prompt prefix and tool schemas once, before (and shared across) forked workers
+compile_prompt(Config.SYMPTOM_CATEGORIES)
+
+# SPECULATIVE_ANALYSIS: analyze answers as they are transcribed, ahead of /api/analyze
+speculation.configure(session_store, Config.SPECULATIVE_ANALYSIS, Config.CLAUDE_API_KEY, Config.CLAUDE_MODEL,
+                      Config.SYMPTOM_CATEGORIES, Config.ANALYSIS_SHORTLIST,
+                      run_timeout=Config.CLAUDE_TIMEOUT * (Config.CLAUDE_MAX_RETRIES + 1))
+
+configure_model(Config.WHISPER_CPU_THREADS, Config.WHISPER_NUM_WORKERS, Config.WHISPER_COMPUTE_TYPE)
+configure_prepass(Config.SILENCE_PREPASS, Config.SILENCE_MIN_RMS, Config.SILENCE_MAX_PAUSE_SECONDS,
+                  max_rms=Config.SILENCE_MAX_RMS, noise_ratio=Config.SILENCE_NOISE_RATIO,
+                  peak_ratio=Config.SILENCE_PEAK_RATIO)
+
+# Re-requests and re-uploads of the same recording reuse its transcription
+transcript_cache.configure(Config.TRANSCRIPT_CACHE_SIZE)
+
+# Quality tiers: cheaper Whisper settings while the transcription queue is backed up
+tiers.configure(
+    Config.TRANSCRIPTION_TIERS,
+    queue_high=Config.TIER_QUEUE_HIGH,
+    queue_low=Config.TIER_QUEUE_LOW,
+    latency_high=Config.TIER_P95_HIGH_SECONDS,
+    latency_low=Config.TIER_P95_LOW_SECONDS,
+    min_dwell_seconds=Config.TIER_MIN_DWELL_SECONDS
+)
+PRIMARY_MODEL = tiers.primary_tier()['model']
+
+if Config.WHISPER_BATCHING:
+    from services.transcription import configure_batching
+    configure_batching(Config.WHISPER_BATCH_WINDOW_MS, Config.WHISPER_BATCH_MAX_SIZE, Config.WHISPER_LANGUAGE,
+                       model_name=PRIMARY_MODEL, beam_size=tiers.primary_tier()['beam_size'])
+
+PENDING_JOB_STATUSES = ('queued', 'running')
+
+# Prometheus metrics, merged across workers at scrape time. An in-memory session
+# store is per worker, so its size is summed like the job queue; SQLite is shared.
+metrics.configure(Config.METRICS_DIR)
+metrics.register_gauge('intake_queued_jobs', pipeline.queue_depth)
+metrics.register_gauge('intake_event_streams', events.open_streams)
+if Config.SESSION_STORE != 'sqlite':
+    metrics.register_gauge('intake_active_sessions', lambda: len(session_store.list_sessions()))
+
+# Whisper model: loaded lazily on the first transcription, or with PRELOAD_MODEL as
+# soon as each worker starts. CTranslate2's thread pools don't survive fork, so
+# under gunicorn --preload the master only downloads the weights and reads them
+# into the page cache; every worker then loads and warms its own copy.
+_preload_pid = None
+
+
+def start_model_preload():
+    """Load and warm every tier's model in a background thread (once per process)."""
+    global _preload_pid
+    if _preload_pid == os.getpid():
+        return
+    _preload_pid = os.getpid()
+
+    def preload():
+        # Primary model first: readiness only waits for it
+        for tier in tiers.model_tiers():
+            try:
+                preload_model(tier['model'], tier['beam_size'])
+            except Exception as e:
+                print(f"[ERROR] Model preload failed for {tier['model']}: {e}")
+
+    threading.Thread(target=preload, name="model-preload", daemon=True).start()
+
 
-# In-memory session storage (in production: use Redis or database)
-patient_sessions = {}
+if Config.PRELOAD_MODEL and job_spool is None:
+    for _model_name in dict.fromkeys(tier['model'] for tier in tiers.all_tiers()):
+        fetch_model(_model_name)
+    os.register_at_fork(after_in_child=start_model_preload)
+
+    @app.before_request
+    def ensure_model_preload():
+        # Covers servers that don't fork after importing the app (dev server, no --preload)
+        start_model_preload()
 
 
 def cleanup_session_files(session_id):
@@ -33,11 +159,41 @@ def cleanup_session_files(session_id):
             print(f"Warning: Could not clean up session folder {session_id}: {e}")
 
 
+def evict_session(session_id):
+    """Cancel a session's jobs and streaming decoders before the janitor deletes its files."""
+    from services import chunked_upload
+
+    pipeline.discard(session_id)
+    if job_spool is not None:
+        job_spool.discard(session_id)
+    session_folder = os.path.join(Config.UPLOAD_FOLDER, session_id)
+    for q in Config.QUESTIONS:
+        chunked_upload.discard(session_folder, q['id'])
+
+
+# Abandoned sessions and their recordings are evicted by a background janitor in each worker
+janitor = Janitor(
+    session_store,
+    Config.UPLOAD_FOLDER,
+    ttl_seconds=Config.SESSION_TTL_SECONDS,
+    max_sessions=Config.MAX_SESSIONS,
+    max_upload_bytes=int(Config.UPLOAD_QUOTA_MB * 1024 * 1024),
+    interval_seconds=Config.JANITOR_INTERVAL_SECONDS,
+    completed_ttl_seconds=Config.COMPLETED_SESSION_TTL_SECONDS,
+    on_evict=evict_session
+)
+
+
+@app.before_request
+def ensure_janitor():
+    janitor.start()
+
+
 def get_session_data():
-    """Get or create patient session data."""
+    """Get a snapshot of the current patient session, or None."""
     session_id = session.get('session_id')
-    if session_id and session_id in patient_sessions:
-        return patient_sessions[session_id]
+    if session_id:
+        return session_store.get(session_id)
     return None
 
 
@@ -50,34 +206,381 @@ def create_session(test_mode=False):
     session_folder = os.path.join(Config.UPLOAD_FOLDER, session_id)
     os.makedirs(session_folder, exist_ok=True)
 
-    patient_sessions[session_id] = {
-        'session_id': session_id,
-        'created_at': datetime.now().isoformat(),
-        'status': 'in_progress',
-        'test_mode': test_mode,
-        'questions': {
-            q['id']: {
-                'question_id': q['id'],
-                'title': q['title'],
-                'text': q['text'],
-                'video_path': None,  # Temporary - deleted after transcription
-                'audio_path': None,  # Temporary - deleted after transcription
-                'transcription': None,  # Persistent - kept in memory/database
-                'recorded_at': None,
-                'transcribed_at': None
-            }
-            for q in Config.QUESTIONS
-        },
-        'analysis': None
-    }
-    return patient_sessions[session_id]
+    # Each question row holds: video_path/audio_path (temporary, deleted after
+    # transcription), transcription (persistent), timestamps and job status
+    return session_store.create(session_id, datetime.now().isoformat(),
+                                [q['id'] for q in Config.QUESTIONS], test_mode=test_mode)
+
+
+def extract_recording(session_id, question_id, video_path, audio=None):
+    """
+    Decode a recording to audio for Whisper (chunked uploads arrive already decoded).
+
+    Raises:
+        ValueError: If the decoded length is out of range for a recording the upload
+            check could not time
+    """
+    from services.audio_extractor import extract_audio, extract_audio_array
+    from services.ingest import check_decoded_duration
+
+    events.publish(session_id, 'stage', {'question_id': question_id, 'stage': 'extract', 'status': 'started'})
+    if Config.DEBUG_AUDIO_FILES:
+        # Debug mode: write the extracted WAV to disk and keep it for inspection
+        audio = extract_audio(video_path)
+        print(f"[DEBUG] Audio file saved at: {audio}")
+    elif audio is None:
+        # Default: decode straight to 16 kHz float32 in memory, no WAV on disk
+        audio = extract_audio_array(video_path)
+        check_decoded_duration(video_path, audio, Config.MIN_VIDEO_DURATION, Config.MAX_VIDEO_DURATION)
+    events.publish(session_id, 'stage', {'question_id': question_id, 'stage': 'extract', 'status': 'done'})
+    return audio
+
+
+def run_transcription(session_id, question_id, video_path, details=None, audio=None, tier=None):
+    """Transcribe a recording's audio (extracting it first if needed), then delete the video."""
+    from services.transcription import transcribe_audio
+
+    tier = tier or tiers.primary_tier()
+
+    def publish_segment(segment):
+        events.publish(session_id, 'segment', dict(segment, question_id=question_id))
+
+    try:
+        if audio is None:
+            audio = extract_recording(session_id, question_id, video_path, audio)
+
+        # Transcribe audio using faster-whisper, streaming segments to listeners
+        events.publish(session_id, 'stage', {'question_id': question_id, 'stage': 'transcribe', 'status': 'started'})
+        transcription = transcribe_audio(audio, Config.CLAUDE_API_KEY, Config.CLAUDE_MODEL,
+                                         details=details, on_segment=publish_segment,
+                                         whisper_model=tier['model'], beam_size=tier['beam_size'])
+        events.publish(session_id, 'stage', {'question_id': question_id, 'stage': 'transcribe', 'status': 'done'})
+        return transcription
+    finally:
+        remove_recording(video_path)
+
+
+def queue_transcription(session_id, question_id, audio=None):
+    """
+    Start a background extract -> transcribe job for a question's current recording
+    (in this process, or in the job spool for the standalone workers).
+
+    Raises:
+        pipeline.QueueFull: If the transcription queue has no room (the recording is kept
+            and can be queued again later)
+    """
+    session_data = session_store.get(session_id)
+    q_data = session_data['questions'][question_id]
+    answers = 1 if session_data.get('test_mode') else len(Config.QUESTIONS)
+    if job_spool is not None:
+        # Admission counts every web worker's jobs still waiting in the spool
+        pipeline.admit(session_id, question_id, answers,
+                       waiting=job_spool.waiting(exclude=(session_id, question_id)))
+        # Marked queued first: a worker may claim and finish the job at once
+        session_store.update_question(session_id, question_id, expect={'recording_id': q_data['recording_id']},
+                                      job_status='queued', job_error=None)
+        return job_spool.submit(session_id, question_id, q_data['recording_id'], q_data['video_path'], audio,
+                                answers=answers, upload_hash=q_data.get('upload_hash'))
+
+    job = pipeline.admit(session_id, question_id, answers)
+    video_path = q_data['video_path']
+    upload_hash = q_data.get('upload_hash')
+    # Only the job for the latest recording may write to the question
+    current = {'recording_id': q_data['recording_id']}
+    details = {}
+    fingerprints = {}
+    queued_at = time.time()
+
+    session_store.update_question(session_id, question_id, expect=current, job_status='queued', job_error=None)
+
+    def prepare():
+        # Runs in the extraction pool, alongside other questions' ffmpeg decodes
+        session_store.update_question(session_id, question_id, expect=current, job_status='running')
+        try:
+            return extract_recording(session_id, question_id, video_path, audio)
+        except Exception:
+            remove_recording(video_path)
+            raise
+
+    def work(extracted):
+        if not isinstance(extracted, str):
+            # Same audio in a different file (e.g. re-encoded re-upload): skip inference
+            fingerprints['audio_hash'] = transcript_cache.hash_audio(extracted)
+            cached = cached_transcription(session_id, audio_hash=fingerprints['audio_hash'])
+            if cached is not None:
+                print(f"[DEBUG] Question {question_id} audio matches a stored transcription")
+                remove_recording(video_path)
+                details['cached'] = 'audio'
+                return cached
+        # Pick the quality tier as inference starts, from the current load
+        tier = tiers.select(pipeline.queue_depth())
+        details['tier'] = tier['name']
+        return run_transcription(session_id, question_id, video_path, details, extracted, tier)
+
+    def on_complete(transcription):
+        if 'tier' in details:
+            tiers.record(time.time() - queued_at)
+        transcript_cache.get_cache().put(transcription, upload_hash, fingerprints.get('audio_hash'))
+        # Clear file paths from session data since files are deleted
+        if session_store.update_question(session_id, question_id, expect=current,
+                                         transcription=transcription,
+                                         transcribed_at=datetime.now().isoformat(),
+                                         timings=details, video_path=None, audio_path=None,
+                                         audio_hash=fingerprints.get('audio_hash'),
+                                         tier=details.get('tier'),
+                                         job_status='done'):
+            print(f"[DEBUG] Question {question_id} transcription: '{transcription}' (length: {len(transcription)})")
+            events.publish(session_id, 'transcription', {'question_id': question_id, 'transcription': transcription})
+            speculation.on_transcription(session_id)
+
+    def on_error(error):
+        if session_store.update_question(session_id, question_id, expect=current,
+                                         video_path=None, audio_path=None,
+                                         job_status='error', job_error=str(error)):
+            events.publish(session_id, 'stage', {'question_id': question_id, 'stage': 'transcribe',
+                                                 'status': 'error', 'error': str(error)})
+
+    return pipeline.submit(session_id, question_id, work, on_complete=on_complete, on_error=on_error,
+                           prepare=prepare, job=job)
+
+
+def cached_transcription(session_id, upload_hash=None, audio_hash=None):
+    """Transcription of identical content from this session or the process-wide cache, else None."""
+    session_data = session_store.get(session_id)
+    transcription = None
+    if session_data:
+        transcription = transcript_cache.find_in_session(session_data, upload_hash, audio_hash)
+    if transcription is None:
+        transcription = transcript_cache.get_cache().get(upload_hash, audio_hash)
+    return transcription
+
+
+def complete_from_cache(session_id, question_id, transcription, source, **fields):
+    """Mark a question transcribed without running a job."""
+    session_store.update_question(session_id, question_id,
+                                  transcription=transcription,
+                                  transcribed_at=datetime.now().isoformat(),
+                                  timings={'cached': source},
+                                  video_path=None,
+                                  audio_path=None,
+                                  job_status='done',
+                                  job_error=None,
+                                  **fields)
+    events.publish(session_id, 'transcription', {'question_id': question_id, 'transcription': transcription})
+    speculation.on_transcription(session_id)
+    return pipeline.record_result(session_id, question_id, transcription)
+
+
+def restore_transcription(session_id, question_id, q_data):
+    """
+    Recover a question whose job failed or whose video is gone, if the same content
+    was transcribed before. Returns the updated question state, or None.
+    """
+    cached = cached_transcription(session_id, q_data.get('upload_hash'), q_data.get('audio_hash'))
+    if cached is None:
+        return None
+    complete_from_cache(session_id, question_id, cached, 'retry')
+    return session_store.get(session_id)['questions'][question_id]
+
+
+def record_upload(session_id, question_id, video_path, audio=None, media='video', upload_hash=None):
+    """Attach a finished recording (video, or audio-only) to a question and start transcribing it."""
+    from services import chunked_upload
+
+    # Any other streaming upload for this question (e.g. abandoned for a plain upload) is stale now
+    chunked_upload.discard(os.path.join(Config.UPLOAD_FOLDER, session_id), question_id)
+    metrics.observe('intake_upload_bytes', os.path.getsize(video_path), media=media)
+    upload_hash = upload_hash or transcript_cache.hash_file(video_path)
+    q_data = session_store.get(session_id)['questions'][question_id]
+
+    # Re-upload of the question's current recording: keep its transcription or running job
+    if q_data.get('upload_hash') == upload_hash:
+        job = pipeline.get_job(session_id, question_id)
+        if job is None and job_spool is not None:
+            job = job_spool.get(session_id, question_id)
+        if q_data['job_status'] == 'done' or (q_data['job_status'] in PENDING_JOB_STATUSES and job is not None):
+            print(f"[DEBUG] Question {question_id} re-upload is identical, keeping current transcription")
+            remove_recording(video_path)
+            return job or pipeline.record_result(session_id, question_id, q_data['transcription'])
+
+    # Same bytes already transcribed (another question, or another session in this process)
+    cached = cached_transcription(session_id, upload_hash=upload_hash)
+    if cached is not None:
+        print(f"[DEBUG] Question {question_id} upload matches a stored transcription")
+        remove_recording(video_path)
+        return complete_from_cache(session_id, question_id, cached, 'upload',
+                                   recording_id=uuid.uuid4().hex,
+                                   recorded_at=datetime.now().isoformat(),
+                                   upload_hash=upload_hash,
+                                   audio_hash=None)
+
+    # A re-recording replaces any earlier transcription
+    session_store.update_question(session_id, question_id,
+                                  recording_id=uuid.uuid4().hex,
+                                  video_path=video_path,
+                                  recorded_at=datetime.now().isoformat(),
+                                  transcription=None,
+                                  transcribed_at=None,
+                                  job_status=None,
+                                  job_error=None,
+                                  upload_hash=upload_hash,
+                                  audio_hash=None)
+
+    # Start transcribing while the patient records the next answer
+    try:
+        return queue_transcription(session_id, question_id, audio)
+    except pipeline.QueueFull as e:
+        # Keep the recording; /api/transcribe queues it once there is room
+        print(f"[PIPELINE] Queue full, q{question_id} waits at position {e.position}")
+        return e.job
+
+
+def wait_for_transcription(session_id, question_id, timeout=None):
+    """Wait for a question's job (in this or another worker) to finish; returns the question's state."""
+    job = pipeline.get_job(session_id, question_id)
+    if job is not None:
+        pipeline.wait(job, timeout)
+
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        q_data = session_store.get(session_id)['questions'][question_id]
+        if q_data['job_status'] not in PENDING_JOB_STATUSES:
+            return q_data
+        if deadline is not None and time.time() >= deadline:
+            return q_data
+        time.sleep(0.5)
+
+
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+# Recording kinds the browser uploads: full video, or the microphone alone (AUDIO_ONLY_CAPTURE)
+RECORDING_MEDIA = ('video', 'audio')
+
+
+def check_recording(video_path, audio=None):
+    """
+    Check a recording's format and length (MIN/MAX_VIDEO_DURATION) before it is decoded.
+
+    Uses the decoded audio when there is some, else probes the container header;
+    recordings whose length cannot be probed are let through here and checked once
+    decoded (extract_recording).
+
+    Returns:
+        An error message for the patient, or None if the recording is acceptable
+    """
+    from services.ingest import duration_error, probe_recording
+
+    if audio is not None:
+        seconds = audio.shape[0] / 16000
+    else:
+        probe = probe_recording(video_path)
+        if probe['format'] is None:
+            return "Unrecognized recording format. Please record your answer again."
+        seconds = probe['duration']
+    if seconds is None:
+        return None
+    return duration_error(seconds, Config.MIN_VIDEO_DURATION, Config.MAX_VIDEO_DURATION)
+
+
+def recording_extension(mimetype=''):
+    """Container file extension for a MediaRecorder mime type."""
+    return 'ogg' if (mimetype or '').startswith('audio/ogg') else 'webm'
+
+
+def recording_filename(question_id, token, media='video', mimetype=''):
+    """Upload file name for a recording (unique per token so a re-recording never overwrites a file a job is reading)."""
+    return f"q{question_id}_{token}_{media}.{recording_extension(mimetype)}"
+
+
+def _chunk_upload_args(values):
+    """Validate question_id/upload_id from request args or JSON; returns (question_id, upload_id, error)."""
+    try:
+        question_id = int(values.get('question_id', 0))
+    except (TypeError, ValueError):
+        question_id = 0
+    upload_id = str(values.get('upload_id', ''))
+    if question_id not in [1, 2, 3]:
+        return None, None, 'Invalid question_id'
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        return None, None, 'Invalid upload_id'
+    return question_id, upload_id, None
+
+
+def _chunk_format_args(values):
+    """Validate a streaming upload's media/mimetype; returns (media, mimetype, error)."""
+    media = values.get('media') or 'video'
+    mimetype = values.get('mimetype') or ''
+    if media not in RECORDING_MEDIA:
+        return None, None, 'Invalid media'
+    if not isinstance(mimetype, str):
+        return None, None, 'Invalid mimetype'
+    return media, mimetype, None
+
+
+def queue_full_response(error, question_id=None):
+    """429 telling the client its place in line and when to ask again."""
+    response = jsonify({
+        'success': False,
+        'queued': True,
+        'question_id': question_id,
+        'position': error.position,
+        'retry_after': error.retry_after,
+        'error': 'Transcription is busy; your answer is waiting in line'
+    })
+    return response, 429, {'Retry-After': str(error.retry_after)}
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    metrics.inc('intake_errors_total', stage='upload')
+    return jsonify({'error': f"Upload is larger than {Config.MAX_FILE_SIZE // (1024 * 1024)} MB"}), 413
 
 
 # Routes
 @app.route('/health')
 def health_check():
-    """Health check endpoint for Railway."""
-    return jsonify({'status': 'healthy', 'whisper_loaded': whisper_loaded}), 200
+    """
+    Readiness probe for Railway.
+
+    With PRELOAD_MODEL, returns 503 until this worker's model is loaded and warmed,
+    so traffic only reaches workers that can transcribe without a cold start (with
+    TRANSCRIPTION_BACKEND=spool the web workers load no model, and the standalone
+    workers warm theirs before taking jobs). A model that loaded but failed its warm-up
+    inference ('degraded') is not ready either.
+    """
+    model = model_state(PRIMARY_MODEL)
+    if model['state'] in ('error', 'degraded'):
+        ready = False
+    elif Config.PRELOAD_MODEL and job_spool is None:
+        ready = model['state'] == 'ready'
+    else:
+        ready = True
+    health = {
+        'status': 'healthy' if ready else {'error': 'unhealthy', 'degraded': 'degraded'}.get(model['state'], 'starting'),
+        'whisper_loaded': model['state'] in ('loaded', 'warming', 'ready', 'degraded'),
+        'model': model
+    }
+    if Config.WHISPER_BATCHING:
+        from services.transcription import get_batch_stats
+        health['batching'] = get_batch_stats()
+    health['analysis_cache'] = get_cache_stats()
+    health['transcript_cache'] = transcript_cache.get_cache().stats()
+    health['tiers'] = tiers.stats()
+    if job_spool is not None:
+        health['spool'] = job_spool.stats()
+    health['janitor'] = janitor.last_report
+    return jsonify(health), 200 if ready else 503
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage latency histograms, cache and error counters, load gauges."""
+    gauges = {}
+    if Config.SESSION_STORE == 'sqlite':
+        gauges['intake_active_sessions'] = len(session_store.list_sessions())
+    if job_spool is not None:
+        gauges['intake_queued_jobs'] = job_spool.queue_depth()
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
@@ -88,7 +591,9 @@ def index():
     return render_template('index.html',
                            clinic_name=Config.CLINIC_NAME,
                            questions=Config.QUESTIONS,
-                           test_mode=test_mode)
+                           test_mode=test_mode,
+                           audio_only=Config.AUDIO_ONLY_CAPTURE,
+                           max_recording_seconds=Config.MAX_VIDEO_DURATION)
 
 
 @app.route('/api/session/start', methods=['POST'])
@@ -130,45 +635,193 @@ def get_session_state():
     })
 
 
+@app.route('/api/session/events', methods=['GET'])
+def session_events():
+    """
+    Server-Sent Events stream of transcription segments and stage progress.
+
+    Every open stream holds a gthread thread. Once SSE_MAX_STREAMS are open in this
+    worker the answer is 204, which tells EventSource not to reconnect; the page then
+    gets transcriptions from the /api/transcribe long-poll and the analysis from a
+    plain /api/analyze.
+    """
+    session_data = get_session_data()
+    if not session_data:
+        return jsonify({'error': 'No active session'}), 404
+
+    if not events.acquire_stream():
+        metrics.inc('intake_event_streams_refused_total')
+        return Response(status=204)
+    last_id = request.headers.get('Last-Event-ID', type=int) or 0
+    stream = events.stream(session_data['session_id'], last_id,
+                           max_seconds=Config.SSE_MAX_SECONDS, end_event='analysis')
+    response = Response(stream_with_context(stream), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(events.release_stream)
+    return response
+
+
 @app.route('/api/video/upload', methods=['POST'])
 def upload_video():
-    """Handle video upload for a question."""
+    """Handle a recording upload for a question (a 'video' file, or an 'audio' file in audio-only mode)."""
+    from services import ingest
+
     session_data = get_session_data()
     if not session_data:
         return jsonify({'error': 'No active session'}), 404
 
-    if 'video' not in request.files:
-        return jsonify({'error': 'No video file provided'}), 400
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({'error': 'Expected a multipart/form-data upload'}), 400
 
-    video_file = request.files['video']
-    question_id = request.form.get('question_id', type=int)
+    # Stream the body straight to disk: the size limit applies as bytes arrive,
+    # instead of after Werkzeug has spooled the whole request to a temp file
+    session_folder = os.path.join(Config.UPLOAD_FOLDER, session_data['session_id'])
+    try:
+        fields, files = ingest.receive_multipart(request.stream, boundary, session_folder,
+                                                 Config.MAX_FILE_SIZE, RECORDING_MEDIA)
+    except ingest.UploadTooLarge as e:
+        metrics.inc('intake_errors_total', stage='upload')
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    media = next((m for m in RECORDING_MEDIA if m in files), None)
+    try:
+        question_id = int(fields.get('question_id', 0))
+    except ValueError:
+        question_id = 0
+
+    error = None
+    if media is None:
+        error = 'No video file provided'
+    elif question_id not in [1, 2, 3]:
+        error = 'Invalid question_id'
+    elif not files[media]['filename'] or not files[media]['size']:
+        error = 'No file selected'
+    else:
+        # Container probe: reject unrecognised or out-of-range clips before any decode
+        error = check_recording(files[media]['path'])
+    if error:
+        for upload in files.values():
+            ingest.discard_file(upload['path'])
+        metrics.inc('intake_errors_total', stage='upload')
+        return jsonify({'error': error}), 400
+
+    upload = files.pop(media)
+    for other in files.values():
+        ingest.discard_file(other['path'])
+
+    # Unique name so a re-recording never overwrites a file a job is reading
+    filename = recording_filename(question_id, uuid.uuid4().hex[:8], media, upload['mimetype'])
+    video_path = os.path.join(session_folder, filename)
+    os.replace(upload['path'], video_path)
 
-    if not question_id or question_id not in [1, 2, 3]:
-        return jsonify({'error': 'Invalid question_id'}), 400
+    job = record_upload(session_data['session_id'], question_id, video_path, media=media,
+                        upload_hash=upload['sha256'])
+
+    return jsonify({
+        'success': True,
+        'question_id': question_id,
+        'message': 'Video uploaded successfully',
+        'job': pipeline.job_status(job)
+    })
 
-    if video_file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
 
-    # Save video file
+@app.route('/api/video/chunk', methods=['GET', 'POST'])
+def upload_video_chunk():
+    """Append one MediaRecorder chunk to a streaming upload (GET returns resume progress)."""
+    from services import chunked_upload
+
+    session_data = get_session_data()
+    if not session_data:
+        return jsonify({'error': 'No active session'}), 404
+
+    question_id, upload_id, error = _chunk_upload_args(request.args)
+    if not error:
+        media, mimetype, error = _chunk_format_args(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    part = {'media': media, 'extension': recording_extension(mimetype)}
+
     session_folder = os.path.join(Config.UPLOAD_FOLDER, session_data['session_id'])
-    filename = f"q{question_id}_video.webm"
-    video_path = os.path.join(session_folder, filename)
-    video_file.save(video_path)
 
-    # Update session data
-    session_data['questions'][question_id]['video_path'] = video_path
-    session_data['questions'][question_id]['recorded_at'] = datetime.now().isoformat()
+    if request.method == 'GET':
+        progress = chunked_upload.get_progress(session_folder, question_id, upload_id, **part)
+        return jsonify({'success': True, 'question_id': question_id, **progress})
+
+    seq = request.args.get('seq', type=int)
+    if seq is None or seq < 0:
+        return jsonify({'error': 'Invalid seq'}), 400
+
+    if seq == 0:
+        # A new recording attempt makes any earlier partial upload for this question stale
+        chunked_upload.discard(session_folder, question_id, keep_upload_id=upload_id)
+
+    try:
+        progress = chunked_upload.append_chunk(session_folder, question_id, upload_id, seq, request.get_data(),
+                                               decode=stream_decode, max_bytes=Config.MAX_FILE_SIZE, **part)
+    except UploadTooLarge as e:
+        metrics.inc('intake_errors_total', stage='upload')
+        chunked_upload.discard(session_folder, question_id)
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        metrics.inc('intake_errors_total', stage='upload')
+        progress = chunked_upload.get_progress(session_folder, question_id, upload_id, **part)
+        return jsonify({'error': str(e), **progress}), 409
+
+    return jsonify({'success': True, 'question_id': question_id, **progress})
+
+
+@app.route('/api/video/chunk/complete', methods=['POST'])
+def complete_video_chunks():
+    """Finish a streaming upload and start transcribing the already-decoded audio."""
+    from services import chunked_upload
+
+    session_data = get_session_data()
+    if not session_data:
+        return jsonify({'error': 'No active session'}), 404
+
+    data = request.get_json(silent=True) or {}
+    question_id, upload_id, error = _chunk_upload_args(data)
+    if error:
+        return jsonify({'error': error}), 400
+    total_chunks = data.get('total_chunks')
+    if not isinstance(total_chunks, int) or total_chunks < 1:
+        return jsonify({'error': 'Invalid total_chunks'}), 400
+    media, mimetype, error = _chunk_format_args(data)
+    if error:
+        return jsonify({'error': error}), 400
+    part = {'media': media, 'extension': recording_extension(mimetype)}
+
+    session_folder = os.path.join(Config.UPLOAD_FOLDER, session_data['session_id'])
+    video_path = os.path.join(session_folder, recording_filename(question_id, upload_id, media, mimetype))
+    try:
+        audio = chunked_upload.complete(session_folder, question_id, upload_id, total_chunks, video_path, **part)
+    except (ValueError, FileNotFoundError) as e:
+        metrics.inc('intake_errors_total', stage='upload')
+        progress = chunked_upload.get_progress(session_folder, question_id, upload_id, **part)
+        return jsonify({'error': str(e), **progress}), 409
+
+    error = check_recording(video_path, audio)
+    if error:
+        metrics.inc('intake_errors_total', stage='upload')
+        remove_recording(video_path)
+        return jsonify({'error': error}), 400
+
+    job = record_upload(session_data['session_id'], question_id, video_path, audio, media)
 
     return jsonify({
         'success': True,
         'question_id': question_id,
-        'message': 'Video uploaded successfully'
+        'message': 'Video uploaded successfully',
+        'job': pipeline.job_status(job)
     })
 
 
 @app.route('/api/transcribe/<int:question_id>', methods=['POST'])
 def transcribe_video(question_id):
-    """Transcribe the video for a specific question."""
+    """Return the transcription for a question, waiting briefly for its background job."""
     session_data = get_session_data()
     if not session_data:
         return jsonify({'error': 'No active session'}), 404
@@ -176,63 +829,43 @@ def transcribe_video(question_id):
     if question_id not in [1, 2, 3]:
         return jsonify({'error': 'Invalid question_id'}), 400
 
+    session_id = session_data['session_id']
     q_data = session_data['questions'][question_id]
-    if not q_data['video_path']:
-        return jsonify({'error': 'No video recorded for this question'}), 400
 
-    video_path = q_data['video_path']
-    audio_path = None
+    if q_data['transcription'] is None and q_data['job_status'] in (None, 'error'):
+        # Idempotent retry: serve identical content's stored transcription instead of failing
+        q_data = restore_transcription(session_id, question_id, q_data) or q_data
 
-    try:
-        # Import services
-        from services.audio_extractor import extract_audio
-        from services.transcription import transcribe_audio
-
-        # Extract audio from video
-        audio_path = extract_audio(video_path)
-
-        # Transcribe audio using Claude API
-        transcription = transcribe_audio(audio_path, Config.CLAUDE_API_KEY, Config.CLAUDE_MODEL)
-        q_data['transcription'] = transcription
-        q_data['transcribed_at'] = datetime.now().isoformat()
-        
-        print(f"[DEBUG] Question {question_id} transcription: '{transcription}' (length: {len(transcription)})")
-
-        # TESTING: Keep audio files for now to debug
-        # Clean up: delete video file but KEEP audio for testing
+    if q_data['transcription'] is None and q_data['job_status'] is None:
+        if not q_data['video_path']:
+            return jsonify({'error': 'No video recorded for this question'}), 400
         try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-            # if audio_path and os.path.exists(audio_path):
-            #     os.remove(audio_path)
-            print(f"[DEBUG] Audio file saved at: {audio_path}")
-        except Exception as cleanup_error:
-            # Log but don't fail if cleanup fails
-            print(f"Warning: Could not delete files: {cleanup_error}")
+            queue_transcription(session_id, question_id)
+        except pipeline.QueueFull as e:
+            return queue_full_response(e, question_id)
 
-        # Clear file paths from session data since files are deleted
-        q_data['video_path'] = None
-        q_data['audio_path'] = None
+    # Long-poll: hold the request until the job finishes or the wait expires
+    q_data = wait_for_transcription(session_id, question_id, Config.TRANSCRIBE_WAIT_SECONDS)
 
-        response_data = {
-            'success': True,
+    if q_data['job_status'] in PENDING_JOB_STATUSES:
+        return jsonify({
+            'success': False,
+            'pending': True,
             'question_id': question_id,
-            'transcription': transcription
-        }
-        print(f"[DEBUG] Returning transcription response: {response_data}")
-        return jsonify(response_data)
+            'job': {'status': q_data['job_status']}
+        }), 202
 
-    except Exception as e:
-        # If transcription fails, still try to clean up video but keep audio for debugging
-        try:
-            if video_path and os.path.exists(video_path):
-                os.remove(video_path)
-            # Keep audio file for debugging
-            # if audio_path and os.path.exists(audio_path):
-            #     os.remove(audio_path)
-        except:
-            pass
-        return jsonify({'error': str(e)}), 500
+    if q_data['job_status'] == 'error':
+        return jsonify({'error': q_data['job_error']}), 500
+
+    response_data = {
+        'success': True,
+        'question_id': question_id,
+        'transcription': q_data['transcription'],
+        'timings': q_data.get('timings')
+    }
+    print(f"[DEBUG] Returning transcription response: {response_data}")
+    return jsonify(response_data)
 
 
 @app.route('/api/transcribe/all', methods=['POST'])
@@ -242,58 +875,31 @@ def transcribe_all():
     if not session_data:
         return jsonify({'error': 'No active session'}), 404
 
+    session_id = session_data['session_id']
     results = {}
     errors = []
+    waiting = []
 
     for question_id in [1, 2, 3]:
         q_data = session_data['questions'][question_id]
-        if not q_data['video_path']:
-            errors.append(f"No video for question {question_id}")
-            continue
-
-        video_path = q_data['video_path']
-        audio_path = None
-
-        try:
-            from services.audio_extractor import extract_audio
-            from services.transcription import transcribe_audio
-
-            # Extract audio
-            audio_path = extract_audio(video_path)
-
-            # Transcribe
-            transcription = transcribe_audio(audio_path, Config.CLAUDE_API_KEY, Config.CLAUDE_MODEL)
-            q_data['transcription'] = transcription
-            q_data['transcribed_at'] = datetime.now().isoformat()
-
-            results[question_id] = transcription
-
-            # TESTING: Keep audio files for now to debug
-            # Clean up: delete video file but KEEP audio for testing
-            try:
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-                # if audio_path and os.path.exists(audio_path):
-                #     os.remove(audio_path)
-                print(f"[DEBUG] Audio file saved at: {audio_path}")
-            except Exception as cleanup_error:
-                print(f"Warning: Could not delete files for question {question_id}: {cleanup_error}")
-
-            # Clear file paths from session data since files are deleted
-            q_data['video_path'] = None
-            q_data['audio_path'] = None
-
-        except Exception as e:
-            errors.append(f"Question {question_id}: {str(e)}")
-            # Try to clean up video but keep audio for debugging
+        if q_data['transcription'] is None and q_data['job_status'] in (None, 'error'):
+            q_data = restore_transcription(session_id, question_id, q_data) or q_data
+        if q_data['transcription'] is None and q_data['job_status'] is None:
+            if not q_data['video_path']:
+                errors.append(f"No video for question {question_id}")
+                continue
             try:
-                if video_path and os.path.exists(video_path):
-                    os.remove(video_path)
-                # Keep audio for debugging
-                # if audio_path and os.path.exists(audio_path):
-                #     os.remove(audio_path)
-            except:
-                pass
+                queue_transcription(session_id, question_id)
+            except pipeline.QueueFull as e:
+                return queue_full_response(e, question_id)
+        waiting.append(question_id)
+
+    for question_id in waiting:
+        q_data = wait_for_transcription(session_id, question_id)
+        if q_data['job_status'] == 'error':
+            errors.append(f"Question {question_id}: {q_data['job_error']}")
+        else:
+            results[question_id] = q_data['transcription']
 
     return jsonify({
         'success': len(errors) == 0,
@@ -302,9 +908,71 @@ def transcribe_all():
     })
 
 
+def log_analysis_usage(usage):
+    """Print the token counts of the Claude request behind an analysis (see analyze_symptoms' details)."""
+    if not usage:
+        print("[DEBUG] Analysis tokens: none (served from the analysis cache)")
+        return
+    print(f"[DEBUG] Analysis tokens: {usage['prompt_tokens']} prompt ({usage['cache_read_tokens']} read from cache, "
+          f"{usage['cache_write_tokens']} written to cache), {usage['output_tokens']} output")
+
+
+def save_analysis(session_id, analysis, analysis_key=None, categories=None):
+    """
+    Store a finished analysis, clean up the session's files and notify listeners.
+
+    analysis_key is the content hash of the analysis inputs (see analysis_cache_key),
+    and categories the taxonomy entries sent to Claude (a shortlist under
+    ANALYSIS_SHORTLIST); their IDs are kept so services.reanalyze can skip sessions
+    whose inputs have not changed.
+    """
+    print(f"[DEBUG] Analysis result: {analysis}")
+    print(f"[DEBUG] Has matched_categories: {'matched_categories' in analysis}")
+
+    session_store.update(session_id, analysis=analysis, analysis_key=analysis_key,
+                         analysis_categories=[cat['id'] for cat in categories] if categories is not None else None,
+                         status='completed')
+
+    # Clean up any remaining files in the session folder
+    cleanup_session_files(session_id)
+    pipeline.discard(session_id)
+    events.publish(session_id, 'stage', {'stage': 'analyze', 'status': 'done'})
+    events.publish(session_id, 'analysis', {'analysis': analysis})
+
+
+def report_analysis_error(session_id, error, transcriptions=None):
+    """Log a failed analysis; with ANALYSIS_FALLBACK, store the local keyword analysis instead and return it."""
+    import traceback
+    metrics.inc('intake_errors_total', stage='analyze')
+    print(f"[ERROR] Analysis failed: {str(error)}")
+    print(f"[ERROR] Traceback: {''.join(traceback.format_exception(error))}")
+    if Config.ANALYSIS_FALLBACK and transcriptions is not None:
+        print("[ERROR] Using the local keyword analysis instead")
+        metrics.inc('intake_analysis_fallbacks_total')
+        analysis = symptom_matcher.get_matcher().provisional_analysis(transcriptions, reason=str(error))
+        save_analysis(session_id, analysis)
+        return analysis
+    events.publish(session_id, 'stage', {'stage': 'analyze', 'status': 'error', 'error': str(error)})
+    return None
+
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_symptoms():
-    """Analyze all transcriptions for symptom clustering."""
+    """
+    Analyze all transcriptions for symptom clustering.
+
+    With ?background the analysis runs on the worker's event loop instead of this
+    request thread: the response is 202, each matched category is published as an
+    'analysis_category' event while Claude is still generating, and the result
+    arrives as the 'analysis' event on /api/session/events (and in /api/summary).
+
+    A provisional analysis from the local keyword matcher is published first as
+    'analysis_provisional'; if Claude fails it becomes the stored analysis
+    (flagged 'provisional' and 'degraded') unless ANALYSIS_FALLBACK is off.
+
+    With SPECULATIVE_ANALYSIS, a speculative run over exactly these answers is used
+    instead of a new request (waiting for it if it is still in flight).
+    """
     session_data = get_session_data()
     if not session_data:
         return jsonify({'error': 'No active session'}), 404
@@ -320,30 +988,74 @@ def analyze_symptoms():
         if t is None:
             return jsonify({'error': f'Question {question_id} not yet transcribed'}), 400
         # Allow empty transcriptions (e.g., silent recordings) - use placeholder
-        transcriptions[question_id] = t if t else "[No speech detected in recording]"
+        transcriptions[question_id] = t if t else NO_SPEECH_PLACEHOLDER
 
-    try:
-        from services.symptom_analyzer import analyze_symptoms
+    session_id = session_data['session_id']
+    events.publish(session_id, 'stage', {'stage': 'analyze', 'status': 'started'})
 
-        print(f"[DEBUG] Analyzing transcriptions: {transcriptions}")
-        print(f"[DEBUG] API Key present: {bool(Config.CLAUDE_API_KEY)}")
-        print(f"[DEBUG] Number of symptom categories: {len(Config.SYMPTOM_CATEGORIES)}")
-        print(f"[DEBUG] First category: {Config.SYMPTOM_CATEGORIES[0] if Config.SYMPTOM_CATEGORIES else 'NONE'}")
+    matcher = symptom_matcher.get_matcher()
+    events.publish(session_id, 'analysis_provisional', {'analysis': matcher.provisional_analysis(transcriptions)})
+    categories = matcher.shortlist(transcriptions) if Config.ANALYSIS_SHORTLIST else Config.SYMPTOM_CATEGORIES
 
-        analysis = analyze_symptoms(
-            transcriptions,
-            Config.CLAUDE_API_KEY,
-            Config.CLAUDE_MODEL,
-            Config.SYMPTOM_CATEGORIES
-        )
-        print(f"[DEBUG] Analysis result: {analysis}")
-        print(f"[DEBUG] Has matched_categories: {'matched_categories' in analysis}")
+    try:
+        from services.symptom_analyzer import analysis_cache_key, analyze_symptoms, submit_analysis
 
-        session_data['analysis'] = analysis
-        session_data['status'] = 'completed'
+        analysis_key = analysis_cache_key(transcriptions, Config.CLAUDE_MODEL, categories)
 
-        # Clean up any remaining files in the session folder
-        cleanup_session_files(session_data['session_id'])
+        usage = {}
+        print(f"[DEBUG] Analyzing transcriptions: {transcriptions}")
+        print(f"[DEBUG] API Key present: {bool(Config.CLAUDE_API_KEY)}")
+        print(f"[DEBUG] Symptom categories sent: {len(categories)} of {len(Config.SYMPTOM_CATEGORIES)}"
+              f"{' (shortlist)' if Config.ANALYSIS_SHORTLIST else ''}")
+
+        if request.args.get('background') is not None:
+            def publish_category(category):
+                events.publish(session_id, 'analysis_category', {'category': category})
+
+            def on_done(f):
+                try:
+                    log_analysis_usage(usage)
+                    save_analysis(session_id, f.result(), analysis_key, categories)
+                except Exception as e:
+                    report_analysis_error(session_id, e, transcriptions)
+
+            def start_analysis():
+                future = submit_analysis(
+                    transcriptions,
+                    Config.CLAUDE_API_KEY,
+                    Config.CLAUDE_MODEL,
+                    categories,
+                    on_category=publish_category,
+                    details=usage
+                )
+                future.add_done_callback(on_done)
+
+            if speculation.enabled():
+                def finish_speculation():
+                    analysis = speculation.result(session_id, analysis_key, Config.CLAUDE_TIMEOUT)
+                    if analysis is None:
+                        start_analysis()
+                        return
+                    for category in analysis.get('matched_categories', []):
+                        publish_category(category)
+                    save_analysis(session_id, analysis, analysis_key, categories)
+
+                threading.Thread(target=finish_speculation, name="speculation-wait", daemon=True).start()
+            else:
+                start_analysis()
+            return jsonify({'success': True, 'pending': True}), 202
+
+        analysis = speculation.result(session_id, analysis_key, Config.CLAUDE_TIMEOUT)
+        if analysis is None:
+            analysis = analyze_symptoms(
+                transcriptions,
+                Config.CLAUDE_API_KEY,
+                Config.CLAUDE_MODEL,
+                categories,
+                details=usage
+            )
+            log_analysis_usage(usage)
+        save_analysis(session_id, analysis, analysis_key, categories)
 
         return jsonify({
             'success': True,
@@ -351,9 +1063,9 @@ def analyze_symptoms():
         })
 
     except Exception as e:
-        import traceback
-        print(f"[ERROR] Analysis failed: {str(e)}")
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        analysis = report_analysis_error(session_id, e, transcriptions)
+        if analysis is not None:
+            return jsonify({'success': True, 'analysis': analysis, 'degraded': True})
         return jsonify({'error': str(e)}), 500
 
 
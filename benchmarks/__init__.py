@@ -0,0 +1,4 @@
+"""
+Stage-level benchmarks for the intake pipeline (extraction, transcription, analysis).
+Run with `python -m benchmarks.run --help`.
+"""
@@ -0,0 +1,71 @@
+"""
+Deterministic WebM fixtures for benchmarking.
+Generated locally with the bundled imageio_ffmpeg binary: a small black VP8
+video track plus a mono Opus track that is silence, a steady tone, or
+speech-like noise (seeded pink noise gated into syllable-rate bursts).
+"""
+
+import os
+import subprocess
+
+import imageio_ffmpeg
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+KINDS = {
+    'silence': "anullsrc=channel_layout=mono:sample_rate=48000",
+    'tone': "sine=frequency=440:sample_rate=48000",
+    # ~4 bursts per second under a slow phrase envelope, with short gaps like pauses between words
+    'speech': ("anoisesrc=color=pink:seed=42:sample_rate=48000:amplitude=0.4,"
+               "volume='gt(sin(2*PI*4*t),-0.3)*(0.3+0.7*abs(sin(2*PI*0.25*t)))':eval=frame")
+}
+DURATIONS = (5, 60, 180)
+
+
+def fixture_path(kind: str, seconds: int) -> str:
+    return os.path.join(FIXTURE_DIR, f"{kind}_{seconds}s.webm")
+
+
+def generate(kind: str, seconds: int, force: bool = False) -> str:
+    """
+    Create one fixture (skipped if it already exists).
+
+    Args:
+        kind: One of KINDS
+        seconds: Duration
+        force: Regenerate even if the file exists
+
+    Returns:
+        Path to the WebM file
+    """
+    path = fixture_path(kind, seconds)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+
+    # Single-threaded encoders and bitexact flags keep the output byte-for-byte reproducible
+    subprocess.run([
+        imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-nostdin', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"color=c=black:s=160x120:r=15",
+        '-f', 'lavfi', '-i', KINDS[kind],
+        '-t', str(seconds), '-map', '0:v', '-map', '1:a',
+        '-c:v', 'libvpx', '-b:v', '50k', '-deadline', 'realtime', '-threads', '1',
+        '-c:a', 'libopus', '-b:a', '32k', '-ac', '1',
+        '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact',
+        path
+    ], check=True, capture_output=True)
+    return path
+
+
+def generate_all(kinds=None, durations=None, force: bool = False) -> dict:
+    """Create every requested fixture; returns {(kind, seconds): path}."""
+    return {
+        (kind, seconds): generate(kind, seconds, force)
+        for kind in (kinds or KINDS)
+        for seconds in (durations or DURATIONS)
+    }
+
+
+if __name__ == '__main__':
+    for (kind, seconds), path in generate_all(force=True).items():
+        print(f"{kind:8s} {seconds:4d}s  {os.path.getsize(path):9d} bytes  {path}")
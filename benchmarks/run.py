@@ -0,0 +1,289 @@
+"""
+Stage benchmarks for extraction, transcription and analysis.
+
+    python -m benchmarks.run                                  # everything, base/int8
+    python -m benchmarks.run --stages transcribe --models tiny,base --compute-types int8,float32
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+
+Every measurement runs in a freshly spawned interpreter so peak RSS belongs to
+that stage alone. Results are written as JSON; with --baseline, stages that got
+slower than the tolerance are reported and the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import fixtures
+from benchmarks.stub_claude import StubClaudeServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+STAGES = ('extract', 'transcribe', 'analyze')
+
+# Differences smaller than this are timer noise, never regressions
+MIN_REGRESSION_SECONDS = 0.01
+
+# Deterministic filler for synthetic patient answers (about 2.5 words per second of recording)
+WORDS = ("I have been so tired since covid my brain feels foggy and I lose words "
+         "walking up stairs makes my heart race then I crash for two days and "
+         "I can't sleep properly or focus at work anymore").split()
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _timed(fn, repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return times, result
+
+
+def _row(stage, fixture=None, model=None, compute_type=None, times=None, **extra) -> dict:
+    row = {'stage': stage, 'fixture': fixture, 'model': model, 'compute_type': compute_type}
+    if times:
+        row.update(seconds=round(statistics.median(times), 4), seconds_min=round(min(times), 4), runs=len(times))
+    row.update(extra)
+    return row
+
+
+def _quiet(verbose: bool):
+    # The services print debug lines per call; keep the benchmark output readable
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _answers(seconds: int) -> dict:
+    count = int(seconds * 2.5)
+    text = " ".join(WORDS[i % len(WORDS)] for i in range(count))
+    return {1: text, 2: text, 3: text}
+
+
+# Stage entry points: each runs in its own spawned process
+
+def bench_extract(paths: dict, repeat: int, verbose: bool) -> list:
+    from services.audio_extractor import extract_audio, extract_audio_array
+
+    rows = []
+    with _quiet(verbose):
+        for fixture, path in paths.items():
+            times, audio = _timed(lambda: extract_audio_array(path), repeat)
+            rows.append(_row('extract', fixture, times=times, audio_seconds=round(audio.shape[0] / 16000, 2),
+                             peak_rss_mb=_peak_rss_mb(), ffmpeg_peak_rss_mb=_peak_rss_mb(resource.RUSAGE_CHILDREN)))
+
+            def extract_wav():
+                wav_path = extract_audio(path)
+                os.remove(wav_path)
+
+            times, _ = _timed(extract_wav, repeat)
+            rows.append(_row('extract_wav', fixture, times=times,
+                             peak_rss_mb=_peak_rss_mb(), ffmpeg_peak_rss_mb=_peak_rss_mb(resource.RUSAGE_CHILDREN)))
+    return rows
+
+
+def bench_transcribe(model: str, compute_type: str, beam_size: int, paths: dict, repeat: int,
+                     verbose: bool) -> list:
+    from services import transcription
+    from services.audio_extractor import extract_audio_array
+
+    rows = []
+    with _quiet(verbose):
+        transcription.configure_model(compute_type=compute_type)
+        baseline_rss = _peak_rss_mb()
+        started = time.perf_counter()
+        transcription.get_model(model)
+        rows.append(_row('model_load', None, model, compute_type, times=[time.perf_counter() - started],
+                         peak_rss_mb=_peak_rss_mb(), model_rss_mb=round(_peak_rss_mb() - baseline_rss, 1)))
+
+        for fixture, path in paths.items():
+            audio = extract_audio_array(path)
+            details = {}
+            times, text = _timed(lambda: transcription.transcribe_audio(
+                audio, details=details, whisper_model=model, beam_size=beam_size), repeat)
+            prepass = details.get('prepass') or {}
+            rows.append(_row('transcribe', fixture, model, compute_type, times=times, beam_size=beam_size,
+                             audio_seconds=round(audio.shape[0] / 16000, 2),
+                             skipped_seconds=prepass.get('skipped_seconds'),
+                             words=len(text.split()), peak_rss_mb=_peak_rss_mb()))
+    return rows
+
+
+def bench_analyze(base_url: str, durations: list, repeat: int, verbose: bool) -> list:
+    from config import Config
+    from services import symptom_analyzer as analyzer
+
+    analyzer.configure_client(base_url=base_url, max_retries=0)
+    rows = []
+    with _quiet(verbose):
+        for seconds in durations:
+            answers = _answers(seconds)
+            static = analyzer.build_system_prompt(Config.SYMPTOM_CATEGORIES)
+            prompt = analyzer.build_analysis_prompt(answers)
+            tokens = {}
+            call = lambda: analyzer.analyze_symptoms(answers, 'stub-key', Config.CLAUDE_MODEL,
+                                                     Config.SYMPTOM_CATEGORIES, details=tokens)
+            # The first call includes connecting (and writes the prompt cache); later calls
+            # reuse the pooled connection and read the cached prefix
+            first, _ = _timed(call, 1)
+            first_tokens = dict(tokens)
+            times, _ = _timed(call, repeat)
+            rows.append(_row('analyze', f"answers_{seconds}s", Config.CLAUDE_MODEL, times=times,
+                             first_call_seconds=round(first[0], 4), static_chars=len(static),
+                             prompt_chars=len(prompt), prompt_bytes=len(prompt.encode('utf-8')),
+                             prompt_tokens=tokens.get('prompt_tokens'),
+                             uncached_tokens=tokens.get('prompt_tokens', 0) - tokens.get('cache_read_tokens', 0),
+                             cache_write_tokens=first_tokens.get('cache_write_tokens'),
+                             cache_read_tokens=tokens.get('cache_read_tokens'),
+                             output_tokens=tokens.get('output_tokens'), peak_rss_mb=_peak_rss_mb()))
+    return rows
+
+
+def _isolated(fn, *args):
+    """Run fn(*args) in a fresh interpreter and return its result."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _key(row: dict) -> tuple:
+    return row['stage'], row.get('fixture'), row.get('model'), row.get('compute_type')
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Annotate rows with their change against the baseline; returns the rows that regressed."""
+    previous = {_key(row): row for row in baseline.get('results', []) if 'seconds' in row}
+    regressions = []
+    for row in results['results']:
+        before = previous.get(_key(row))
+        if before is None or 'seconds' not in row:
+            continue
+        row['baseline_seconds'] = before['seconds']
+        row['change'] = round((row['seconds'] - before['seconds']) / before['seconds'], 3) if before['seconds'] else 0.0
+        if row['change'] > tolerance and row['seconds'] - before['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append(row)
+    return regressions
+
+
+def _metadata(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': vars(args)
+    }
+
+
+def _print_table(rows: list):
+    print(f"{'stage':12s} {'fixture':14s} {'model':26s} {'seconds':>9s} {'rss MB':>8s} {'change':>8s}")
+    for row in rows:
+        model = "/".join(filter(None, [row.get('model'), row.get('compute_type')])) or '-'
+        seconds = f"{row['seconds']:.3f}" if 'seconds' in row else 'error'
+        change = f"{row['change']:+.0%}" if 'change' in row else ''
+        print(f"{row['stage']:12s} {row.get('fixture') or '-':14s} {model:26s} {seconds:>9s} "
+              f"{row.get('peak_rss_mb', ''):>8} {change:>8s}")
+        if 'error' in row:
+            print(f"    error: {row['error']}")
+
+
+def _csv(value: str) -> list:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark extraction, transcription and analysis stages")
+    parser.add_argument('--stages', type=_csv, default=list(STAGES), help="comma-separated: " + ",".join(STAGES))
+    parser.add_argument('--kinds', type=_csv, default=list(fixtures.KINDS), help="fixture kinds")
+    parser.add_argument('--durations', type=lambda v: [int(d) for d in _csv(v)], default=list(fixtures.DURATIONS),
+                        help="fixture lengths in seconds")
+    parser.add_argument('--models', type=_csv, default=['base'], help="Whisper model sizes")
+    parser.add_argument('--compute-types', type=_csv, default=['int8'], help="CTranslate2 compute types")
+    parser.add_argument('--beam-size', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per measurement (median reported)")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds the stub Claude API waits")
+    parser.add_argument('--output', help="results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument('--verbose', action='store_true', help="show the services' debug output")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    paths = {f"{kind}_{seconds}s": path
+             for (kind, seconds), path in fixtures.generate_all(args.kinds, args.durations).items()}
+    rows = []
+
+    if 'extract' in args.stages:
+        print("Benchmarking extraction...")
+        rows += _isolated(bench_extract, paths, args.repeat, args.verbose)
+
+    if 'transcribe' in args.stages:
+        for model in args.models:
+            for compute_type in args.compute_types:
+                print(f"Benchmarking transcription with {model}/{compute_type}...")
+                try:
+                    rows += _isolated(bench_transcribe, model, compute_type, args.beam_size, paths,
+                                      args.repeat, args.verbose)
+                except Exception as e:
+                    rows.append(_row('transcribe', None, model, compute_type, error=str(e)))
+
+    if 'analyze' in args.stages:
+        print("Benchmarking analysis against the stub Claude API...")
+        stub = StubClaudeServer(latency=args.stub_latency)
+        try:
+            rows += _isolated(bench_analyze, stub.start(), args.durations, args.repeat, args.verbose)
+            for row in rows:
+                if row['stage'] == 'analyze':
+                    row['stub_latency'] = args.stub_latency
+            print(f"Stub served {len(stub.requests)} requests over {stub.connections} connection(s)")
+        finally:
+            stub.stop()
+
+    results = {'meta': _metadata(args), 'results': rows}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = [_key(row) for row in regressions]
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print()
+    _print_table(rows)
+    print(f"\nResults written to {output}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}:")
+        for row in regressions:
+            print(f"  {' / '.join(str(part) for part in _key(row) if part)}: "
+                  f"{row['baseline_seconds']:.3f}s -> {row['seconds']:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Local stand-in for the Anthropic Messages API.
+Answers POST /v1/messages with a fixed, well-formed analysis after an optional
+delay and records the size of every request, so analysis latency and prompt size
+can be measured offline. The analysis comes back as a tool call when the request
+offers tools, streamed as server-sent events when it asks to stream. Usage is
+estimated at four characters per token, and a prefix ending in a cache_control
+breakpoint is reported as written to the prompt cache the first time and read
+from it afterwards, as the real API does. The first requests can be made to fail
+with given HTTP statuses to exercise retries. Point the app at it with CLAUDE_BASE_URL.
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANALYSIS = {
+    "matched_categories": [
+        {
+            "category_id": "brain_fog",
+            "category_name": "Brain Fog & Mental Fatigue",
+            "confidence": "high",
+            "patient_symptoms": ["trouble concentrating"],
+            "severity_indicators": ["I can't focus at work"]
+        }
+    ],
+    "priority_concerns": ["brain fog"],
+    "clinical_notes": "Stub analysis for benchmarking."
+}
+
+
+class StubClaudeServer:
+    """Threaded HTTP server that mimics /v1/messages."""
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0, errors: list = None):
+        """
+        Args:
+            latency: Seconds to wait before answering each request
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            errors: HTTP statuses (e.g. 529, 500) to answer the first requests with, in order
+        """
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.requests = []
+        self.connections = 0
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    request = {}
+                prompt_chars = sum(
+                    len(block.get('text', '')) if isinstance(block, dict) else len(block)
+                    for message in request.get('messages', [])
+                    for block in (message['content'] if isinstance(message['content'], list) else [message['content']])
+                )
+                # Cache order: tools, then system blocks up to the last breakpoint
+                system = request.get('system') or []
+                if isinstance(system, str):
+                    system = [{'type': 'text', 'text': system}]
+                static = [json.dumps(request.get('tools') or [], sort_keys=True)] + [block['text'] for block in system]
+                breakpoint_at = max((i + 1 for i, block in enumerate(system) if block.get('cache_control')), default=0)
+                prefix = ''.join(static[:breakpoint_at + 1]) if breakpoint_at else ''
+                static_chars = sum(len(part) for part in static)
+                usage = {"input_tokens": (static_chars - len(prefix) + prompt_chars) // 4, "output_tokens": 120,
+                         "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+                with stub._lock:
+                    if prefix:
+                        digest = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+                        cached = digest in stub._cached_prefixes
+                        stub._cached_prefixes.add(digest)
+                        usage['cache_read_input_tokens' if cached else 'cache_creation_input_tokens'] = len(prefix) // 4
+                    stub.requests.append({'body_bytes': len(body), 'prompt_chars': prompt_chars,
+                                          'static_chars': static_chars, 'at': time.time()})
+                    error = stub.errors.pop(0) if stub.errors else None
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if error:
+                    self._reply(error, {"type": "error", "error": {"type": "overloaded_error" if error == 529
+                                                                   else "api_error", "message": "Stub error"}},
+                                {'retry-after-ms': '10'})
+                    return
+                tools = request.get('tools') or []
+                if tools:
+                    content = {"type": "tool_use", "id": "toolu_stub", "name": tools[0]['name'], "input": ANALYSIS}
+                else:
+                    content = {"type": "text", "text": json.dumps(ANALYSIS)}
+                message = {
+                    "id": "msg_stub",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": request.get('model', 'stub'),
+                    "stop_reason": "tool_use" if tools else "end_turn",
+                    "stop_sequence": None,
+                    "usage": usage,
+                    "content": [content]
+                }
+                if request.get('stream'):
+                    self._stream(message)
+                else:
+                    self._reply(200, message)
+
+            def _stream(self, message):
+                content = message['content'][0]
+                if content['type'] == 'tool_use':
+                    start = dict(content, input={})
+                    text = json.dumps(content['input'])
+                    delta = lambda piece: {"type": "input_json_delta", "partial_json": piece}
+                else:
+                    start = dict(content, text="")
+                    text = content['text']
+                    delta = lambda piece: {"type": "text_delta", "text": piece}
+                events = [("message_start", {"type": "message_start", "message": dict(
+                    message, content=[], stop_reason=None, usage=dict(message['usage'], output_tokens=1))}),
+                          ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": start})]
+                # Small pieces, like the real API's token-by-token deltas
+                events += [("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                     "delta": delta(text[i:i + 40])})
+                           for i in range(0, len(text), 40)]
+                events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                           ("message_delta", {"type": "message_delta",
+                                              "delta": {"stop_reason": message['stop_reason'], "stop_sequence": None},
+                                              "usage": {"output_tokens": message['usage']['output_tokens']}}),
+                           ("message_stop", {"type": "message_stop"})]
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for name, payload in events:
+                    self.wfile.write(f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve in a background thread; returns the base URL."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-claude", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a stub Anthropic Messages API")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per response")
+    args = parser.parse_args()
+    stub = StubClaudeServer(latency=args.latency, port=args.port)
+    print(f"Stub Claude API on {stub.base_url} (set CLAUDE_BASE_URL to this)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,6 +13,114 @@ class Config:
     MAX_VIDEO_DURATION = 180  # seconds
     MIN_VIDEO_DURATION = 5    # seconds
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+    # Flask answers 413 before reading a body this large (MAX_FILE_SIZE plus room for the multipart framing)
+    MAX_CONTENT_LENGTH = MAX_FILE_SIZE + 1024 * 1024
+
+    # Record only the microphone (Opus) in the browser; the camera just shows a small preview
+    AUDIO_ONLY_CAPTURE = os.environ.get('AUDIO_ONLY_CAPTURE', '').lower() in ('1', 'true', 'yes')
+
+    # Gunicorn web workers (the start command passes this to --workers); see DEPLOYMENT.md before raising it
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+    # Decode chunked uploads while they arrive; only possible when one web worker receives every chunk
+    STREAMING_DECODE = os.environ.get('STREAMING_DECODE', 'true').lower() in ('1', 'true', 'yes')
+
+    # Session storage: 'sqlite' (shared by all gunicorn workers on the host) or 'memory' (single worker)
+    SESSION_STORE = os.environ.get('SESSION_STORE', 'sqlite')
+    SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db'))
+
+    # Load and warm the Whisper model when each worker starts instead of on the first transcription
+    PRELOAD_MODEL = os.environ.get('PRELOAD_MODEL', '').lower() in ('1', 'true', 'yes')
+
+    # Transcription quality tiers, best first ("model:beam_size"); the server steps down a tier when
+    # the queue or recent p95 latency crosses the high mark and back up below the low mark. One tier
+    # (the default) never degrades; e.g. 'base:5,base:1,tiny:1' opts in to cheaper tiers under load
+    TRANSCRIPTION_TIERS = os.environ.get('TRANSCRIPTION_TIERS', 'base:5')
+    TIER_QUEUE_HIGH = int(os.environ.get('TIER_QUEUE_HIGH', 6))
+    TIER_QUEUE_LOW = int(os.environ.get('TIER_QUEUE_LOW', 2))
+    TIER_P95_HIGH_SECONDS = float(os.environ.get('TIER_P95_HIGH_SECONDS', 60))
+    TIER_P95_LOW_SECONDS = float(os.environ.get('TIER_P95_LOW_SECONDS', 20))
+    TIER_MIN_DWELL_SECONDS = float(os.environ.get('TIER_MIN_DWELL_SECONDS', 30))
+
+    # Whisper CPU budget: threads per transcription (0: CTranslate2 default of 4) and
+    # parallel transcriptions (default: one per 4 cores, up to one per question)
+    WHISPER_CPU_THREADS = int(os.environ.get('WHISPER_CPU_THREADS', 0))
+    WHISPER_COMPUTE_TYPE = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8')  # int8, int8_float32, float32
+    WHISPER_NUM_WORKERS = int(os.environ.get('WHISPER_NUM_WORKERS', max(1, min(3, (os.cpu_count() or 1) // 4))))
+
+    # Background transcription pipeline (jobs start at upload time)
+    PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', WHISPER_NUM_WORKERS))  # inference threads
+    EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', 3))  # concurrent ffmpeg extractions
+    # Jobs a worker lets wait for inference before answering 429 with a queue position (0 = unbounded)
+    TRANSCRIPTION_QUEUE_LIMIT = int(os.environ.get('TRANSCRIPTION_QUEUE_LIMIT', 8))
+    # Where Whisper runs: 'inline' (threads in each web worker) or 'spool' (standalone
+    # `python -m services.worker` processes fed through a job spool in SPOOL_DIR; needs SESSION_STORE=sqlite)
+    TRANSCRIPTION_BACKEND = os.environ.get('TRANSCRIPTION_BACKEND', 'inline')
+    SPOOL_DIR = os.environ.get('SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', WHISPER_NUM_WORKERS))  # transcriptions per worker process
+    TRANSCRIBE_WAIT_SECONDS = float(os.environ.get('TRANSCRIBE_WAIT_SECONDS', 20))  # long-poll per request
+    SSE_MAX_SECONDS = float(os.environ.get('SSE_MAX_SECONDS', 120))  # clients reconnect after this
+    # Each progress stream and long-poll holds one of a web worker's gunicorn threads (--threads WEB_THREADS);
+    # streams beyond SSE_MAX_STREAMS are refused so the rest stay free for uploads and polling
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', max(1, WEB_THREADS // 4)))
+
+    # Batch concurrent Whisper requests together (window in ms, max 30 s chunks per pass)
+    WHISPER_BATCHING = os.environ.get('WHISPER_BATCHING', '').lower() in ('1', 'true', 'yes')
+    WHISPER_BATCH_WINDOW_MS = int(os.environ.get('WHISPER_BATCH_WINDOW_MS', 50))
+    WHISPER_BATCH_MAX_SIZE = int(os.environ.get('WHISPER_BATCH_MAX_SIZE', 8))
+    WHISPER_LANGUAGE = os.environ.get('WHISPER_LANGUAGE') or None  # None: detect
+    # Each waiting request holds an inference thread, so batching raises the thread count to the batch size
+    INFERENCE_THREADS = max(PIPELINE_WORKERS, WHISPER_BATCH_MAX_SIZE) if WHISPER_BATCHING else PIPELINE_WORKERS
+
+    # Silence pre-pass before Whisper: skip silent recordings, trim silence, shorten long pauses
+    SILENCE_PREPASS = os.environ.get('SILENCE_PREPASS', 'true').lower() in ('1', 'true', 'yes')
+    SILENCE_MIN_RMS = float(os.environ.get('SILENCE_MIN_RMS', 0.003))  # lowest speech level, full scale = 1
+    SILENCE_MAX_PAUSE_SECONDS = float(os.environ.get('SILENCE_MAX_PAUSE_SECONDS', 2.0))
+    # Trim threshold: SILENCE_NOISE_RATIO x the noise floor, capped at SILENCE_MAX_RMS and at
+    # SILENCE_PEAK_RATIO x the loud frames, so pause-free speech is not trimmed as noise
+    SILENCE_MAX_RMS = float(os.environ.get('SILENCE_MAX_RMS', 0.03))
+    SILENCE_NOISE_RATIO = float(os.environ.get('SILENCE_NOISE_RATIO', 2.5))
+    SILENCE_PEAK_RATIO = float(os.environ.get('SILENCE_PEAK_RATIO', 0.5))
+
+    # Transcriptions remembered per worker by upload/PCM fingerprint (0 disables the process-wide cache)
+    TRANSCRIPT_CACHE_SIZE = int(os.environ.get('TRANSCRIPT_CACHE_SIZE', 512))
+
+    # Write extracted audio to a WAV on disk (and keep it) instead of decoding in memory
+    DEBUG_AUDIO_FILES = os.environ.get('DEBUG_AUDIO_FILES', '').lower() in ('1', 'true', 'yes')
+
+    # Analysis cache: entries kept in memory, TTL, and an optional SQLite file shared by workers
+    ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 256))
+    ANALYSIS_CACHE_TTL = float(os.environ.get('ANALYSIS_CACHE_TTL', 24 * 3600))
+    ANALYSIS_CACHE_DB = os.environ.get('ANALYSIS_CACHE_DB') or None
+
+    # Shared Claude client: connection pool, timeouts (seconds), retries with backoff
+    CLAUDE_BASE_URL = os.environ.get('CLAUDE_BASE_URL') or None  # e.g. a local stub server
+    CLAUDE_MAX_CONNECTIONS = int(os.environ.get('CLAUDE_MAX_CONNECTIONS', 20))
+    CLAUDE_MAX_KEEPALIVE = int(os.environ.get('CLAUDE_MAX_KEEPALIVE', 10))
+    CLAUDE_TIMEOUT = float(os.environ.get('CLAUDE_TIMEOUT', 60))
+    CLAUDE_CONNECT_TIMEOUT = float(os.environ.get('CLAUDE_CONNECT_TIMEOUT', 10))
+    CLAUDE_MAX_RETRIES = int(os.environ.get('CLAUDE_MAX_RETRIES', 3))
+
+    # Local keyword matcher: store its analysis when Claude fails, and optionally send
+    # Claude only the categories it matched (all of them when it matched none)
+    ANALYSIS_FALLBACK = os.environ.get('ANALYSIS_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+    ANALYSIS_SHORTLIST = os.environ.get('ANALYSIS_SHORTLIST', '').lower() in ('1', 'true', 'yes')
+    # Analyze each answer as soon as it is transcribed, refining the draft as later answers arrive,
+    # so /api/analyze usually finds the analysis done (costs extra Claude calls per session)
+    SPECULATIVE_ANALYSIS = os.environ.get('SPECULATIVE_ANALYSIS', '').lower() in ('1', 'true', 'yes')
+
+    # Janitor: evict sessions idle this long, beyond this many, or while uploads exceed the quota (0 disables each)
+    SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', 2 * 3600))
+    # Completed sessions (transcripts and analysis) are deleted once idle this long; defaults to the idle TTL,
+    # so keeping them longer (e.g. for services.reanalyze) is an explicit retention choice. 0 keeps them forever
+    COMPLETED_SESSION_TTL_SECONDS = float(os.environ.get('COMPLETED_SESSION_TTL_SECONDS', SESSION_TTL_SECONDS))
+    MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 1000))
+    UPLOAD_QUOTA_MB = float(os.environ.get('UPLOAD_QUOTA_MB', 2048))
+    JANITOR_INTERVAL_SECONDS = float(os.environ.get('JANITOR_INTERVAL_SECONDS', 60))
+
+    # Directory where each worker writes its metrics snapshot for /metrics to merge
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'longcovid-intake-metrics'))
 
     CLINIC_NAME = "University of Cascadia Long-COVID Clinic"
 
@@ -118,3 +227,43 @@ class Config:
             "description": "Many symptoms across the body that flare, improve, and return over time."
         }
     ]
+
+    # Everyday phrases patients use for each category, for the local pre-matcher
+    # (services/symptom_matcher.py) alongside the category names and descriptions
+    SYMPTOM_SYNONYMS = {
+        "energy_crash": ["exhausted", "exhaustion", "fatigue", "fatigued", "tired", "no energy", "wiped out",
+                         "crash", "crashes", "crashing", "pem", "post-exertional malaise", "pacing",
+                         "worse after exercise", "bed bound", "housebound"],
+        "orthostatic_intolerance": ["pots", "lightheaded", "light-headed", "dizziness", "dizzy", "faint",
+                                    "fainting", "passing out", "heart racing", "racing heart",
+                                    "standing up", "stand for long"],
+        "brain_fog": ["brain fog", "foggy", "can't think", "can't concentrate", "concentrate", "concentration",
+                      "forgetful", "forgetting", "memory", "lose words", "losing words", "word finding",
+                      "confused", "confusion", "can't focus", "focus"],
+        "sleep_dysregulation": ["insomnia", "can't sleep", "sleep", "sleeping", "unrefreshing sleep",
+                                "wake up tired", "waking up", "nightmares"],
+        "breathlessness": ["short of breath", "shortness of breath", "breathless", "out of breath",
+                           "can't breathe", "can't catch my breath", "air hunger", "breathing"],
+        "chest_heart": ["chest pain", "chest tightness", "tight chest", "palpitations", "heart pounding",
+                        "pounding heart", "skipped beats", "irregular heartbeat", "heart flutter"],
+        "headache_migraine": ["headache", "headaches", "migraine", "migraines", "head pressure",
+                              "light sensitivity", "sensitive to light", "sensitive to noise"],
+        "musculoskeletal_pain": ["joint pain", "muscle pain", "aches", "aching", "sore muscles", "body aches",
+                                 "weak", "weakness", "stiff", "stiffness"],
+        "neuropathy": ["pins and needles", "tingling", "numb", "numbness", "burning", "buzzing",
+                       "electric shocks", "nerve pain"],
+        "gastrointestinal": ["nausea", "nauseous", "bloating", "bloated", "diarrhea", "constipation",
+                             "stomach", "reflux", "indigestion", "can't eat"],
+        "ent_sensory": ["smell", "taste", "loss of smell", "loss of taste", "parosmia", "tinnitus",
+                        "ringing in my ears", "ear pressure", "sinus", "sore throat"],
+        "temperature_flares": ["chills", "sweating", "night sweats", "fever", "feverish", "hot flashes",
+                               "always cold", "flu-like", "flu like"],
+        "reactivity": ["allergic", "allergies", "hives", "rash", "itchy", "mcas", "mast cell",
+                       "reactions to food", "sensitive to smells"],
+        "mood_emotional": ["anxiety", "anxious", "depressed", "depression", "irritable", "mood swings",
+                           "panic", "low mood", "crying"],
+        "genitourinary": ["bladder", "urinating", "peeing", "incontinence", "pelvic pain", "libido",
+                          "erectile", "period", "periods"],
+        "multisystem": ["comes and goes", "relapse", "relapses", "flare", "flares", "flare-ups",
+                        "good days and bad days", "everything hurts"]
+    }
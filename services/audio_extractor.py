@@ -6,8 +6,65 @@ Extracts audio track from video files for transcription.
 import os
 import subprocess
 import imageio_ffmpeg
+import numpy as np
 
+from services import metrics
 
+# Whisper's native sample rate; decoding straight to it avoids a resample later
+WHISPER_SAMPLE_RATE = 16000
+
+
+@metrics.timed('intake_ffmpeg_seconds', mode='array')
+def extract_audio_array(video_path: str, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode the audio track of a video file straight into memory.
+
+    ffmpeg writes raw mono float32 PCM at the requested rate to stdout, so no
+    intermediate WAV is written and faster-whisper does not need to resample.
+
+    Args:
+        video_path: Path to the video file (WebM)
+        sample_rate: Output sample rate (16 kHz for Whisper)
+
+    Returns:
+        1-D float32 NumPy array of samples in [-1, 1]
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file not found: {video_path}")
+
+    ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
+
+    # -vn: no video
+    # -f f32le: raw 32-bit float little-endian samples
+    # -ar / -ac: resample to mono at the target rate
+    # pipe:1: write to stdout
+    cmd = [
+        ffmpeg_path,
+        '-nostdin',
+        '-i', video_path,
+        '-vn',
+        '-f', 'f32le',
+        '-acodec', 'pcm_f32le',
+        '-ar', str(sample_rate),
+        '-ac', '1',
+        'pipe:1'
+    ]
+
+    try:
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"FFmpeg error: {e.stderr.decode(errors='replace')}")
+    except FileNotFoundError:
+        raise RuntimeError("FFmpeg not found. Please install ffmpeg.")
+
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+@metrics.timed('intake_ffmpeg_seconds', mode='wav')
 def extract_audio(video_path: str) -> str:
     """
     Extract audio from a video file and save as WAV.
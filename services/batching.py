@@ -0,0 +1,254 @@
+"""
+Cross-request batching for Whisper inference.
+Gathers audio from concurrent transcription requests over a short window and
+runs their 30-second chunks through the encoder/decoder as one batch, so a burst
+of patients finishing at once shares encoder passes instead of queueing.
+On faster-whisper releases other than those in TESTED_VERSIONS the scheduler still
+queues requests but runs each through the public model.transcribe().
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import faster_whisper
+import numpy as np
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+
+# Batching drives faster-whisper internals (BatchedInferencePipeline.forward, collect_chunks,
+# TranscriptionOptions) that change between releases; other releases run each request
+# through model.transcribe instead
+TESTED_VERSIONS = ('1.2.',)
+
+
+def _load_batch_api():
+    """faster-whisper's batching internals, or None on a release they haven't been checked against."""
+    if not faster_whisper.__version__.startswith(TESTED_VERSIONS):
+        return None
+    try:
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import BatchedInferencePipeline, TranscriptionOptions, get_suppressed_tokens
+        from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+    except ImportError:
+        return None
+    return SimpleNamespace(pad_or_trim=pad_or_trim, Tokenizer=Tokenizer,
+                           BatchedInferencePipeline=BatchedInferencePipeline,
+                           TranscriptionOptions=TranscriptionOptions, get_suppressed_tokens=get_suppressed_tokens,
+                           VadOptions=VadOptions, collect_chunks=collect_chunks,
+                           get_speech_timestamps=get_speech_timestamps)
+
+
+_api = _load_batch_api()
+
+
+class BatchScheduler:
+    """Collects transcription requests and runs them through faster-whisper in batches."""
+
+    def __init__(self, get_model, model_name: str = "base", window_ms: int = 50, max_batch_size: int = 8,
+                 beam_size: int = 5, language: str = None):
+        """
+        Args:
+            get_model: Callable returning the loaded WhisperModel for a model name
+            model_name: Whisper model size this scheduler batches for
+            window_ms: How long to wait for more requests after the first one arrives
+            max_batch_size: Maximum number of 30 s chunks per encoder/decoder pass
+            beam_size: Beam size used for decoding
+            language: Fixed language code, or None to detect per chunk
+        """
+        self.get_model = get_model
+        self.model_name = model_name
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.beam_size = beam_size
+        self.language = language
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pipeline = None  # (model, BatchedInferencePipeline), built once per loaded model
+        if _api is None:
+            print(f"[BATCHER] faster-whisper {faster_whisper.__version__} is untested with batching; "
+                  f"requests will be transcribed one at a time")
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'chunks': 0,
+            'queue_wait_seconds': 0.0,
+            'compute_seconds': 0.0
+        }
+
+    def submit(self, audio: np.ndarray) -> Future:
+        """
+        Queue 16 kHz mono float32 audio for transcription.
+
+        Returns:
+            Future resolving to (segments, timings): segments are {'text', 'start', 'end'} dicts
+            (seconds into `audio`), timings has queue_wait, compute seconds and batch_requests
+        """
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((audio, time.time(), future))
+        return future
+
+    def accepts(self, model_name: str, beam_size: int) -> bool:
+        """True if requests for this model and beam size can join the scheduler's batches."""
+        return model_name == self.model_name and beam_size == self.beam_size
+
+    def stats(self) -> dict:
+        """
+        Aggregate counters: mean queue wait per request versus compute time per batch.
+
+        compute_seconds is the wall time of the batches (each counted once, however
+        many requests shared it); queue_wait_seconds sums every request's wait.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats['requests'] or 1
+        stats['batched'] = _api is not None
+        stats['mean_queue_wait_seconds'] = round(stats['queue_wait_seconds'] / requests, 3)
+        stats['mean_batch_compute_seconds'] = round(stats['compute_seconds'] / (stats['batches'] or 1), 3)
+        stats['mean_batch_chunks'] = round(stats['chunks'] / (stats['batches'] or 1), 2)
+        return stats
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            chunks = _estimate_chunks(pending[0][0])
+            deadline = time.time() + self.window
+            while chunks < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                chunks += _estimate_chunks(item[0])
+
+            try:
+                self._run_batch(pending)
+            except Exception as e:
+                print(f"[BATCHER] Batch of {len(pending)} failed: {e}")
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _batch_pipeline(self, model):
+        if self._pipeline is None or self._pipeline[0] is not model:
+            self._pipeline = (model, _api.BatchedInferencePipeline(model))
+        return self._pipeline[1]
+
+    def _run_batch(self, pending):
+        started = time.time()
+        model = self.get_model(self.model_name)
+        if _api is None:
+            results, chunks = self._transcribe_each(model, pending)
+        else:
+            results, chunks = self._transcribe_batched(model, pending)
+
+        compute = time.time() - started
+        with self._lock:
+            self._stats['requests'] += len(pending)
+            self._stats['batches'] += 1
+            self._stats['chunks'] += chunks
+            self._stats['compute_seconds'] += compute
+            self._stats['queue_wait_seconds'] += sum(started - submitted for _, submitted, _ in pending)
+
+        print(f"[BATCHER] Ran {len(pending)} request(s) as {chunks} chunk(s) in {compute:.2f}s")
+        for index, (_, submitted, future) in enumerate(pending):
+            timings = {
+                'queue_wait_seconds': round(started - submitted, 3),
+                'compute_seconds': round(compute, 3),
+                'batch_requests': len(pending)
+            }
+            future.set_result((results[index], timings))
+
+    def _transcribe_batched(self, model, pending):
+        # Split every request into VAD-bounded chunks of at most 30 s
+        features, metadata, owners = [], [], []
+        for index, (audio, _, _) in enumerate(pending):
+            timestamps = _api.get_speech_timestamps(
+                audio, _api.VadOptions(max_speech_duration_s=CHUNK_SECONDS, min_silence_duration_ms=160))
+            if not timestamps:
+                continue
+            audio_chunks, chunks_metadata = _api.collect_chunks(audio, timestamps, max_duration=CHUNK_SECONDS)
+            for chunk, meta in zip(audio_chunks, chunks_metadata):
+                features.append(_api.pad_or_trim(model.feature_extractor(chunk)[..., :-1]))
+                metadata.append(meta)
+                owners.append(index)
+
+        results = [[] for _ in pending]
+        if features:
+            multilingual = model.model.is_multilingual and self.language is None
+            tokenizer = _api.Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                                       task="transcribe", language=self.language or "en")
+            options = _batch_options(tokenizer, self.beam_size, multilingual)
+            batched = self._batch_pipeline(model)
+            for start in range(0, len(features), self.max_batch_size):
+                outputs = batched.forward(
+                    np.stack(features[start:start + self.max_batch_size]),
+                    tokenizer,
+                    metadata[start:start + self.max_batch_size],
+                    options
+                )
+                for owner, segments in zip(owners[start:start + self.max_batch_size], outputs):
+                    results[owner].extend({'text': segment['text'], 'start': segment['start'],
+                                           'end': segment['end']} for segment in segments)
+        return results, len(features)
+
+    def _transcribe_each(self, model, pending):
+        # Fallback without faster-whisper's batching internals: one public transcribe() per request
+        results = []
+        for audio, _, _ in pending:
+            segments, _ = model.transcribe(audio, beam_size=self.beam_size, language=self.language)
+            results.append([{'text': segment.text, 'start': segment.start, 'end': segment.end}
+                            for segment in segments])
+        return results, len(pending)
+
+
+def _estimate_chunks(audio: np.ndarray) -> int:
+    """Upper bound on how many 30 s chunks a request contributes to a batch."""
+    return max(1, int(np.ceil(audio.shape[0] / (SAMPLE_RATE * CHUNK_SECONDS))))
+
+
+def _batch_options(tokenizer, beam_size: int, multilingual: bool):
+    """Decoding options matching BatchedInferencePipeline.transcribe's defaults."""
+    return _api.TranscriptionOptions(
+        beam_size=beam_size,
+        best_of=5,
+        patience=1,
+        length_penalty=1,
+        repetition_penalty=1,
+        no_repeat_ngram_size=0,
+        log_prob_threshold=-1.0,
+        no_speech_threshold=0.6,
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=False,
+        prompt_reset_on_temperature=0.5,
+        temperatures=[0.0],
+        initial_prompt=None,
+        prefix=None,
+        suppress_blank=True,
+        suppress_tokens=_api.get_suppressed_tokens(tokenizer, [-1]),
+        without_timestamps=True,
+        max_initial_timestamp=0.0,
+        word_timestamps=False,
+        prepend_punctuations="\"'“¿([{-",
+        append_punctuations="\"'.。,，!！?？:：”)]}、",
+        multilingual=multilingual,
+        max_new_tokens=None,
+        clip_timestamps=[],
+        hallucination_silence_threshold=None,
+        hotwords=None
+    )
@@ -0,0 +1,284 @@
+"""
+Chunked upload service.
+Appends MediaRecorder timeslice chunks to a partial file as they arrive and
+feeds them to a long-lived ffmpeg decoder, so the audio is already decoded by
+the time the patient stops recording. Progress is kept in a sidecar file so an
+upload can resume after a dropped connection without resending chunks.
+
+A decoder lives in the process that received the upload's first chunk, so it
+only helps when the same process completes the upload (a single web worker);
+anywhere else the file is decoded at completion. A decoder whose file stops
+growing for IDLE_TIMEOUT_SECONDS (upload abandoned, completed by another
+worker, or replaced by a plain upload) is killed.
+"""
+
+import fcntl
+import json
+import os
+import subprocess
+import threading
+import time
+
+import imageio_ffmpeg
+import numpy as np
+
+from services import metrics
+from services.ingest import UploadTooLarge
+
+SAMPLE_RATE = 16000
+
+# MediaRecorder sends a chunk every few seconds; this long without one means nobody will finish the upload here
+IDLE_TIMEOUT_SECONDS = 120
+
+# Decoders live in the process that received the first chunk of an upload
+_decoders = {}
+_decoders_lock = threading.Lock()
+
+
+class StreamingDecoder:
+    """Tails a growing WebM file through ffmpeg into 16 kHz mono float32 PCM."""
+
+    def __init__(self, path: str, idle_timeout: float = IDLE_TIMEOUT_SECONDS):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._finished = threading.Event()
+        self._pcm = []
+        self._error = None
+        self._process = subprocess.Popen(
+            [imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-loglevel', 'error',
+             '-i', 'pipe:0', '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+             '-ar', str(SAMPLE_RATE), '-ac', '1', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._feeder.start()
+        self._reader.start()
+
+    def _feed(self):
+        last_data = time.monotonic()
+        try:
+            with open(self.path, 'rb') as f:
+                while True:
+                    data = f.read(64 * 1024)
+                    if data:
+                        last_data = time.monotonic()
+                        self._process.stdin.write(data)
+                        self._process.stdin.flush()
+                    elif self._finished.is_set():
+                        # Drain anything appended between the last read and finish()
+                        data = f.read()
+                        if data:
+                            self._process.stdin.write(data)
+                        break
+                    elif time.monotonic() - last_data > self.idle_timeout:
+                        print(f"[UPLOAD] No data for {self.idle_timeout:.0f}s, stopping the decoder of "
+                              f"{os.path.basename(self.path)}")
+                        self._error = "Upload went idle"
+                        _forget(self)
+                        self.abort()
+                        break
+                    else:
+                        time.sleep(0.1)
+        except (BrokenPipeError, OSError) as e:
+            self._error = str(e)
+        finally:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+
+    def _read(self):
+        while True:
+            data = self._process.stdout.read(64 * 1024)
+            if not data:
+                break
+            self._pcm.append(data)
+
+    def decoded_seconds(self) -> float:
+        """Seconds of audio decoded so far."""
+        return sum(len(b) for b in self._pcm) / 4 / SAMPLE_RATE
+
+    @metrics.timed('intake_ffmpeg_seconds', mode='stream_tail')
+    def finish(self, timeout: float = 60) -> np.ndarray:
+        """
+        Flush the remaining input and return all decoded samples (time is only the tail left after upload).
+
+        Raises:
+            RuntimeError: If ffmpeg failed or did not finish within `timeout` (it is killed)
+        """
+        self._finished.set()
+        try:
+            deadline = time.monotonic() + timeout
+            self._feeder.join(timeout)
+            self._reader.join(max(0, deadline - time.monotonic()))
+            if self._reader.is_alive():
+                raise RuntimeError(f"Decoder did not finish within {timeout:.0f}s")
+            returncode = self._process.wait(max(0, deadline - time.monotonic()))
+            if returncode != 0 or self._error:
+                stderr = self._process.stderr.read().decode(errors='replace')
+                raise RuntimeError(f"FFmpeg error: {stderr or self._error}")
+        except Exception:
+            self.abort()
+            raise
+        return np.frombuffer(b''.join(self._pcm), dtype=np.float32)
+
+    def abort(self):
+        """Stop decoding, kill ffmpeg and discard output."""
+        self._finished.set()
+        try:
+            self._process.kill()
+        except OSError:
+            pass
+        self._pcm = []
+
+
+def _forget(decoder: StreamingDecoder):
+    with _decoders_lock:
+        if _decoders.get(decoder.path) is decoder:
+            del _decoders[decoder.path]
+
+
+def _part_path(session_folder: str, question_id: int, upload_id: str, media: str = 'video',
+               extension: str = 'webm') -> str:
+    # Named like the finished recording (see app.recording_filename), plus .part
+    return os.path.join(session_folder, f"q{question_id}_{upload_id}_{media}.{extension}.part")
+
+
+def _read_progress(progress_path: str) -> dict:
+    try:
+        with open(progress_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'next_seq': 0, 'size': 0}
+
+
+def _write_progress(progress_path: str, progress: dict):
+    tmp_path = f"{progress_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+
+def get_progress(session_folder: str, question_id: int, upload_id: str, media: str = 'video',
+                 extension: str = 'webm') -> dict:
+    """Return {'next_seq', 'size'} for an upload (zeros if unknown)."""
+    return _read_progress(_part_path(session_folder, question_id, upload_id, media, extension) + '.json')
+
+
+def append_chunk(session_folder: str, question_id: int, upload_id: str, seq: int, data: bytes,
+                 decode: bool = True, max_bytes: int = None, media: str = 'video', extension: str = 'webm') -> dict:
+    """
+    Append chunk `seq` to an upload.
+
+    Duplicate chunks (seq already stored) are acknowledged without being written again.
+
+    Args:
+        session_folder: Session upload folder
+        question_id: Question the recording answers
+        upload_id: Client-generated id for this recording attempt
+        seq: Zero-based chunk index
+        data: Chunk bytes
+        decode: Start/continue incremental decoding in this process
+        max_bytes: Largest total upload size accepted (None for no limit)
+        media: 'video' or 'audio' (AUDIO_ONLY_CAPTURE), as in the recording's file name
+        extension: Container file extension ('webm' or 'ogg')
+
+    Returns:
+        Progress dict {'next_seq', 'size', 'duplicate'}
+
+    Raises:
+        UploadTooLarge: If the chunk would take the upload past max_bytes
+        ValueError: If the chunk is ahead of the next expected index (the gap must be resent first)
+    """
+    part_path = _part_path(session_folder, question_id, upload_id, media, extension)
+    progress_path = part_path + '.json'
+
+    with open(part_path, 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            progress = _read_progress(progress_path)
+            if seq < progress['next_seq']:
+                return dict(progress, duplicate=True)
+            if seq > progress['next_seq']:
+                raise ValueError(f"Expected chunk {progress['next_seq']}, got {seq}")
+            if max_bytes is not None and progress['size'] + len(data) > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+
+            # Drop any bytes from a write that was interrupted before its progress was recorded
+            f.truncate(progress['size'])
+            f.seek(progress['size'])
+            f.write(data)
+            f.flush()
+            progress = {'next_seq': seq + 1, 'size': progress['size'] + len(data)}
+            _write_progress(progress_path, progress)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    if decode and seq == 0:
+        _start_decoder(part_path)
+
+    return dict(progress, duplicate=False)
+
+
+def _start_decoder(part_path: str):
+    with _decoders_lock:
+        if part_path not in _decoders:
+            _decoders[part_path] = StreamingDecoder(part_path)
+
+
+def complete(session_folder: str, question_id: int, upload_id: str, total_chunks: int, video_path: str,
+             media: str = 'video', extension: str = 'webm'):
+    """
+    Finalize an upload: move the assembled file to `video_path` and collect decoded audio.
+
+    media and extension must match those its chunks were appended with.
+
+    Returns:
+        Decoded 16 kHz float32 samples if this process decoded the stream, else None
+        (the caller falls back to decoding the file)
+
+    Raises:
+        ValueError: If chunks are missing
+    """
+    part_path = _part_path(session_folder, question_id, upload_id, media, extension)
+    progress = _read_progress(part_path + '.json')
+    if progress['next_seq'] != total_chunks:
+        raise ValueError(f"Upload incomplete: have {progress['next_seq']} of {total_chunks} chunks")
+
+    with _decoders_lock:
+        decoder = _decoders.pop(part_path, None)
+
+    audio = None
+    if decoder is not None:
+        try:
+            audio = decoder.finish()
+            print(f"[UPLOAD] Streamed decode of q{question_id}: {audio.shape[0] / SAMPLE_RATE:.1f}s ready at completion")
+        except Exception as e:
+            print(f"Warning: Streaming decode failed, falling back to file decode: {e}")
+            audio = None
+
+    os.replace(part_path, video_path)
+    os.remove(part_path + '.json')
+    return audio
+
+
+def discard(session_folder: str, question_id: int, keep_upload_id: str = None):
+    """Abort decoders and delete partial files for a question's other (stale) uploads."""
+    prefix = f"q{question_id}_"
+    with _decoders_lock:
+        for part_path in list(_decoders):
+            name = os.path.basename(part_path)
+            if os.path.dirname(part_path) == session_folder and name.startswith(prefix) \
+                    and (keep_upload_id is None or f"_{keep_upload_id}_" not in name):
+                _decoders.pop(part_path).abort()
+
+    if not os.path.isdir(session_folder):
+        return
+    for name in os.listdir(session_folder):
+        if name.startswith(prefix) and '.part' in name \
+                and (keep_upload_id is None or f"_{keep_upload_id}_" not in name):
+            try:
+                os.remove(os.path.join(session_folder, name))
+            except OSError:
+                pass
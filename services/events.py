@@ -0,0 +1,119 @@
+"""
+Per-session progress events.
+Keeps a numbered log of pipeline events for each session (in the session
+store) and renders it as a Server-Sent Events stream. Reconnecting clients
+send Last-Event-ID and receive only what they missed.
+
+Each open stream holds a web worker thread, so a worker serves at most
+max_streams of them (see configure); past that, clients are told not to
+reconnect and follow progress with ordinary requests instead.
+"""
+
+import json
+import threading
+import time
+
+# Other worker processes append to the shared store, so waiting streams also poll
+POLL_SECONDS = 0.5
+
+_store = None
+_condition = threading.Condition()
+
+_streams_lock = threading.Lock()
+_max_streams = 0  # 0: unlimited
+_open_streams = 0
+
+
+def configure(store, max_streams: int = 0):
+    """
+    Keep event logs in the given session store (shared across workers for SQLite).
+
+    Args:
+        store: Session store holding the event logs
+        max_streams: Streams this worker keeps open at once (0: unlimited)
+    """
+    global _store, _max_streams
+    _store = store
+    _max_streams = max(0, int(max_streams))
+
+
+def acquire_stream() -> bool:
+    """Reserve a stream slot; False when max_streams are already open. Pair with release_stream()."""
+    global _open_streams
+    with _streams_lock:
+        if _max_streams and _open_streams >= _max_streams:
+            return False
+        _open_streams += 1
+        return True
+
+
+def release_stream():
+    global _open_streams
+    with _streams_lock:
+        _open_streams = max(0, _open_streams - 1)
+
+
+def open_streams() -> int:
+    """Streams this worker has open."""
+    return _open_streams
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        from services.session_store import MemorySessionStore
+        _store = MemorySessionStore()
+    return _store
+
+
+def publish(session_id: str, event: str, data: dict):
+    """Append an event to a session's log and wake any listening streams."""
+    _get_store().append_event(session_id, event, data)
+    with _condition:
+        _condition.notify_all()
+
+
+def events_since(session_id: str, last_id: int = 0, timeout: float = 0) -> list:
+    """Return events newer than last_id, waiting up to timeout seconds for one to arrive."""
+    deadline = time.time() + timeout
+    while True:
+        events = _get_store().events_since(session_id, last_id)
+        remaining = deadline - time.time()
+        if events or remaining <= 0:
+            return events
+        with _condition:
+            _condition.wait(min(POLL_SECONDS, remaining))
+
+
+def format_event(event_id: int, event: str, data: dict) -> str:
+    """Serialize one event in text/event-stream format."""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(session_id: str, last_id: int = 0, max_seconds: float = 120, heartbeat: float = 15,
+           end_event: str = None):
+    """
+    Generate an SSE stream for a session.
+
+    Args:
+        session_id: Session to follow
+        last_id: Resume after this event id (from the Last-Event-ID header)
+        max_seconds: Close the stream after this long; EventSource reconnects and resumes
+        heartbeat: Seconds between keep-alive comments
+        end_event: Close the stream after sending this event
+
+    Yields:
+        text/event-stream chunks
+    """
+    yield "retry: 2000\n\n"
+    deadline = time.time() + max_seconds
+    while time.time() < deadline:
+        events = events_since(session_id, last_id, timeout=min(heartbeat, deadline - time.time()))
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, event, data in events:
+            last_id = event_id
+            yield format_event(event_id, event, data)
+            if event == end_event:
+                return
@@ -0,0 +1,360 @@
+"""
+Upload ingestion.
+Streams multipart recording uploads from the request body to disk in fixed-size
+chunks, enforcing the byte limit as data arrives and hashing on the way, and
+probes a recording's duration from its container (WebM/Ogg) by reading only the
+file's head and tail. Oversized or out-of-range uploads are rejected before
+ffmpeg ever runs; a recording whose container this probe cannot time (MP4, or
+WebM/Ogg without usable timestamps) is held to the same limits once ffmpeg has
+decoded it (check_decoded_duration).
+"""
+
+import hashlib
+import os
+import struct
+import uuid
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+
+# Plain form fields (question_id, media...) are tiny
+MAX_FIELD_BYTES = 16 * 1024
+
+# Bytes read from the start of a file for container headers, and the tail windows
+# searched (growing) for the last WebM cluster or Ogg page
+HEAD_BYTES = 64 * 1024
+TAIL_WINDOWS = (256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+# Container timestamps and the browser's timer can disagree slightly at the limits
+DURATION_TOLERANCE_SECONDS = 1
+
+SAMPLE_RATE = 16000
+
+
+class UploadTooLarge(ValueError):
+    """The upload is larger than the configured limit."""
+
+
+def receive_multipart(stream, boundary: str, folder: str, max_bytes: int, file_fields=('video', 'audio')):
+    """
+    Stream a multipart/form-data body to disk.
+
+    File parts are written chunk by chunk to hidden .part files in `folder` (the caller
+    moves them to their final name), counting bytes as they arrive; nothing is buffered
+    beyond one chunk.
+
+    Args:
+        stream: Request body stream
+        boundary: Multipart boundary from the Content-Type header
+        folder: Directory the file parts are written to
+        max_bytes: Largest total file size accepted
+        file_fields: Form fields accepted as files (others are drained and ignored)
+
+    Returns:
+        (fields, files): form fields as {name: str}, and files as
+        {name: {'path', 'filename', 'mimetype', 'size', 'sha256'}}
+
+    Raises:
+        UploadTooLarge: If the files exceed max_bytes (partial files are removed)
+        ValueError: If the body is not valid multipart data
+    """
+    # The decoder's own max_form_memory_size would cap its buffer, i.e. every read; fields are checked below
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    marker = b'--' + boundary.encode('latin-1')
+    fields, files = {}, {}
+    total = 0
+    part = out = digest = None
+    field_data = []
+    tail = b''
+
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            # The decoder passes the CR before a boundary through as part data if what it has
+            # been given ends just after that boundary: read on until the line break after it
+            while chunk:
+                seen = tail + chunk
+                found = seen.rfind(marker)
+                if found == -1 or found + len(marker) + 4 <= len(seen):
+                    break
+                more = stream.read(found + len(marker) + 4 - len(seen))
+                if not more:
+                    break
+                chunk += more
+            tail = (tail + chunk)[-(len(marker) + 4):]
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    part, field_data = event, []
+                elif isinstance(event, File):
+                    part = event
+                    if event.name in file_fields and event.name not in files:
+                        path = os.path.join(folder, f".upload-{uuid.uuid4().hex}.part")
+                        files[event.name] = {'path': path, 'filename': event.filename,
+                                             'mimetype': event.headers.get('Content-Type', ''), 'size': 0}
+                        out, digest = open(path, 'wb'), hashlib.sha256()
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        field_data.append(event.data)
+                        if sum(len(d) for d in field_data) > MAX_FIELD_BYTES:
+                            raise ValueError(f"Form field {part.name} is too large")
+                    elif out is not None:
+                        total += len(event.data)
+                        if total > max_bytes:
+                            raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+                        out.write(event.data)
+                        digest.update(event.data)
+                    if not event.more_data:
+                        if isinstance(part, Field):
+                            fields[part.name] = b''.join(field_data).decode('utf-8', 'replace')
+                        elif out is not None:
+                            files[part.name].update(size=out.tell(), sha256=digest.hexdigest())
+                            out.close()
+                            out = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+        if out is not None or not isinstance(event, Epilogue):
+            raise ValueError("Upload ended before the multipart body was complete")
+    except Exception:
+        if out is not None:
+            out.close()
+        for info in files.values():
+            discard_file(info['path'])
+        raise
+
+    return fields, files
+
+
+def discard_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_recording(video_path: str):
+    """Delete a recording once it is transcribed or rejected (logged, never raised, on failure)."""
+    try:
+        if video_path and os.path.exists(video_path):
+            os.remove(video_path)
+    except OSError as e:
+        print(f"Warning: Could not delete files: {e}")
+
+
+# Container duration probes
+
+def _vint(buf: bytes, pos: int, marker: bool = False):
+    """Decode an EBML variable-length integer; returns (value, next_pos, unknown_size)."""
+    if pos >= len(buf) or buf[pos] == 0:
+        raise ValueError("Bad EBML integer")
+    first = buf[pos]
+    length = 9 - first.bit_length()
+    if pos + length > len(buf):
+        raise ValueError("Truncated EBML integer")
+    value = first if marker else first & (0xFF >> length)
+    for byte in buf[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+
+def _element(buf: bytes, pos: int):
+    """(id, data_start, data_size or None if unknown) of the EBML element at pos."""
+    element_id, pos, _ = _vint(buf, pos, marker=True)
+    size, pos, unknown = _vint(buf, pos)
+    return element_id, pos, None if unknown else size
+
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+CLUSTER = 0x1F43B675
+CLUSTER_TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+
+
+def _webm_info(head: bytes):
+    """(timecode scale in ns, duration in seconds or None) from the Segment Info."""
+    element_id, pos, size = _element(head, 0)
+    if element_id != EBML_HEADER:
+        raise ValueError("Not an EBML file")
+    pos += size
+    element_id, pos, _ = _element(head, pos)
+    if element_id != SEGMENT:
+        raise ValueError("No Segment")
+    scale, duration = 1_000_000, None
+    while pos < len(head):
+        element_id, start, size = _element(head, pos)
+        if element_id == CLUSTER or size is None:
+            break
+        if element_id == INFO:
+            child = start
+            while child < start + size:
+                child_id, data, child_size = _element(head, child)
+                value = head[data:data + child_size]
+                if child_id == TIMECODE_SCALE:
+                    scale = int.from_bytes(value, 'big')
+                elif child_id == DURATION and child_size in (4, 8):
+                    duration = struct.unpack('>f' if child_size == 4 else '>d', value)[0]
+                child = data + child_size
+            break
+        pos = start + size
+    return scale, (duration * scale / 1e9 if duration else None)
+
+
+def _last_block_time(tail: bytes):
+    """Timecode (in scale units) of the last block in the last complete-enough Cluster of `tail`, or None."""
+    marker = CLUSTER.to_bytes(4, 'big')
+    search_end = len(tail)
+    while True:
+        pos = tail.rfind(marker, 0, search_end)
+        if pos == -1:
+            return None
+        search_end = pos
+        try:
+            _, data, size = _element(tail, pos)
+            end = min(len(tail), data + size) if size is not None else len(tail)
+            child_id, child_data, child_size = _element(tail, data)
+            if child_id != CLUSTER_TIMECODE or not 1 <= child_size <= 8:
+                continue  # the marker bytes were inside frame data
+            cluster_time = int.from_bytes(tail[child_data:child_data + child_size], 'big')
+        except ValueError:
+            continue
+        latest, child = 0, child_data + child_size
+        try:
+            while child < end:
+                child_id, child_data, child_size = _element(tail, child)
+                if child_size is None:
+                    break
+                blocks = [child_data] if child_id == SIMPLE_BLOCK else []
+                if child_id == BLOCK_GROUP:
+                    inner = child_data
+                    while inner < child_data + child_size:
+                        inner_id, inner_data, inner_size = _element(tail, inner)
+                        if inner_id == BLOCK:
+                            blocks.append(inner_data)
+                        inner = inner_data + (inner_size or 0)
+                for block in blocks:
+                    _, after_track, _ = _vint(tail, block)
+                    if after_track + 2 <= len(tail):
+                        latest = max(latest, struct.unpack('>h', tail[after_track:after_track + 2])[0])
+                child = child_data + child_size
+        except ValueError:
+            pass  # the last block was still being written; use the blocks before it
+        return cluster_time + latest
+
+
+def _webm_duration(f, head: bytes, file_size: int):
+    scale, duration = _webm_info(head)
+    if duration:
+        return duration
+    # MediaRecorder writes no Duration: use the timestamp of the last block
+    for window in TAIL_WINDOWS:
+        f.seek(max(0, file_size - window))
+        last = _last_block_time(f.read(window))
+        if last is not None:
+            return last * scale / 1e9
+        if window >= file_size:
+            break
+    return None
+
+
+def _ogg_duration(f, head: bytes, file_size: int):
+    # The first page carries the codec identification header
+    segments = head[26]
+    payload = head[27 + segments:]
+    if payload.startswith(b'OpusHead'):
+        rate, pre_skip = 48000, struct.unpack('<H', payload[10:12])[0]
+    elif payload.startswith(b'\x01vorbis'):
+        rate, pre_skip = struct.unpack('<I', payload[12:16])[0], 0
+    else:
+        return None
+    for window in TAIL_WINDOWS:
+        f.seek(max(0, file_size - window))
+        tail = f.read(window)
+        pos = len(tail)
+        while True:
+            pos = tail.rfind(b'OggS', 0, pos)
+            if pos == -1 or pos + 14 > len(tail):
+                break
+            granule = struct.unpack('<q', tail[pos + 6:pos + 14])[0]
+            if tail[pos + 4] == 0 and granule >= 0:
+                return max(0, granule - pre_skip) / rate
+        if window >= file_size:
+            break
+    return None
+
+
+def container_format(head: bytes):
+    """'webm', 'ogg' or 'mp4' from a file's first bytes, or None for anything a browser would not record."""
+    if head.startswith(EBML_HEADER.to_bytes(4, 'big')):
+        return 'webm'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    return None
+
+
+def probe_recording(path: str) -> dict:
+    """
+    Identify a recording's container and read its duration without decoding.
+
+    Only the file's head and (for WebM/Ogg) tail are read.
+
+    Returns:
+        {'format': 'webm' | 'ogg' | 'mp4' | None, 'duration': seconds, or None if the
+        container carries no timing this probe understands}
+    """
+    result = {'format': None, 'duration': None}
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            head = f.read(HEAD_BYTES)
+            result['format'] = container_format(head)
+            if result['format'] == 'webm':
+                result['duration'] = _webm_duration(f, head, file_size)
+            elif result['format'] == 'ogg' and len(head) > 27:
+                result['duration'] = _ogg_duration(f, head, file_size)
+    except (OSError, ValueError, struct.error, IndexError) as e:
+        print(f"[INGEST] Could not probe {os.path.basename(path)}: {e}")
+    return result
+
+
+def duration_error(seconds: float, min_seconds: int, max_seconds: int):
+    """Message for the patient if a recording's length is outside the limits, else None."""
+    if seconds < min_seconds - DURATION_TOLERANCE_SECONDS:
+        return f"Recording is too short ({seconds:.0f}s). Please answer for at least {min_seconds} seconds."
+    if seconds > max_seconds + DURATION_TOLERANCE_SECONDS:
+        minutes, extra = divmod(max_seconds, 60)
+        limit = f"{minutes} minutes" if minutes and not extra else f"{max_seconds} seconds"
+        return f"Recording is too long ({seconds:.0f}s). Please keep your answer under {limit}."
+    return None
+
+
+def check_decoded_duration(path: str, audio, min_seconds: int, max_seconds: int):
+    """
+    Apply the length limits to a recording's decoded audio if its container could not be
+    timed at upload (those uploads were let through unchecked).
+
+    Args:
+        path: The recording, still on disk
+        audio: Its decoded 16 kHz samples
+        min_seconds: MIN_VIDEO_DURATION
+        max_seconds: MAX_VIDEO_DURATION
+
+    Raises:
+        ValueError: With the patient-facing message if the decoded length is out of range
+    """
+    if probe_recording(path)['duration'] is not None:
+        return
+    error = duration_error(audio.shape[0] / SAMPLE_RATE, min_seconds, max_seconds)
+    if error:
+        raise ValueError(error)
@@ -0,0 +1,196 @@
+"""
+Session janitor.
+A background thread in each worker that evicts idle sessions, caps the number
+of stored sessions and keeps the upload folder under a disk quota, deleting
+both the session record and its files. Abandoned intakes otherwise keep their
+recordings forever, since only a finished analysis cleans up.
+
+Completed sessions are not capped or evicted for disk space. Once idle they lose
+their scratch state (uploads, jobs, progress events); the record itself, analysis
+included, is deleted after completed_ttl_seconds, which deployments may set
+longer than the idle TTL to keep analyses for services.reanalyze.
+"""
+
+import os
+import shutil
+import threading
+import time
+
+from services import metrics
+
+# Upload folders with no session record are left alone this long (a session's
+# folder is created just before its record)
+ORPHAN_GRACE_SECONDS = 600
+
+
+def _folder_usage(path: str):
+    """(bytes, newest mtime) of the files under a folder."""
+    total, newest = 0, 0.0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    if not newest:
+        try:
+            newest = os.stat(path).st_mtime
+        except OSError:
+            pass
+    return total, newest
+
+
+class Janitor:
+    """Periodic eviction of sessions by idle TTL, session count and upload disk usage."""
+
+    def __init__(self, store, upload_folder: str, ttl_seconds: float = 7200, max_sessions: int = 1000,
+                 max_upload_bytes: int = 0, interval_seconds: float = 60, on_evict=None,
+                 completed_ttl_seconds: float = 0):
+        """
+        Args:
+            store: Session store (see services.session_store)
+            upload_folder: Folder holding one sub-folder of uploads per session
+            ttl_seconds: Evict unfinished sessions not updated for this long, and release
+                completed ones' scratch state (0 disables)
+            max_sessions: Evict least recently updated unfinished sessions beyond this many (0 disables)
+            max_upload_bytes: Evict least recently updated unfinished sessions while uploads exceed this
+                (0 disables)
+            interval_seconds: Time between sweeps
+            on_evict: Called with a session_id before its files are deleted (e.g. to cancel its jobs)
+            completed_ttl_seconds: Delete completed sessions, analysis included, not updated for
+                this long (0 keeps them)
+        """
+        self.store = store
+        self.upload_folder = upload_folder
+        self.ttl_seconds = ttl_seconds
+        self.completed_ttl_seconds = completed_ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_upload_bytes = max_upload_bytes
+        self.interval_seconds = interval_seconds
+        self.on_evict = on_evict
+        self._pid = None
+        self._sweep_lock = threading.Lock()
+        self._released = set()  # completed sessions whose scratch state this process has removed
+        self.last_report = None
+
+    def start(self):
+        """Start sweeping in a daemon thread (once per process, so it is safe to call on every request)."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+
+        def sweep_forever():
+            while True:
+                time.sleep(self.interval_seconds)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[JANITOR] Sweep failed: {e}")
+
+        threading.Thread(target=sweep_forever, name="session-janitor", daemon=True).start()
+
+    def _release(self, session_id: str) -> int:
+        """Cancel a session's jobs and delete its uploads and progress events; returns bytes freed."""
+        if self.on_evict:
+            self.on_evict(session_id)
+        folder = os.path.join(self.upload_folder, session_id)
+        freed, _ = _folder_usage(folder) if os.path.isdir(folder) else (0, 0.0)
+        shutil.rmtree(folder, ignore_errors=True)
+        self.store.clear_events(session_id)
+        return freed
+
+    def _evict(self, session_id: str) -> int:
+        freed = self._release(session_id)
+        self.store.delete(session_id)
+        self._released.discard(session_id)
+        return freed
+
+    def sweep(self) -> dict:
+        """
+        Run one eviction pass.
+
+        Returns:
+            Report dict: sessions evicted per reason, orphan folders removed, bytes freed,
+            sessions and upload bytes remaining
+        """
+        with self._sweep_lock:
+            now = time.time()
+            report = {'idle': 0, 'over_cap': 0, 'over_quota': 0, 'expired': 0, 'released': 0, 'orphans': 0,
+                      'freed_bytes': 0}
+
+            def evict(session_id, reason):
+                report['freed_bytes'] += self._evict(session_id)
+                report[reason] += 1
+                metrics.inc('intake_janitor_evictions_total', reason=reason)
+
+            # Least recently updated first
+            sessions = sorted(self.store.list_sessions(), key=lambda s: s[1])
+            completed_ids = {sid for sid, _ in self.store.list_sessions(status='completed')}
+            completed = [s for s in sessions if s[0] in completed_ids]
+            sessions = [s for s in sessions if s[0] not in completed_ids]
+
+            # Completed sessions are not capped; once idle they only lose their scratch state
+            kept = []
+            for session_id, updated_at in completed:
+                if self.completed_ttl_seconds and now - updated_at > self.completed_ttl_seconds:
+                    evict(session_id, 'expired')
+                    continue
+                kept.append(session_id)
+                if self.ttl_seconds and now - updated_at > self.ttl_seconds and session_id not in self._released:
+                    report['freed_bytes'] += self._release(session_id)
+                    report['released'] += 1
+                    self._released.add(session_id)
+
+            if self.ttl_seconds:
+                idle = [s for s in sessions if now - s[1] > self.ttl_seconds]
+                for session_id, _ in idle:
+                    evict(session_id, 'idle')
+                sessions = sessions[len(idle):]
+
+            if self.max_sessions and len(sessions) > self.max_sessions:
+                excess = len(sessions) - self.max_sessions
+                for session_id, _ in sessions[:excess]:
+                    evict(session_id, 'over_cap')
+                sessions = sessions[excess:]
+
+            # Folders whose session is gone (evicted by another worker's store, crashed mid-request...)
+            known = {sid for sid, _ in sessions} | set(kept)
+            usage = {}
+            if os.path.isdir(self.upload_folder):
+                for name in os.listdir(self.upload_folder):
+                    path = os.path.join(self.upload_folder, name)
+                    if not os.path.isdir(path):
+                        continue
+                    size, newest = _folder_usage(path)
+                    if name not in known and now - newest > ORPHAN_GRACE_SECONDS:
+                        shutil.rmtree(path, ignore_errors=True)
+                        report['orphans'] += 1
+                        report['freed_bytes'] += size
+                        metrics.inc('intake_janitor_evictions_total', reason='orphan')
+                    else:
+                        usage[name] = size
+
+            if self.max_upload_bytes:
+                # Completed sessions' uploads were removed with their analysis, or are released above
+                total = sum(usage.values())
+                for entry in list(sessions):
+                    if total <= self.max_upload_bytes:
+                        break
+                    if usage.get(entry[0]):
+                        total -= usage.pop(entry[0])
+                        evict(entry[0], 'over_quota')
+                        sessions.remove(entry)
+
+            if report['freed_bytes']:
+                metrics.inc('intake_janitor_reclaimed_bytes_total', report['freed_bytes'])
+            report.update(sessions=len(sessions), completed_sessions=len(kept), upload_bytes=sum(usage.values()),
+                          seconds=round(time.time() - now, 3), at=now)
+            if report['idle'] or report['over_cap'] or report['over_quota'] or report['expired'] or report['orphans']:
+                print(f"[JANITOR] Evicted {report['idle']} idle, {report['over_cap']} over cap, "
+                      f"{report['over_quota']} over quota and {report['expired']} expired completed sessions "
+                      f"and {report['orphans']} orphan folders; freed {report['freed_bytes'] / 1e6:.1f} MB, "
+                      f"{report['sessions']} sessions in progress and {len(kept)} completed left")
+            self.last_report = report
+            return report
@@ -0,0 +1,336 @@
+"""
+Prometheus-style metrics.
+Counters and histograms recorded by timing hooks in the services, rendered in
+the Prometheus text exposition format. Each gunicorn worker periodically writes
+a snapshot of its metrics to a shared directory; /metrics merges the snapshots
+of all live workers, so a scrape sees the same totals whichever worker serves it.
+The counts of workers that have exited (restarts, scale-down) are folded into a
+retained total, so counters never go backwards.
+"""
+
+import atexit
+import bisect
+import fcntl
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SNAPSHOT_INTERVAL = 5.0
+
+# Summed counters and histograms of exited workers, next to the worker snapshots
+RETIRED_FILENAME = 'retired.json'
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+AUDIO_SECONDS_BUCKETS = (1, 5, 15, 30, 60, 120, 180, 300)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'intake_upload_bytes': ('histogram', "Size of uploaded recordings", BYTES_BUCKETS),
+    'intake_ffmpeg_seconds': ('histogram', "Wall time of ffmpeg audio extraction", SECONDS_BUCKETS),
+    'intake_whisper_audio_seconds': ('histogram', "Seconds of audio sent to Whisper", AUDIO_SECONDS_BUCKETS),
+    'intake_whisper_wall_seconds': ('histogram', "Wall time of Whisper inference", SECONDS_BUCKETS),
+    'intake_whisper_realtime_factor': ('histogram', "Whisper wall seconds per second of audio", RATIO_BUCKETS),
+    'intake_claude_seconds': ('histogram', "Latency of Claude analysis requests", SECONDS_BUCKETS),
+    'intake_claude_first_token_seconds': ('histogram', "Time to the first output of streamed Claude requests", SECONDS_BUCKETS),
+    'intake_claude_prompt_tokens': ('histogram', "Input tokens per Claude request, cached or not", TOKEN_BUCKETS),
+    'intake_claude_response_tokens': ('histogram', "Output tokens per Claude request", TOKEN_BUCKETS),
+    'intake_queue_wait_seconds': ('histogram', "Time from upload to the start of Whisper inference", SECONDS_BUCKETS),
+    'intake_queue_rejections_total': ('counter', "Transcription requests refused because the queue was full", None),
+    'intake_claude_tokens_total': ('counter', "Claude tokens by kind (input, cache_read, cache_write, output)", None),
+    'intake_cache_requests_total': ('counter', "Cache lookups by cache and result", None),
+    'intake_silent_recordings_total': ('counter', "Recordings skipped by the silence pre-pass", None),
+    'intake_errors_total': ('counter', "Failures by pipeline stage", None),
+    'intake_speculative_analyses_total': ('counter', "Speculative analyses by outcome (used, miss, timeout, stale, error)", None),
+    'intake_analysis_fallbacks_total': ('counter', "Analyses served by the local keyword matcher after Claude failed", None),
+    'intake_janitor_evictions_total': ('counter', "Sessions and orphan upload folders removed by the janitor", None),
+    'intake_janitor_reclaimed_bytes_total': ('counter', "Upload bytes deleted by the janitor", None),
+    'intake_event_streams_refused_total': ('counter', "Progress streams answered 204 because SSE_MAX_STREAMS were open", None),
+    'intake_queued_jobs': ('gauge', "Transcription jobs queued or running", None),
+    'intake_event_streams': ('gauge', "Open Server-Sent Events progress streams", None),
+    'intake_active_sessions': ('gauge', "Sessions in the session store", None),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_gauge_callbacks = {}  # name -> callable returning this worker's value
+_directory = None
+_writer_pid = None
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def configure(directory: str = None):
+    """Share metrics between worker processes through snapshot files in `directory`."""
+    global _directory
+    _directory = directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _ensure_writer()
+
+
+def observe(name: str, value: float, **labels):
+    """Record one histogram observation."""
+    buckets = METRICS[name][2]
+    key = (name, _labels_key(labels))
+    with _lock:
+        data = _histograms.get(key)
+        if data is None:
+            data = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        data[bisect.bisect_left(buckets, value)] += 1
+        data[-1] += value
+    _ensure_writer()
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the wall time of a block in histogram `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator form of timer()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_gauge(name: str, callback):
+    """Report this worker's value of a gauge (summed across workers) from a callback."""
+    _gauge_callbacks[name] = callback
+
+
+def _snapshot() -> dict:
+    gauges = []
+    for name, callback in _gauge_callbacks.items():
+        try:
+            gauges.append([name, [], callback()])
+        except Exception as e:
+            print(f"[METRICS] Gauge {name} failed: {e}")
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(data)] for (name, labels), data in _histograms.items()],
+            'gauges': gauges
+        }
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(_directory, f"worker-{pid}.json")
+
+
+def _write_snapshot():
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _write_final_snapshot():
+    # Counts since the last periodic write would otherwise be lost when the worker exits
+    if _directory and _writer_pid == os.getpid():
+        try:
+            _write_snapshot()
+        except OSError:
+            pass
+
+
+def _ensure_writer():
+    global _writer_pid
+    if not _directory or _writer_pid == os.getpid():
+        return
+    _writer_pid = os.getpid()
+    atexit.register(_write_final_snapshot)
+
+    def write_forever():
+        while True:
+            try:
+                _write_snapshot()
+            except OSError as e:
+                print(f"[METRICS] Could not write snapshot: {e}")
+            time.sleep(SNAPSHOT_INTERVAL)
+
+    threading.Thread(target=write_forever, name="metrics-writer", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshot(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(counters: dict, histograms: dict, snapshot: dict):
+    """Add a snapshot's counters and histograms into `counters` / `histograms` (keyed by (name, labels))."""
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, data in snapshot['histograms']:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        merged = histograms.setdefault(key, [0] * len(data))
+        for i, value in enumerate(data):
+            merged[i] += value
+
+
+def _retire(retired_path: str, retired: dict, paths: list) -> dict:
+    """Fold exited workers' snapshots into the retired totals, write them, and remove the snapshots."""
+    counters, histograms = {}, {}
+    _merge(counters, histograms, retired)
+    for path in paths:
+        snapshot = _read_snapshot(path)
+        if snapshot is not None:
+            _merge(counters, histograms, snapshot)
+    retired = {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), data] for (name, labels), data in histograms.items()],
+        'gauges': []
+    }
+    tmp_path = f"{retired_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(retired, f)
+    os.replace(tmp_path, retired_path)
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return retired
+
+
+def _other_workers() -> list:
+    """
+    Snapshots written by other live workers, plus the retired totals of exited ones.
+
+    An exited worker's snapshot is folded into the retired totals and removed. The
+    directory is locked meanwhile, so no scrape sees a worker's counts twice or not at all.
+    """
+    snapshots = []
+    if not _directory or not os.path.isdir(_directory):
+        return snapshots
+    with open(os.path.join(_directory, 'retired.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = []
+        for filename in os.listdir(_directory):
+            if not (filename.startswith('worker-') and filename.endswith('.json')):
+                continue
+            try:
+                pid = int(filename[len('worker-'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            path = os.path.join(_directory, filename)
+            if not _pid_alive(pid):
+                exited.append(path)
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        retired_path = os.path.join(_directory, RETIRED_FILENAME)
+        retired = _read_snapshot(retired_path)
+        if exited:
+            try:
+                retired = _retire(retired_path, retired or {'counters': [], 'histograms': [], 'gauges': []}, exited)
+            except OSError as e:
+                print(f"[METRICS] Could not retire exited workers' snapshots: {e}")
+        if retired is not None:
+            snapshots.append(retired)
+    return snapshots
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(gauges: dict = None) -> str:
+    """
+    Render all workers' metrics in the Prometheus text format.
+
+    Args:
+        gauges: Process-independent gauge values to report as-is (e.g. from the shared session store)
+    """
+    counters, histograms, worker_gauges = {}, {}, {}
+    for snapshot in [_snapshot()] + _other_workers():
+        _merge(counters, histograms, snapshot)
+        for name, _, value in snapshot['gauges']:
+            worker_gauges[name] = worker_gauges.get(name, 0) + value
+    worker_gauges.update(gauges or {})
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == 'counter':
+            series = [(labels, value) for (n, labels), value in sorted(counters.items()) if n == name]
+        elif kind == 'histogram':
+            series = [(labels, data) for (n, labels), data in sorted(histograms.items()) if n == name]
+        else:
+            series = [((), worker_gauges[name])] if name in worker_gauges else []
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _reset_after_fork():
+    # The parent's counts stay with the parent; each worker reports only its own
+    global _lock
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,377 @@
+"""
+Background transcription pipeline.
+Runs extract -> transcribe jobs as soon as a recording is uploaded, so the work
+overlaps with the patient recording their next answer. Extraction (an ffmpeg
+subprocess) and inference run in separate pools, so several answers decode at
+once while Whisper works through the ones already extracted.
+
+Admission is bounded: past queue_limit waiting jobs, admit() refuses with
+QueueFull (a queue position and a retry delay) instead of letting work pile up.
+Inference is scheduled fairly rather than first-come: a session's second and
+third answers wait behind other sessions' first ones, and among equals the
+session with the fewest answers left to transcribe goes first. Fairness comes
+first on purpose (see fair_pick): ranking by answers left first would let
+sessions near completion hold back every new patient's first answer.
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services import metrics
+
+# One job per (session_id, question_id); a re-recording supersedes the old job
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+_extract_executor = None
+_max_workers = 1
+_extract_workers = 3
+
+# Admission control: queued jobs allowed (0 = unbounded), and the refused
+# (session_id, question_id)s in the order they first asked, so slots that
+# free up go to whoever has waited longest
+_queue_limit = 0
+_waitlist = {}  # key -> last time it asked
+WAITLIST_EXPIRY_SECONDS = 120
+
+# Extracted jobs waiting for an inference thread, picked by _next_ready()
+_ready = []
+_ready_cond = threading.Condition(_jobs_lock)
+_inference_pid = None
+
+# Moving average of inference time, for Retry-After estimates (guarded by _jobs_lock)
+_average_seconds = 15.0
+
+
+class QueueFull(RuntimeError):
+    """The transcription queue is saturated; `job` is a 'waiting' record with position and retry_after."""
+
+    def __init__(self, job: dict):
+        super().__init__(f"Transcription queue is full (position {job['position']})")
+        self.job = job
+        self.position = job['position']
+        self.retry_after = job['retry_after']
+
+
+def configure(max_workers: int = 1, extract_workers: int = 3, queue_limit: int = 0):
+    """
+    Size the worker pools (call before the first submit).
+
+    Args:
+        max_workers: Inference threads; match the Whisper model's num_workers
+        extract_workers: Concurrent ffmpeg extractions
+        queue_limit: Jobs allowed to wait for a worker before admit() refuses (0 = unbounded)
+    """
+    global _max_workers, _extract_workers, _queue_limit
+    _max_workers = max(1, int(max_workers))
+    _extract_workers = max(1, int(extract_workers))
+    _queue_limit = max(0, int(queue_limit))
+
+
+def _start_inference_threads():
+    """Start this process's inference threads (once per process; call with _jobs_lock held)."""
+    global _inference_pid
+    if _inference_pid == os.getpid():
+        return
+    _inference_pid = os.getpid()
+    for i in range(_max_workers):
+        threading.Thread(target=_inference_loop, name=f"pipeline-{i}", daemon=True).start()
+
+
+def _next_ready():
+    """
+    Pop the ready job to run next (call with _jobs_lock held).
+
+    Ordered by how many of its own session's jobs went (or are going) ahead of it:
+    those that reached Whisper after it was submitted, plus older ready ones. Ties go
+    to the session with the fewest answers left to transcribe, then to the oldest job.
+    """
+    best = fair_pick([entry[0] for entry in _ready], list(_jobs.values()))
+    return _ready.pop(best)
+
+
+def fair_pick(ready: list, jobs: list) -> int:
+    """
+    Index of the job in `ready` (oldest first) that should reach Whisper next.
+
+    Jobs are ranked by (served, remaining, submitted_at). served counts the session's
+    jobs that reached Whisper after this one was submitted, plus its older ready
+    ones, so no session gets a second answer in while another waits on its first.
+    Only among jobs equally served does the session with the fewest answers left
+    (closest to completion) go first. Ranking by remaining first would finish nearly
+    done sessions sooner, but a steady stream of them could starve new patients.
+
+    Args:
+        ready: Jobs waiting for inference, in submission order
+        jobs: Every known job, for each session's served and done counts (dicts with
+            session_id, status, answers, submitted_at and inference_started_at)
+    """
+    # One pass over all jobs: each session's inference start times (sorted) and done count
+    starts, done = {}, {}
+    for other in jobs:
+        session_id = other['session_id']
+        if other['inference_started_at']:
+            starts.setdefault(session_id, []).append(other['inference_started_at'])
+        if other['status'] == 'done':
+            done[session_id] = done.get(session_id, 0) + 1
+    for times in starts.values():
+        times.sort()
+
+    ahead = {}
+    best, best_key = 0, None
+    for index, job in enumerate(ready):
+        session_id = job['session_id']
+        times = starts.get(session_id, ())
+        served = len(times) - bisect.bisect_left(times, job['submitted_at'])
+        key = (served + ahead.get(session_id, 0), job['answers'] - done.get(session_id, 0), job['submitted_at'])
+        if best_key is None or key < best_key:
+            best, best_key = index, key
+        ahead[session_id] = ahead.get(session_id, 0) + 1
+    return best
+
+
+def _inference_loop():
+    while True:
+        with _ready_cond:
+            while not _ready:
+                _ready_cond.wait()
+            job, run, args = _next_ready()
+            # Mark it taken before releasing the lock, so the next pick counts it
+            job['inference_started_at'] = time.time()
+        try:
+            run(*args)
+        except Exception as e:
+            print(f"[PIPELINE] Inference thread error: {e}")
+
+
+def _schedule(job: dict, run, *args):
+    """Hand a job to the inference threads."""
+    with _ready_cond:
+        _start_inference_threads()
+        # Ready entries keep submission order, which _next_ready relies on
+        _ready.append((job, run, args))
+        _ready.sort(key=lambda entry: entry[0]['submitted_at'])
+        _ready_cond.notify()
+
+
+def _get_extract_executor():
+    """Get or create the extraction pool."""
+    global _extract_executor
+    with _jobs_lock:
+        if _extract_executor is None:
+            _extract_executor = ThreadPoolExecutor(max_workers=_extract_workers, thread_name_prefix="extract")
+        return _extract_executor
+
+
+def _new_job(session_id: str, question_id: int, answers: int = 1) -> dict:
+    return {
+        'job_id': uuid.uuid4().hex,
+        'session_id': session_id,
+        'question_id': question_id,
+        'answers': answers,
+        'status': 'queued',
+        'result': None,
+        'error': None,
+        'submitted_at': time.time(),
+        'started_at': None,
+        'inference_started_at': None,
+        'finished_at': None,
+        'done': threading.Event()
+    }
+
+
+def admit(session_id: str, question_id: int, answers: int = 1, waiting: int = None) -> dict:
+    """
+    Reserve a place in the queue for a question's new job.
+
+    The job is registered (superseding the question's previous one) but does not run
+    until it is passed to submit(). A refused request also drops the previous job,
+    since it belongs to a recording that has been replaced.
+
+    Args:
+        session_id: Patient session the recording belongs to
+        question_id: Question the recording answers
+        answers: Answers the session needs in all (sessions with fewer left go first)
+        waiting: Jobs waiting in an outside queue (the job spool) to count instead of
+            this process's; the job is then only admitted, not registered here
+
+    Returns:
+        The job record to pass to submit()
+
+    Raises:
+        QueueFull: If queue_limit jobs are already waiting, or earlier refused
+            requests are still ahead in line
+    """
+    key = (session_id, question_id)
+    now = time.time()
+    external = waiting is not None
+    with _jobs_lock:
+        for stale in [k for k, seen in _waitlist.items() if now - seen > WAITLIST_EXPIRY_SECONDS]:
+            del _waitlist[stale]
+        if _queue_limit:
+            # Waiting = not yet handed to Whisper (queued, or extracted and ready)
+            if not external:
+                waiting = sum(1 for k, job in _jobs.items() if k != key and job['status'] in ('queued', 'running')
+                              and job['inference_started_at'] is None)
+            ahead = list(_waitlist).index(key) if key in _waitlist else len(_waitlist)
+            if waiting + ahead >= _queue_limit:
+                _waitlist[key] = now  # keeps its place in line
+                _jobs.pop(key, None)
+                job = _new_job(session_id, question_id, answers)
+                job['status'] = 'waiting'
+                # A slot opens about every average/workers seconds; this request needs ahead + 1 of them
+                job['position'] = waiting + ahead + 1
+                job['retry_after'] = max(1, math.ceil((ahead + 1) * _average_seconds / _max_workers))
+                metrics.inc('intake_queue_rejections_total')
+                raise QueueFull(job)
+        _waitlist.pop(key, None)
+        job = _new_job(session_id, question_id, answers)
+        if not external:
+            _jobs[key] = job
+        return job
+
+
+def submit(session_id: str, question_id: int, work, on_complete=None, on_error=None, prepare=None,
+           job: dict = None) -> dict:
+    """
+    Queue a transcription job for a question.
+
+    Args:
+        session_id: Patient session the recording belongs to
+        question_id: Question the recording answers
+        work: Callable that performs transcription and returns the text; receives
+            prepare's result when prepare is given
+        on_complete: Called with the result if the job is still current when it finishes
+        on_error: Called with the exception if the job is still current when it fails
+        prepare: Optional callable run first in the extraction pool (e.g. ffmpeg decode)
+        job: Record from admit() (a new one is registered without admission control if omitted)
+
+    Returns:
+        The job record
+    """
+    if job is None:
+        job = _new_job(session_id, question_id)
+        with _jobs_lock:
+            _jobs[(session_id, question_id)] = job
+
+    def fail(e, stage):
+        metrics.inc('intake_errors_total', stage=stage)
+        job['error'] = str(e)
+        job['status'] = 'error'
+        job['finished_at'] = time.time()
+        print(f"[PIPELINE] Job {job['job_id']} (q{question_id}) failed: {e}")
+        if on_error and is_current(job):
+            on_error(e)
+
+    def start():
+        if not is_current(job):
+            job['status'] = 'superseded'
+            job['done'].set()
+            return False
+        if job['started_at'] is None:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+        return True
+
+    def extract():
+        if not start():
+            return
+        try:
+            prepared = prepare()
+        except Exception as e:
+            try:
+                fail(e, 'extract')
+            finally:
+                job['done'].set()
+            return
+        _schedule(job, run, prepared)
+
+    def run(*prepared):
+        global _average_seconds
+        if not start():
+            return
+        job['inference_started_at'] = job['inference_started_at'] or time.time()
+        metrics.observe('intake_queue_wait_seconds', job['inference_started_at'] - job['submitted_at'])
+        try:
+            result = work(*prepared)
+        except Exception as e:
+            fail(e, 'transcribe')
+        else:
+            with _jobs_lock:
+                _average_seconds = 0.8 * _average_seconds + 0.2 * (time.time() - job['inference_started_at'])
+            job['result'] = result
+            job['status'] = 'done'
+            job['finished_at'] = time.time()
+            print(f"[PIPELINE] Job {job['job_id']} (q{question_id}) finished in "
+                  f"{job['finished_at'] - job['started_at']:.1f}s "
+                  f"(queued {job['started_at'] - job['submitted_at']:.1f}s)")
+            if on_complete and is_current(job):
+                on_complete(result)
+        finally:
+            job['done'].set()
+
+    if prepare is not None:
+        _get_extract_executor().submit(extract)
+    else:
+        _schedule(job, run)
+    return job
+
+
+def record_result(session_id: str, question_id: int, result) -> dict:
+    """Register an already-finished job for a question (e.g. a transcription served from cache)."""
+    job = _new_job(session_id, question_id)
+    job.update(status='done', result=result, started_at=job['submitted_at'], finished_at=job['submitted_at'])
+    job['done'].set()
+    with _jobs_lock:
+        _jobs[(session_id, question_id)] = job
+    return job
+
+
+def queue_depth() -> int:
+    """Number of this process's current jobs that are queued or running."""
+    with _jobs_lock:
+        return sum(1 for job in _jobs.values() if job['status'] in ('queued', 'running'))
+
+
+def is_current(job: dict) -> bool:
+    """True if the job has not been superseded by a newer upload or discarded."""
+    with _jobs_lock:
+        return _jobs.get((job['session_id'], job['question_id'])) is job
+
+
+def get_job(session_id: str, question_id: int):
+    """Get the current job for a question, or None."""
+    with _jobs_lock:
+        return _jobs.get((session_id, question_id))
+
+
+def wait(job: dict, timeout: float = None) -> bool:
+    """Block until the job finishes or the timeout expires. Returns True if finished."""
+    return job['done'].wait(timeout)
+
+
+def job_status(job: dict) -> dict:
+    """JSON-safe summary of a job (with position and retry_after for one refused by admit())."""
+    status = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'error': job['error'],
+        'queued_seconds': round((job['started_at'] or time.time()) - job['submitted_at'], 2)
+    }
+    if job['status'] == 'waiting':
+        status.update(position=job['position'], retry_after=job['retry_after'])
+    return status
+
+
+def discard(session_id: str, question_id: int = None):
+    """Forget jobs for a session (or one question); running work finishes but is ignored."""
+    with _jobs_lock:
+        for key in [k for k in _jobs if k[0] == session_id and (question_id is None or k[1] == question_id)]:
+            del _jobs[key]
+        for key in [k for k in _waitlist if k[0] == session_id and (question_id is None or k[1] == question_id)]:
+            del _waitlist[key]
@@ -0,0 +1,264 @@
+"""
+Bulk re-analysis of stored sessions.
+
+    python -m services.reanalyze                                  # dry run: report what would change
+    python -m services.reanalyze --write --concurrency 8 --rpm 50
+    python -m services.reanalyze --model claude-opus-4-20250514 --out reanalysis/opus
+
+Reads transcripts from the SQLite session store and re-runs the analysis with the
+current SYMPTOM_CATEGORIES and CLAUDE_MODEL (or --model) at bounded concurrency
+and request rate. Sessions whose inputs hash to their stored analysis_key are
+skipped; the hash uses the categories the session was analyzed with, so sessions
+analyzed with an ANALYSIS_SHORTLIST shortlist are only re-run if those changed. Every finished session is appended to a checkpoint file in --out, so an
+interrupted run resumes where it stopped, and a dry run's results can be written
+afterwards with --write without calling Claude again. A report of category
+changes is written next to the checkpoint.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from config import Config
+from services.session_store import create_store
+from services.symptom_analyzer import (NO_SPEECH_PLACEHOLDER, analysis_cache_key, analyze_symptoms_async,
+                                       configure_client)
+
+
+class RateLimiter:
+    """Spaces request starts evenly to stay under a requests-per-minute budget."""
+
+    def __init__(self, per_minute: float = 0):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def session_transcriptions(session: dict):
+    """The answers an analysis of this session uses (as /api/analyze builds them), or None if incomplete."""
+    required = [1] if session.get('test_mode') else [1, 2, 3]
+    transcriptions = {}
+    for question_id in required:
+        question = session['questions'].get(question_id)
+        if question is None or question['transcription'] is None:
+            return None
+        transcriptions[question_id] = question['transcription'] or NO_SPEECH_PLACEHOLDER
+    return transcriptions
+
+
+def analyzed_categories(session: dict, categories: list) -> list:
+    """The current entries of the categories a session's stored analysis was made with."""
+    ids = session.get('analysis_categories')
+    if ids is None:
+        return categories
+    # A category since removed from the taxonomy is left out, which changes the key
+    by_id = {cat['id']: cat for cat in categories}
+    return [by_id[category_id] for category_id in ids if category_id in by_id]
+
+
+def category_ids(analysis) -> list:
+    return [c.get('category_id') for c in (analysis or {}).get('matched_categories', [])]
+
+
+def compare(before, after) -> dict:
+    """Category changes between two analyses."""
+    old, new = category_ids(before), category_ids(after)
+    return {
+        'before': old,
+        'after': new,
+        'added': [c for c in new if c not in old],
+        'removed': [c for c in old if c not in new],
+        'top_changed': (old[:1] != new[:1])
+    }
+
+
+def load_checkpoint(path: str) -> dict:
+    """session_id -> latest finished record from an earlier run."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if record.get('status') == 'done':
+                records[record['session_id']] = record
+    return records
+
+
+async def run_analyses(jobs: list, model: str, categories: list, concurrency: int, per_minute: float,
+                       checkpoint, store=None) -> list:
+    """
+    Analyze sessions concurrently, appending each result to the checkpoint as it finishes.
+
+    Args:
+        jobs: (session_id, transcriptions, analysis_key, previous_analysis) tuples
+        model: Claude model
+        categories: Symptom taxonomy
+        concurrency: Analyses in flight at once
+        per_minute: Request starts per minute (0 = unlimited)
+        checkpoint: Open text file the JSONL records are appended to
+        store: Session store to write new analyses to (None for a dry run)
+
+    Returns:
+        The records, in completion order
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(per_minute)
+    records = []
+
+    async def analyze(session_id, transcriptions, key, previous):
+        async with semaphore:
+            await limiter.acquire()
+            started = time.perf_counter()
+            try:
+                analysis = await analyze_symptoms_async(transcriptions, Config.CLAUDE_API_KEY, model, categories)
+            except Exception as e:
+                record = {'session_id': session_id, 'status': 'error', 'error': str(e)}
+            else:
+                record = {'session_id': session_id, 'status': 'done', 'analysis_key': key,
+                          'seconds': round(time.perf_counter() - started, 2), 'analysis': analysis,
+                          **compare(previous, analysis)}
+                if store is not None:
+                    store.update(session_id, analysis=analysis, analysis_key=key,
+                                 analysis_categories=[cat['id'] for cat in categories])
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            records.append(record)
+            status = record.get('error') or f"{', '.join(record['after']) or 'no categories'}"
+            print(f"[{len(records)}/{len(jobs)}] {session_id}: {status}", file=sys.stderr)
+
+    await asyncio.gather(*(analyze(*job) for job in jobs))
+    return records
+
+
+def build_report(records: list, counts: dict, meta: dict) -> dict:
+    """Totals, per-category before/after counts and the sessions whose categories changed."""
+    done = [r for r in records if r['status'] == 'done']
+    categories = {}
+    for record in done:
+        for key, ids in (('before', record['before']), ('after', record['after']),
+                         ('gained', record['added']), ('lost', record['removed'])):
+            for category_id in ids:
+                entry = categories.setdefault(category_id, {'before': 0, 'after': 0, 'gained': 0, 'lost': 0})
+                entry[key] += 1
+    changed = [r for r in done if r['added'] or r['removed'] or r['top_changed']]
+    return {
+        'meta': meta,
+        'totals': dict(counts, analyzed=len(done), errors=len(records) - len(done), changed=len(changed),
+                       top_changed=sum(1 for r in done if r['top_changed'])),
+        'categories': dict(sorted(categories.items())),
+        'changed_sessions': [{k: r[k] for k in ('session_id', 'before', 'after', 'added', 'removed')}
+                             for r in changed]
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-run symptom analysis over stored sessions")
+    parser.add_argument('--db', default=Config.SESSION_DB_PATH, help="SQLite session store")
+    parser.add_argument('--model', default=Config.CLAUDE_MODEL, help="Claude model")
+    parser.add_argument('--concurrency', type=int, default=4, help="analyses in flight at once")
+    parser.add_argument('--rpm', type=float, default=50, help="request starts per minute (0 = unlimited)")
+    parser.add_argument('--limit', type=int, help="analyze at most this many sessions")
+    parser.add_argument('--out', default='reanalysis', help="directory for checkpoint.jsonl and report.json")
+    parser.add_argument('--write', action='store_true', help="store the new analyses in the session store")
+    parser.add_argument('--force', action='store_true', help="re-analyze sessions even if their inputs are unchanged")
+    parser.add_argument('--verbose', action='store_true', help="show the analyzer's debug output")
+    args = parser.parse_args(argv)
+
+    if not Config.CLAUDE_API_KEY:
+        parser.error("CLAUDE_API_KEY is not set")
+    if not os.path.exists(args.db):
+        parser.error(f"session store not found: {args.db}")
+
+    configure_client(
+        max_connections=max(args.concurrency, 1),
+        max_keepalive_connections=max(args.concurrency, 1),
+        timeout=Config.CLAUDE_TIMEOUT,
+        connect_timeout=Config.CLAUDE_CONNECT_TIMEOUT,
+        max_retries=Config.CLAUDE_MAX_RETRIES,
+        base_url=Config.CLAUDE_BASE_URL
+    )
+    store = create_store('sqlite', args.db)
+    categories = Config.SYMPTOM_CATEGORIES
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = os.path.join(args.out, 'checkpoint.jsonl')
+    finished = load_checkpoint(checkpoint_path)
+
+    counts = {'sessions': 0, 'unanalyzed': 0, 'unchanged': 0, 'resumed': 0}
+    jobs, records = [], []
+    for session_id, _ in sorted(store.list_sessions(), key=lambda s: s[1]):
+        session = store.get(session_id)
+        transcriptions = session_transcriptions(session) if session else None
+        if session is None or session.get('analysis') is None or transcriptions is None:
+            counts['unanalyzed'] += 1
+            continue
+        counts['sessions'] += 1
+        key = analysis_cache_key(transcriptions, args.model, categories)
+        stored_inputs = analysis_cache_key(transcriptions, args.model, analyzed_categories(session, categories))
+        if session.get('analysis_key') in (key, stored_inputs) and not args.force:
+            counts['unchanged'] += 1
+            continue
+        previous = finished.get(session_id)
+        if previous and previous['analysis_key'] == key and not args.force:
+            # Finished by an earlier run: reuse it (and store it now if that run was a dry run)
+            counts['resumed'] += 1
+            records.append(previous)
+            if args.write:
+                store.update(session_id, analysis=previous['analysis'], analysis_key=key,
+                             analysis_categories=[cat['id'] for cat in categories])
+            continue
+        jobs.append((session_id, transcriptions, key, session['analysis']))
+    if args.limit is not None:
+        jobs = jobs[:args.limit]
+
+    print(f"{counts['sessions']} analyzed sessions: {counts['unchanged']} unchanged, "
+          f"{counts['resumed']} from checkpoint, {len(jobs)} to analyze with {args.model} "
+          f"({'writing' if args.write else 'dry run'})")
+    started = time.strftime('%Y-%m-%dT%H:%M:%S')
+    # The analyzer prints debug lines per call; progress goes to stderr
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with open(checkpoint_path, 'a') as checkpoint, quiet:
+        records += asyncio.run(run_analyses(jobs, args.model, categories, args.concurrency, args.rpm,
+                                            checkpoint, store if args.write else None))
+
+    report = build_report(records, counts, {
+        'model': args.model,
+        'categories': [cat['id'] for cat in categories],
+        'written': args.write,
+        'started': started,
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S')
+    })
+    report_path = os.path.join(args.out, 'report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    totals = report['totals']
+    print(f"\n{totals['analyzed']} analyzed, {totals['errors']} failed, {totals['changed']} changed "
+          f"({totals['top_changed']} with a different top category)")
+    print(f"{'category':28s} {'before':>7s} {'after':>7s} {'gained':>7s} {'lost':>7s}")
+    for category_id, entry in report['categories'].items():
+        print(f"{category_id:28s} {entry['before']:7d} {entry['after']:7d} {entry['gained']:7d} {entry['lost']:7d}")
+    print(f"\nReport written to {report_path}")
+    return 1 if totals['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Session storage service.
+Keeps patient sessions either in process memory (single worker) or in a local
+SQLite database in WAL mode, which lets several gunicorn workers on one host
+share sessions without an outside service.
+
+Sessions are returned as plain dict snapshots; all changes go through
+update()/update_question() so they are applied atomically in either backend.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Columns with their own storage; any other field goes into the row's JSON 'extra'
+SESSION_COLUMNS = ('created_at', 'status', 'test_mode', 'analysis')
+QUESTION_COLUMNS = ('recording_id', 'video_path', 'audio_path', 'transcription',
+                    'recorded_at', 'transcribed_at', 'job_status', 'job_error')
+
+MAX_EVENTS_PER_SESSION = 500
+
+
+def _new_question(question_id):
+    question = {'question_id': question_id}
+    question.update({column: None for column in QUESTION_COLUMNS})
+    return question
+
+
+class MemorySessionStore:
+    """Process-local session store (only valid with a single worker process)."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._events = {}
+        self._next_event_id = 1
+        self._lock = threading.RLock()
+
+    def create(self, session_id: str, created_at: str, question_ids, test_mode: bool = False) -> dict:
+        with self._lock:
+            self._sessions[session_id] = {
+                'session_id': session_id,
+                'created_at': created_at,
+                'updated_at': time.time(),
+                'status': 'in_progress',
+                'test_mode': test_mode,
+                'analysis': None,
+                'questions': {qid: _new_question(qid) for qid in question_ids}
+            }
+            return copy.deepcopy(self._sessions[session_id])
+
+    def get(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return copy.deepcopy(session) if session else None
+
+    def update(self, session_id: str, expect: dict = None, **fields) -> bool:
+        """Update session-level fields; with `expect`, only if those fields currently match."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            if expect and any(session.get(k) != v for k, v in expect.items()):
+                return False
+            session.update(fields)
+            session['updated_at'] = time.time()
+            return True
+
+    def update_question(self, session_id: str, question_id: int, expect: dict = None, **fields) -> bool:
+        """Update one question's fields; with `expect`, only if those fields currently match."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or question_id not in session['questions']:
+                return False
+            question = session['questions'][question_id]
+            if expect and any(question.get(k) != v for k, v in expect.items()):
+                return False
+            question.update(fields)
+            session['updated_at'] = time.time()
+            return True
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._events.pop(session_id, None)
+
+    def list_sessions(self, status: str = None) -> list:
+        """[(session_id, updated_at)] for every stored session (only those in `status` if given)."""
+        with self._lock:
+            return [(sid, s['updated_at']) for sid, s in self._sessions.items()
+                    if status is None or s['status'] == status]
+
+    def append_event(self, session_id: str, event: str, data: dict) -> int:
+        with self._lock:
+            event_id = self._next_event_id
+            self._next_event_id += 1
+            log = self._events.setdefault(session_id, [])
+            log.append((event_id, event, data))
+            del log[:-MAX_EVENTS_PER_SESSION]
+            return event_id
+
+    def events_since(self, session_id: str, last_id: int = 0) -> list:
+        with self._lock:
+            return [e for e in self._events.get(session_id, []) if e[0] > last_id]
+
+    def clear_events(self, session_id: str):
+        with self._lock:
+            self._events.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """SQLite (WAL) session store shared by all worker processes on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                test_mode INTEGER NOT NULL DEFAULT 0,
+                analysis TEXT,
+                extra TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE TABLE IF NOT EXISTS questions (
+                session_id TEXT NOT NULL REFERENCES sessions(session_id) ON DELETE CASCADE,
+                question_id INTEGER NOT NULL,
+                recording_id TEXT,
+                video_path TEXT,
+                audio_path TEXT,
+                transcription TEXT,
+                recorded_at TEXT,
+                transcribed_at TEXT,
+                job_status TEXT,
+                job_error TEXT,
+                extra TEXT NOT NULL DEFAULT '{}',
+                PRIMARY KEY (session_id, question_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS events (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_by_session ON events (session_id, event_id);
+        """)
+
+    def _connect(self):
+        # One connection per thread, re-opened after fork (gunicorn --preload)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def create(self, session_id: str, created_at: str, question_ids, test_mode: bool = False) -> dict:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, created_at, updated_at, status, test_mode) VALUES (?, ?, ?, ?, ?)",
+                (session_id, created_at, time.time(), 'in_progress', int(test_mode)))
+            conn.executemany(
+                "INSERT INTO questions (session_id, question_id) VALUES (?, ?)",
+                [(session_id, qid) for qid in question_ids])
+        return self.get(session_id)
+
+    def get(self, session_id: str):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        session = json.loads(row['extra'])
+        session.update({
+            'session_id': row['session_id'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'status': row['status'],
+            'test_mode': bool(row['test_mode']),
+            'analysis': json.loads(row['analysis']) if row['analysis'] else None,
+            'questions': {}
+        })
+        for q in conn.execute("SELECT * FROM questions WHERE session_id = ? ORDER BY question_id", (session_id,)):
+            question = json.loads(q['extra'])
+            question['question_id'] = q['question_id']
+            question.update({column: q[column] for column in QUESTION_COLUMNS})
+            session['questions'][q['question_id']] = question
+        return session
+
+    def update(self, session_id: str, expect: dict = None, **fields) -> bool:
+        """Update session-level fields; with `expect`, only if those fields currently match."""
+        columns = {k: v for k, v in fields.items() if k in SESSION_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in SESSION_COLUMNS}
+        if 'analysis' in columns:
+            columns['analysis'] = json.dumps(columns['analysis']) if columns['analysis'] is not None else None
+        if 'test_mode' in columns:
+            columns['test_mode'] = int(columns['test_mode'])
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return False
+            if expect:
+                current = dict(json.loads(row['extra']), **{c: row[c] for c in SESSION_COLUMNS})
+                current.update(analysis=json.loads(row['analysis']) if row['analysis'] else None,
+                               test_mode=bool(row['test_mode']))
+                if any(current.get(k) != v for k, v in expect.items()):
+                    return False
+            if extra:
+                columns['extra'] = json.dumps(dict(json.loads(row['extra']), **extra))
+            columns['updated_at'] = time.time()
+            assignments = ", ".join(f"{k} = ?" for k in columns)
+            conn.execute(f"UPDATE sessions SET {assignments} WHERE session_id = ?",
+                         (*columns.values(), session_id))
+        return True
+
+    def update_question(self, session_id: str, question_id: int, expect: dict = None, **fields) -> bool:
+        """Update one question's fields; with `expect`, only if those fields currently match."""
+        columns = {k: v for k, v in fields.items() if k in QUESTION_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in QUESTION_COLUMNS}
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM questions WHERE session_id = ? AND question_id = ?",
+                               (session_id, question_id)).fetchone()
+            if row is None:
+                return False
+            current = dict(json.loads(row['extra']), **{c: row[c] for c in QUESTION_COLUMNS})
+            if expect and any(current.get(k) != v for k, v in expect.items()):
+                return False
+            if extra:
+                columns['extra'] = json.dumps(dict(json.loads(row['extra']), **extra))
+            if columns:
+                assignments = ", ".join(f"{k} = ?" for k in columns)
+                conn.execute(f"UPDATE questions SET {assignments} WHERE session_id = ? AND question_id = ?",
+                             (*columns.values(), session_id, question_id))
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+        return True
+
+    def delete(self, session_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+
+    def list_sessions(self, status: str = None) -> list:
+        """[(session_id, updated_at)] for every stored session (only those in `status` if given)."""
+        rows = self._connect().execute("SELECT session_id, updated_at FROM sessions WHERE ? IS NULL OR status = ?",
+                                       (status, status)).fetchall()
+        return [(row['session_id'], row['updated_at']) for row in rows]
+
+    def append_event(self, session_id: str, event: str, data: dict) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute("INSERT INTO events (session_id, event, data) VALUES (?, ?, ?)",
+                                  (session_id, event, json.dumps(data)))
+            # Keep the newest MAX_EVENTS_PER_SESSION, like the memory store
+            conn.execute("DELETE FROM events WHERE session_id = ? AND event_id <= ("
+                         "SELECT event_id FROM events WHERE session_id = ? ORDER BY event_id DESC LIMIT 1 OFFSET ?)",
+                         (session_id, session_id, MAX_EVENTS_PER_SESSION))
+            return cursor.lastrowid
+
+    def events_since(self, session_id: str, last_id: int = 0) -> list:
+        rows = self._connect().execute(
+            "SELECT event_id, event, data FROM events WHERE session_id = ? AND event_id > ? ORDER BY event_id",
+            (session_id, last_id)).fetchall()
+        return [(row['event_id'], row['event'], json.loads(row['data'])) for row in rows]
+
+    def clear_events(self, session_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+
+
+def create_store(backend: str = 'memory', path: str = None):
+    """Build the configured session store ('memory' or 'sqlite')."""
+    if backend == 'sqlite':
+        print(f"[SESSIONS] Using SQLite session store at {path}")
+        return SQLiteSessionStore(path)
+    if backend != 'memory':
+        raise ValueError(f"Unknown session store backend: {backend}")
+    return MemorySessionStore()
@@ -0,0 +1,152 @@
+"""
+Speculative incremental analysis.
+Starts analyzing a session as soon as its first answer is transcribed, while the
+patient is still recording the others. Each later transcription updates the
+earlier draft with a short refinement call (see refine_analysis_async) instead
+of a whole new analysis, so by the time the patient asks for results the
+analysis of all their answers is usually finished or nearly so.
+
+Every run is keyed by the hash of its inputs (analysis_cache_key). A run whose
+answers have changed since it started (the patient re-recorded) is discarded,
+and /api/analyze only uses a result whose key matches the current answers.
+"""
+
+import time
+
+from services import metrics
+
+POLL_SECONDS = 0.25
+
+_store = None
+_options = {'enabled': False}
+
+
+def configure(store, enabled: bool = False, api_key: str = None, model: str = None,
+              symptom_categories: list = None, shortlist: bool = False, run_timeout: float = 120):
+    """
+    Turn speculation on for this process.
+
+    Args:
+        store: Session store the drafts are kept in (shared across workers for SQLite)
+        enabled: Start analyses as answers are transcribed
+        api_key: Anthropic API key
+        model: Claude model (as used by /api/analyze)
+        symptom_categories: Symptom taxonomy
+        shortlist: Send only the categories the local matcher finds (ANALYSIS_SHORTLIST)
+        run_timeout: Longest a run can take (Claude timeouts and retries); one still
+            'running' after that belongs to a process that exited and is not waited for
+    """
+    global _store
+    _store = store
+    _options.update(enabled=enabled and bool(api_key), api_key=api_key, model=model,
+                    symptom_categories=symptom_categories, shortlist=shortlist, run_timeout=run_timeout)
+
+
+def enabled() -> bool:
+    return _options['enabled']
+
+
+def required_questions(session: dict) -> list:
+    """Question IDs the analysis of a session uses."""
+    return [1] if session.get('test_mode') else sorted(session['questions'])
+
+
+def analysis_categories(transcriptions: dict) -> list:
+    """Categories sent to Claude for these answers (all of them, or the matcher's shortlist)."""
+    if _options['shortlist']:
+        from services import symptom_matcher
+        return symptom_matcher.get_matcher().shortlist(transcriptions)
+    return _options['symptom_categories']
+
+
+def on_transcription(session_id: str):
+    """
+    Start a speculative analysis of the session's answers transcribed so far.
+
+    Does nothing if speculation is off, the session is already analyzed, or a run
+    over exactly these answers is done or in flight. Builds on the latest finished draft when its
+    answers are a subset of the current ones and have not changed since.
+    """
+    from services.symptom_analyzer import NO_SPEECH_PLACEHOLDER, analysis_cache_key, submit_analysis, \
+        submit_refinement
+
+    if not _options['enabled']:
+        return
+    session = _store.get(session_id)
+    if session is None or session.get('analysis') is not None:
+        return
+    answers = {}
+    for question_id in required_questions(session):
+        text = session['questions'][question_id]['transcription']
+        if text is not None:
+            answers[question_id] = text or NO_SPEECH_PLACEHOLDER
+    if not answers:
+        return
+
+    model = _options['model']
+    categories = analysis_categories(answers)
+    key = analysis_cache_key(answers, model, categories)
+    previous = session.get('speculation')
+    if previous and previous['key'] == key and (previous['status'] == 'done' or (
+            previous['status'] == 'running' and time.time() - previous['started_at'] < _options['run_timeout'])):
+        return
+
+    run = {'key': key, 'questions': sorted(answers), 'answers': {str(q): t for q, t in answers.items()},
+           'status': 'running', 'analysis': None, 'base': None, 'started_at': time.time()}
+    base = previous if previous and previous['status'] == 'done' else None
+    if base and not (set(base['questions']) < set(answers)
+                     and all(answers[int(q)] == text for q, text in base['answers'].items())):
+        base = None  # covers answers that have been re-recorded since
+    run['base'] = base['questions'] if base else None
+    # Compare-and-set: a concurrent transcription may have started a run (or the analysis been saved) meanwhile
+    if not _store.update(session_id, expect={'speculation': previous, 'analysis': None}, speculation=run):
+        return
+
+    if base:
+        print(f"[SPECULATION] Refining the q{base['questions']} draft with q{run['questions']}")
+        future = submit_refinement(answers, base['analysis'], base['questions'], _options['api_key'], model,
+                                   categories)
+    else:
+        print(f"[SPECULATION] Analyzing q{run['questions']} ahead of the request")
+        future = submit_analysis(answers, _options['api_key'], model, categories)
+
+    def record(f):
+        try:
+            finished = dict(run, status='done', analysis=f.result())
+        except Exception as e:
+            print(f"[SPECULATION] Run over q{run['questions']} failed: {e}")
+            finished = dict(run, status='error', error=str(e))
+        finished['finished_at'] = time.time()
+        # Only if this run is still the session's current one (not replaced by a run over newer answers)
+        if not _store.update(session_id, expect={'speculation': run}, speculation=finished):
+            metrics.inc('intake_speculative_analyses_total', outcome='stale')
+            print(f"[SPECULATION] Discarding the q{run['questions']} run: answers changed")
+            return
+        if finished['status'] == 'error':
+            metrics.inc('intake_speculative_analyses_total', outcome='error')
+
+    future.add_done_callback(record)
+
+
+def result(session_id: str, key: str, timeout: float = 0):
+    """
+    The speculative analysis of exactly the inputs hashed to `key`, or None.
+
+    Waits up to `timeout` seconds while a matching run is still in flight.
+    """
+    if not _options['enabled']:
+        return None
+    deadline = time.time() + timeout
+    while True:
+        session = _store.get(session_id)
+        run = (session or {}).get('speculation')
+        if not run or run['key'] != key or run['status'] == 'error':
+            metrics.inc('intake_speculative_analyses_total', outcome='miss')
+            return None
+        if run['status'] == 'done':
+            metrics.inc('intake_speculative_analyses_total', outcome='used')
+            return run['analysis']
+        if time.time() >= min(deadline, run['started_at'] + _options['run_timeout']):
+            metrics.inc('intake_speculative_analyses_total', outcome='timeout')
+            return None
+        time.sleep(POLL_SECONDS)
@@ -0,0 +1,267 @@
+"""
+Transcription job spool.
+A local directory with an SQLite index through which the web workers hand
+transcription jobs to standalone worker processes (python -m services.worker),
+so Whisper runs outside gunicorn and inference scales across cores on its own.
+Audio that chunked uploads have already decoded is stored next to the index as
+raw float32 PCM, so the worker does not decode it again.
+
+Jobs are claimed inside a BEGIN IMMEDIATE transaction, so each goes to exactly
+one worker, in the same fair order as the in-process pipeline. Jobs held by a
+worker process that has exited are put back in the queue. A running job whose
+session is discarded is marked 'cancelled'; the worker holding it drops the
+result, and finishing it deletes the row.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from services.pipeline import fair_pick
+
+# Finished rows are kept this long for the fair-order counts and status lookups
+FINISHED_RETENTION_SECONDS = 3600
+
+PENDING_STATUSES = ('queued', 'running')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobSpool:
+    """Transcription jobs shared between the web workers and the transcription workers on one host."""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Spool directory (created if missing); holds index.db and spooled audio
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, 'index.db')
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                question_id INTEGER NOT NULL,
+                recording_id TEXT NOT NULL,
+                video_path TEXT,
+                audio_file TEXT,
+                upload_hash TEXT,
+                answers INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL,
+                error TEXT,
+                worker_pid INTEGER,
+                submitted_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                details TEXT
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, submitted_at);
+            CREATE INDEX IF NOT EXISTS jobs_by_question ON jobs (session_id, question_id);
+        """)
+
+    def _connect(self):
+        # One connection per thread, re-opened after fork (gunicorn --preload)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _job(row) -> dict:
+        job = dict(row)
+        job['details'] = json.loads(job['details']) if job['details'] else None
+        # Same shape as a pipeline job, for pipeline.job_status() and fair_pick()
+        job['inference_started_at'] = job['started_at']
+        return job
+
+    def _remove_audio(self, audio_files):
+        for audio_file in audio_files:
+            if audio_file:
+                try:
+                    os.remove(os.path.join(self.directory, audio_file))
+                except OSError:
+                    pass
+
+    def submit(self, session_id: str, question_id: int, recording_id: str, video_path: str,
+               audio: np.ndarray = None, answers: int = 1, upload_hash: str = None) -> dict:
+        """
+        Queue a question's recording for transcription, superseding its queued older job.
+
+        Args:
+            session_id: Patient session the recording belongs to
+            question_id: Question the recording answers
+            recording_id: The question's recording_id (workers only write while it still matches)
+            video_path: Uploaded recording (deleted by the worker once transcribed)
+            audio: Already-decoded 16 kHz samples (chunked uploads), stored in the spool
+            answers: Answers the session needs in all (for fair ordering)
+            upload_hash: SHA-256 of the uploaded file
+
+        Returns:
+            The job record
+        """
+        job_id = uuid.uuid4().hex
+        audio_file = None
+        if audio is not None:
+            audio_file = f"{job_id}.f32"
+            np.ascontiguousarray(audio, dtype=np.float32).tofile(os.path.join(self.directory, audio_file))
+        with self._transaction() as conn:
+            stale = conn.execute("SELECT audio_file FROM jobs WHERE session_id = ? AND question_id = ? "
+                                 "AND status = 'queued'", (session_id, question_id)).fetchall()
+            conn.execute("UPDATE jobs SET status = 'superseded', audio_file = NULL, finished_at = ? "
+                         "WHERE session_id = ? AND question_id = ? AND status = 'queued'",
+                         (time.time(), session_id, question_id))
+            conn.execute(
+                "INSERT INTO jobs (job_id, session_id, question_id, recording_id, video_path, audio_file, "
+                "upload_hash, answers, status, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, session_id, question_id, recording_id, video_path, audio_file, upload_hash, answers,
+                 time.time()))
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        self._remove_audio(r['audio_file'] for r in stale)
+        return self._job(row)
+
+    def claim(self, worker_pid: int = None):
+        """
+        Take the next job for a worker process, in fair order.
+
+        Jobs running in processes that no longer exist are queued again first, and
+        finished rows past FINISHED_RETENTION_SECONDS are pruned.
+
+        Returns:
+            The job record (status 'running'), or None if the queue is empty
+        """
+        worker_pid = worker_pid or os.getpid()
+        now = time.time()
+        orphaned = []
+        with self._transaction() as conn:
+            for row in conn.execute("SELECT job_id, status, worker_pid, audio_file FROM jobs "
+                                    "WHERE status IN ('running', 'cancelled')").fetchall():
+                if not row['worker_pid'] or _pid_alive(row['worker_pid']):
+                    continue
+                if row['status'] == 'cancelled':
+                    # Its session is gone: nothing to requeue
+                    conn.execute("DELETE FROM jobs WHERE job_id = ?", (row['job_id'],))
+                    orphaned.append(row['audio_file'])
+                else:
+                    print(f"[SPOOL] Requeueing job {row['job_id']} from exited worker {row['worker_pid']}")
+                    conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, started_at = NULL "
+                                 "WHERE job_id = ?", (row['job_id'],))
+            conn.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+                         (now - FINISHED_RETENTION_SECONDS,))
+            ready = [self._job(row) for row in conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY submitted_at")]
+            if not ready:
+                job = None
+            else:
+                sessions = {job['session_id'] for job in ready}
+                jobs = [self._job(row) for row in conn.execute(
+                    f"SELECT * FROM jobs WHERE session_id IN ({', '.join('?' * len(sessions))})", tuple(sessions))]
+                job = ready[fair_pick(ready, jobs)]
+                conn.execute("UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE job_id = ?",
+                             (worker_pid, now, job['job_id']))
+        self._remove_audio(orphaned)
+        if job is not None:
+            job.update(status='running', worker_pid=worker_pid, started_at=now, inference_started_at=now)
+        return job
+
+    def load_audio(self, job: dict):
+        """The job's spooled audio samples, or None if the recording still needs decoding."""
+        if not job['audio_file']:
+            return None
+        return np.fromfile(os.path.join(self.directory, job['audio_file']), dtype=np.float32)
+
+    def cancelled(self, job: dict) -> bool:
+        """Whether a claimed job's session was discarded while it ran."""
+        row = self._connect().execute("SELECT status FROM jobs WHERE job_id = ?", (job['job_id'],)).fetchone()
+        return row is None or row['status'] == 'cancelled'
+
+    def finish(self, job: dict, status: str, result: str = None, error: str = None, details: dict = None) -> bool:
+        """
+        Record a claimed job's outcome ('done', 'error' or 'superseded') and delete its spooled audio.
+
+        Returns:
+            False if the job was cancelled meanwhile: its row is deleted instead, and the
+            result must not be stored anywhere
+        """
+        with self._transaction() as conn:
+            kept = conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, details = ?, finished_at = ?, "
+                                "audio_file = NULL WHERE job_id = ? AND status != 'cancelled'",
+                                (status, result, error, json.dumps(details) if details is not None else None,
+                                 time.time(), job['job_id'])).rowcount
+            if not kept:
+                conn.execute("DELETE FROM jobs WHERE job_id = ?", (job['job_id'],))
+        self._remove_audio([job['audio_file']])
+        return bool(kept)
+
+    def get(self, session_id: str, question_id: int):
+        """The question's latest job, or None."""
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE session_id = ? AND question_id = ? ORDER BY submitted_at DESC LIMIT 1",
+            (session_id, question_id)).fetchone()
+        return self._job(row) if row else None
+
+    def waiting(self, exclude: tuple = None) -> int:
+        """Jobs not yet claimed by a worker (optionally ignoring one (session_id, question_id))."""
+        session_id, question_id = exclude or (None, None)
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND NOT (session_id IS ? AND question_id IS ?)",
+            (session_id, question_id)).fetchone()
+        return row[0]
+
+    def queue_depth(self) -> int:
+        """Jobs queued or running on any worker."""
+        row = self._connect().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status IN {PENDING_STATUSES}").fetchone()
+        return row[0]
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counts = dict(conn.execute(
+            f"SELECT status, COUNT(*) FROM jobs WHERE status IN {PENDING_STATUSES} GROUP BY status").fetchall())
+        workers = conn.execute("SELECT COUNT(DISTINCT worker_pid) FROM jobs WHERE status = 'running'").fetchone()
+        return {'queued': counts.get('queued', 0), 'running': counts.get('running', 0), 'busy_workers': workers[0]}
+
+    def discard(self, session_id: str):
+        """
+        Drop a session's jobs. Jobs a worker is running are marked 'cancelled' rather than
+        deleted: the worker still holds them, drops their result and deletes the row in finish().
+        """
+        with self._transaction() as conn:
+            audio_files = [row['audio_file'] for row in conn.execute(
+                "SELECT audio_file FROM jobs WHERE session_id = ? AND status = 'queued'", (session_id,))]
+            conn.execute("DELETE FROM jobs WHERE session_id = ? AND status != 'running'", (session_id,))
+            conn.execute("UPDATE jobs SET status = 'cancelled' WHERE session_id = ? AND status = 'running'",
+                         (session_id,))
+        self._remove_audio(audio_files)
@@ -3,171 +3,711 @@ Symptom analysis service using Claude API.
 Analyzes patient transcriptions to extract and cluster symptoms.
 """
 
+import asyncio
+import copy
+import hashlib
 import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
 import anthropic
 
+from config import Config
+from services import metrics
+
+# Bump whenever the prompt or response handling changes, so cached analyses are not reused
+PROMPT_VERSION = 3
+
+ANALYSIS_TOOL_NAME = "record_symptom_analysis"
+REFINEMENT_TOOL_NAME = "record_analysis_update"
+
+# Stands in for an answer with no speech (e.g. a silent recording)
+NO_SPEECH_PLACEHOLDER = "[No speech detected in recording]"
+
+
+class AnalysisCache:
+    """LRU/TTL cache of analyses keyed by content hash, with an optional SQLite tier."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 86400, db_path: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (stored_at, analysis)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS analysis_cache "
+                             "(key TEXT PRIMARY KEY, stored_at REAL NOT NULL, analysis TEXT NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread, re-opened after fork (gunicorn --preload)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str):
+        """Return a copy of the cached analysis, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                metrics.inc('intake_cache_requests_total', cache='analysis', result='hit')
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute("SELECT stored_at, analysis FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[0] <= self.ttl_seconds:
+                analysis = json.loads(row[1])
+                with self._lock:
+                    self.counters['disk_hits'] += 1
+                    self._store(key, row[0], analysis)
+                metrics.inc('intake_cache_requests_total', cache='analysis', result='disk_hit')
+                return copy.deepcopy(analysis)
+
+        with self._lock:
+            self.counters['misses'] += 1
+        metrics.inc('intake_cache_requests_total', cache='analysis', result='miss')
+        return None
+
+    def put(self, key: str, analysis: dict):
+        stored_at = time.time()
+        with self._lock:
+            self._store(key, stored_at, copy.deepcopy(analysis))
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO analysis_cache (key, stored_at, analysis) VALUES (?, ?, ?)",
+                             (key, stored_at, json.dumps(analysis)))
+                conn.execute("DELETE FROM analysis_cache WHERE stored_at < ?", (stored_at - self.ttl_seconds,))
+
+    def _store(self, key, stored_at, analysis):
+        self._entries[key] = (stored_at, analysis)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+
+_cache = None
+
+
+def configure_cache(max_entries: int = 256, ttl_seconds: float = 86400, db_path: str = None):
+    """Enable the analysis cache (max_entries=0 disables it)."""
+    global _cache
+    _cache = AnalysisCache(max_entries, ttl_seconds, db_path) if max_entries > 0 else None
+
+
+def get_cache_stats():
+    """Cache hit/miss counters, or None if caching is off."""
+    return _cache.stats() if _cache else None
+
 
-def analyze_symptoms(transcriptions: dict, api_key: str, model: str = "claude-sonnet-4-20250514", symptom_categories: list = None) -> dict:
+def analysis_cache_key(transcriptions: dict, model: str, symptom_categories: list = None) -> str:
+    """Hash of everything that determines an analysis: normalized answers, questions, taxonomy, model, prompt version."""
+    normalized = {str(qid): " ".join(str(text).split()) for qid, text in transcriptions.items()}
+    payload = json.dumps({
+        'transcriptions': normalized,
+        'questions': INTERVIEW_QUESTIONS,
+        'categories': symptom_categories or [],
+        'model': model,
+        'prompt_version': PROMPT_VERSION
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# One pooled client per API key for the whole process; rebuilt in forked workers
+_client_options = {}
+_clients = {}
+_clients_lock = threading.Lock()
+_loop = None
+
+
+def configure_client(max_connections: int = 20, max_keepalive_connections: int = 10, timeout: float = 60.0,
+                     connect_timeout: float = 10.0, max_retries: int = 3, base_url: str = None):
     """
-    Analyze patient transcriptions to extract and categorize symptoms.
+    Set connection pooling, timeouts and retries for the shared Claude clients.
 
     Args:
-        transcriptions: Dict with question_id keys and transcription text values
-        api_key: Anthropic API key
-        model: Claude model to use
-        symptom_categories: List of symptom category definitions
-
-    Returns:
-        Structured analysis dict with symptom clusters, timeline, and impact
+        max_connections: Maximum open connections per client
+        max_keepalive_connections: Idle connections kept warm for reuse
+        timeout: Overall request timeout in seconds
+        connect_timeout: Connection (including TLS handshake) timeout in seconds
+        max_retries: Retries with exponential backoff on connection errors, 429 and 5xx
+        base_url: Override the API endpoint (e.g. a local stub server)
     """
-    if not api_key:
-        raise ValueError("Claude API key not configured")
+    global _client_options
+    with _clients_lock:
+        _client_options = {
+            'max_connections': max_connections,
+            'max_keepalive_connections': max_keepalive_connections,
+            'timeout': timeout,
+            'connect_timeout': connect_timeout,
+            'max_retries': max_retries,
+            'base_url': base_url
+        }
+        _clients.clear()
+
+
+def _client_kwargs(api_key: str, http_client_class) -> dict:
+    options = _client_options
+    limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=options.get('max_connections', 20),
+        max_keepalive_connections=options.get('max_keepalive_connections', 10),
+        keepalive_expiry=30.0
+    )
+    return {
+        'api_key': api_key,
+        'base_url': options.get('base_url') or None,
+        'max_retries': options.get('max_retries', 3),
+        'timeout': anthropic.Timeout(options.get('timeout', 60.0), connect=options.get('connect_timeout', 10.0)),
+        'http_client': http_client_class(limits=limits)
+    }
+
+
+def get_client(api_key: str) -> anthropic.Anthropic:
+    """Shared synchronous client for this API key."""
+    with _clients_lock:
+        client = _clients.get(('sync', api_key))
+        if client is None:
+            client = anthropic.Anthropic(**_client_kwargs(api_key, anthropic.DefaultHttpxClient))
+            _clients[('sync', api_key)] = client
+        return client
 
-    # Create Anthropic client
-    client = anthropic.Anthropic(api_key=api_key)
-    
-    # Format symptom categories for the prompt
+
+def get_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Shared async client for this API key (use only on the analysis event loop)."""
+    with _clients_lock:
+        client = _clients.get(('async', api_key))
+        if client is None:
+            client = anthropic.AsyncAnthropic(**_client_kwargs(api_key, anthropic.DefaultAsyncHttpxClient))
+            _clients[('async', api_key)] = client
+        return client
+
+
+def _reset_after_fork():
+    # Pooled connections and the loop thread belong to the parent process
+    global _clients_lock, _loop
+    _clients_lock = threading.Lock()
+    _clients.clear()
+    _loop = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _clients_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="analysis-loop", daemon=True).start()
+        return _loop
+
+
+# The interview questions as the prompt presents them: (question_id, title, wording), taken
+# from Config.QUESTIONS so Claude reads exactly what the patient was asked
+INTERVIEW_QUESTIONS = tuple((q['id'], q['title'], q['text']) for q in Config.QUESTIONS)
+
+# Static request parts (instructions, taxonomy, tool schemas) by taxonomy; one entry
+# for the configured categories, plus any ANALYSIS_SHORTLIST subsets in use
+MAX_COMPILED_PROMPTS = 64
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+# Shortest prefix Anthropic will cache, in tokens, by model name prefix (1,024 for the rest);
+# a shorter prefix is sent without a cache breakpoint
+CACHE_MIN_TOKENS = (
+    ('claude-opus-4-5', 4096),
+    ('claude-haiku-4-5', 4096),
+    ('claude-3-5-haiku', 2048),
+    ('claude-3-haiku', 2048),
+)
+DEFAULT_CACHE_MIN_TOKENS = 1024
+
+
+def cache_min_tokens(model: str) -> int:
+    """Minimum cacheable prompt prefix for a model, in tokens."""
+    return next((tokens for prefix, tokens in CACHE_MIN_TOKENS if model.startswith(prefix)), DEFAULT_CACHE_MIN_TOKENS)
+
+
+def build_system_prompt(symptom_categories: list = None) -> str:
+    """Render the instructions and category list shared by every analysis with this taxonomy."""
     categories_text = ""
     if symptom_categories:
-        print(f"[ANALYZER DEBUG] Received {len(symptom_categories)} symptom categories")
-        categories_text = "\n## Available Symptom Categories\n\n"
-        for cat in symptom_categories:
-            categories_text += f"- **{cat['name']}** (ID: {cat['id']})\n"
-            categories_text += f"  {cat['description']}\n\n"
-        print(f"[ANALYZER DEBUG] Categories text length: {len(categories_text)} chars")
+        categories_text = "".join(f"- **{cat['name']}** (ID: {cat['id']})\n  {cat['description']}\n\n"
+                                  for cat in symptom_categories)
     else:
         print("[ANALYZER DEBUG] WARNING: No symptom categories provided!")
 
-    # Build analysis prompt
-    analysis_prompt = f"""You are a medical intake analyst for a Long-COVID clinic. Analyze these patient responses and extract structured information about their symptoms.
+    return f"""You are a medical intake analyst for a Long-COVID clinic. Analyze the patient's interview responses and extract structured information about their symptoms.
 
-{categories_text}
+## Available Symptom Categories
 
-## Patient Responses
+{categories_text}## Analysis Task
 
-### TRANSCRIPTION RECEIVED:
-Question 1: {transcriptions.get(1, '[No response recorded]')}
+Match the patient's symptoms to the appropriate categories listed above.
 
----
+CRITICAL: Match symptoms ONLY to the predefined category IDs and names provided above. Use the exact category_id and category_name from the list.
 
-## Patient Interview Responses
+Be thorough but stick to what the patient actually said - do not infer symptoms they didn't mention."""
 
-### Question 1: Main Concerns
-"What are the top three things you'd most like help with right now?"
 
-Patient's response:
-{transcriptions.get(1, '[No response recorded]')}
+def compile_prompt(symptom_categories: list = None) -> dict:
+    """
+    Build (once per taxonomy) the static parts of an analysis request.
 
-### Question 2: Timeline
-"How long have you been experiencing these symptoms?"
+    The system prompt carries a cache breakpoint. Tools come before the system prompt
+    in Anthropic's cache order, so the cached prefix covers the instructions, the
+    taxonomy and the output schema; each request then only sends the answers.
+    'prefix_tokens' estimates that prefix (at four characters per token) for each tool,
+    so requests can leave out a breakpoint the model would ignore (see _request_params).
 
-Patient's response:
-{transcriptions.get(2, '[No response recorded]')}
+    Returns:
+        {'system': system prompt blocks, 'uncached_system': the same without the breakpoint,
+         'tool': analysis_tool(...), 'refinement_tool': refinement_tool(...),
+         'prefix_tokens': {'tool': int, 'refinement_tool': int}}
+    """
+    key = json.dumps(symptom_categories or [], sort_keys=True)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    system = build_system_prompt(symptom_categories)
+    tools = {'tool': analysis_tool(symptom_categories), 'refinement_tool': refinement_tool(symptom_categories)}
+    compiled = {
+        'system': [{'type': 'text', 'text': system, 'cache_control': {'type': 'ephemeral'}}],
+        'uncached_system': [{'type': 'text', 'text': system}],
+        **tools,
+        'prefix_tokens': {name: (len(system) + len(json.dumps(tool))) // 4 for name, tool in tools.items()},
+        'warned_models': set()
+    }
+    print(f"[ANALYZER DEBUG] Compiled the analysis prompt for {len(symptom_categories or [])} categories "
+          f"({len(system)} chars)")
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > MAX_COMPILED_PROMPTS:
+            _compiled.popitem(last=False)
+    return compiled
 
-### Question 3: Daily Impact
-"How are these symptoms affecting your day-to-day life?"
+
+def _interview_prompt(transcriptions: dict) -> str:
+    sections = [f"""### Question {question_id}: {title}
+"{wording}"
 
 Patient's response:
-{transcriptions.get(3, '[No response recorded]')}
+{transcriptions.get(question_id, '[No response recorded]')}""" for question_id, title, wording in INTERVIEW_QUESTIONS]
+    return "## Patient Interview Responses\n\n" + "\n\n".join(sections)
+
+
+def build_analysis_prompt(transcriptions: dict) -> str:
+    """Render the per-patient part of an analysis request (see compile_prompt for the rest)."""
+    return _interview_prompt(transcriptions) + f"""
 
 ---
 
-## Analysis Task
+Record your analysis with the {ANALYSIS_TOOL_NAME} tool, listing the most prominent category first."""
 
-Please analyze these responses and match the patient's symptoms to the appropriate categories listed above. 
 
-CRITICAL: Match symptoms ONLY to the predefined category IDs and names provided above. Use the exact category_id and category_name from the list.
+def build_refinement_prompt(transcriptions: dict, draft: dict, draft_questions: list) -> str:
+    """Render the request asking Claude to update an analysis of some answers for the full set."""
+    answered = ", ".join(str(qid) for qid in sorted(draft_questions))
+    return _interview_prompt(transcriptions) + f"""
+
+---
+
+## Earlier Analysis
+
+The answers to question(s) {answered} were analyzed before the rest were recorded:
+
+```json
+{json.dumps(draft, indent=2)}
+```
+
+Update this analysis for all of the responses above. With the {REFINEMENT_TOOL_NAME} tool, record only the categories that are new or whose entry changes (as complete entries), the IDs of earlier categories the responses no longer support, and the priority concerns and clinical notes for the whole interview."""
+
+
+def _category_id_schema(symptom_categories: list = None) -> dict:
+    category_id = {"type": "string", "description": "Exact ID from the category list"}
+    if symptom_categories:
+        category_id["enum"] = [cat['id'] for cat in symptom_categories]
+    return category_id
+
+
+def _category_entry_schema(symptom_categories: list = None) -> dict:
+    category_name = {"type": "string", "description": "Exact name from the category list"}
+    if symptom_categories:
+        category_name["enum"] = [cat['name'] for cat in symptom_categories]
+    return {
+        "type": "object",
+        "properties": {
+            "category_id": _category_id_schema(symptom_categories),
+            "category_name": category_name,
+            "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+            "patient_symptoms": {
+                "type": "array", "items": {"type": "string"},
+                "description": "Specific symptoms the patient mentioned"
+            },
+            "severity_indicators": {
+                "type": "array", "items": {"type": "string"},
+                "description": "Direct quotes showing severity"
+            }
+        },
+        "required": ["category_id", "category_name", "confidence", "patient_symptoms", "severity_indicators"]
+    }
 
-Be thorough but stick to what the patient actually said - do not infer symptoms they didn't mention.
-
-You MUST return ONLY valid JSON in this EXACT format (no markdown code blocks, no backticks, no explanation text):
-
-{{
-    "matched_categories": [
-        {{
-            "category_id": "use exact ID from list above (e.g., brain_fog, energy_crash)",
-            "category_name": "use exact name from list above",
-            "confidence": "high",
-            "patient_symptoms": ["specific symptom 1 they mentioned", "specific symptom 2"],
-            "severity_indicators": ["direct quote showing severity"]
-        }}
-    ],
-    "priority_concerns": ["their top concern 1", "their top concern 2", "their top concern 3"],
-    "clinical_notes": "Brief 1-2 sentence summary for the clinical team"
-}}
-
-IMPORTANT: Return ONLY the JSON object. No other text before or after."""
-
-    # Send to Claude for analysis
-    print(f"[ANALYZER DEBUG] Sending prompt to Claude (length: {len(analysis_prompt)} chars)")
-    print(f"[ANALYZER DEBUG] First 300 chars of prompt: {analysis_prompt[:300]}")
-    
-    message = client.messages.create(
-        model=model,
-        max_tokens=2048,
-        messages=[
+
+SUMMARY_PROPERTIES = {
+    "priority_concerns": {
+        "type": "array", "items": {"type": "string"},
+        "description": "The patient's top three concerns"
+    },
+    "clinical_notes": {
+        "type": "string",
+        "description": "Brief 1-2 sentence summary for the clinical team"
+    }
+}
+
+
+def analysis_tool(symptom_categories: list = None) -> dict:
+    """Tool definition whose input schema is the analysis format (Claude is made to call it)."""
+    return {
+        "name": ANALYSIS_TOOL_NAME,
+        "description": "Record the structured symptom analysis of the patient's answers.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                # First, so streamed output starts with the categories
+                "matched_categories": {"type": "array", "items": _category_entry_schema(symptom_categories)},
+                **SUMMARY_PROPERTIES
+            },
+            "required": ["matched_categories", "priority_concerns", "clinical_notes"]
+        }
+    }
+
+
+def refinement_tool(symptom_categories: list = None) -> dict:
+    """Tool definition for an update to an earlier analysis: changed entries only, plus removals."""
+    return {
+        "name": REFINEMENT_TOOL_NAME,
+        "description": "Record the changes to the earlier symptom analysis that the full set of answers calls for.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "updated_categories": {
+                    "type": "array", "items": _category_entry_schema(symptom_categories),
+                    "description": "New categories, and earlier ones whose entry changes"
+                },
+                "removed_category_ids": {
+                    "type": "array", "items": _category_id_schema(symptom_categories),
+                    "description": "Earlier categories the answers no longer support"
+                },
+                **SUMMARY_PROPERTIES
+            },
+            "required": ["updated_categories", "removed_category_ids", "priority_concerns", "clinical_notes"]
+        }
+    }
+
+
+def merge_refinement(draft: dict, update: dict, symptom_categories: list = None) -> dict:
+    """
+    Apply a refinement_tool update to an earlier analysis.
+
+    Changed entries replace the earlier ones in place, new ones are appended, and
+    categories that are removed (or not in symptom_categories) are dropped.
+    """
+    allowed = {cat['id'] for cat in symptom_categories} if symptom_categories else None
+    removed = set(update.get('removed_category_ids') or [])
+    entries = [dict(entry) for entry in draft.get('matched_categories', [])]
+    positions = {entry.get('category_id'): i for i, entry in enumerate(entries)}
+    for entry in update.get('updated_categories') or []:
+        if entry.get('category_id') in positions:
+            entries[positions[entry['category_id']]] = entry
+        else:
+            positions[entry.get('category_id')] = len(entries)
+            entries.append(entry)
+    return {
+        'matched_categories': [entry for entry in entries if entry.get('category_id') not in removed
+                               and (allowed is None or entry.get('category_id') in allowed)],
+        'priority_concerns': update.get('priority_concerns', draft.get('priority_concerns', [])),
+        'clinical_notes': update.get('clinical_notes', draft.get('clinical_notes', ''))
+    }
+
+
+class CategoryStreamParser:
+    """
+    Incremental scanner over streamed tool-input JSON.
+
+    feed() takes each partial_json fragment and returns the matched_categories
+    entries completed by it, so each category can be shown before the rest of
+    the analysis has been generated.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._in_categories = False
+        self._entry_start = None
+
+    def feed(self, fragment: str) -> list:
+        start = len(self._text)
+        self._text += fragment
+        text = self._text
+        entries = []
+        for i in range(start, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1:
+                    self._in_categories = self._last_key == 'matched_categories'
+                elif ch == '{' and self._depth == 2 and self._in_categories:
+                    self._entry_start = i
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if ch == '}' and self._depth == 2 and self._entry_start is not None:
+                    entries.append(json.loads(text[self._entry_start:i + 1]))
+                    self._entry_start = None
+                elif ch == ']' and self._depth == 1:
+                    self._in_categories = False
+        return entries
+
+
+def _cached_analysis(cache_key: str):
+    if _cache:
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            print(f"[ANALYZER DEBUG] Cache hit for {cache_key[:12]}")
+            return cached
+    return None
+
+
+def _request_params(model: str, prompt: str, symptom_categories: list = None, refinement: bool = False) -> dict:
+    compiled = compile_prompt(symptom_categories)
+    tool_key = 'refinement_tool' if refinement else 'tool'
+    tool = compiled[tool_key]
+    system = compiled['system']
+    prefix_tokens = compiled['prefix_tokens'][tool_key]
+    if prefix_tokens < cache_min_tokens(model):
+        # Too short to cache (e.g. an ANALYSIS_SHORTLIST subset): the breakpoint would do nothing
+        system = compiled['uncached_system']
+        if model not in compiled['warned_models']:
+            compiled['warned_models'].add(model)
+            print(f"[ANALYZER DEBUG] WARNING: The prompt prefix for {len(symptom_categories or [])} categories "
+                  f"(about {prefix_tokens} tokens) is below {model}'s prompt cache minimum of "
+                  f"{cache_min_tokens(model)}; sending it uncached")
+    print(f"[ANALYZER DEBUG] Sending answers to Claude (length: {len(prompt)} chars after the static prefix)")
+    return {
+        'model': model,
+        'max_tokens': 2048,
+        'system': system,
+        'tools': [tool],
+        'tool_choice': {'type': 'tool', 'name': tool['name']},
+        'messages': [
             {
                 "role": "user",
-                "content": analysis_prompt
+                "content": prompt
             }
         ]
-    )
-    
-    print(f"[ANALYZER DEBUG] Claude responded successfully")
-
-    # Parse JSON response
-    response_text = message.content[0].text.strip()
-    print(f"[CLAUDE DEBUG] Raw response (first 500 chars): {response_text[:500]}")
-
-    # Try to extract JSON if wrapped in markdown
-    if response_text.startswith('```'):
-        lines = response_text.split('\n')
-        json_lines = []
-        in_json = False
-        for line in lines:
-            if line.startswith('```') and not in_json:
-                in_json = True
-                continue
-            elif line.startswith('```') and in_json:
-                break
-            elif in_json:
-                json_lines.append(line)
-        response_text = '\n'.join(json_lines)
-        print(f"[CLAUDE DEBUG] Extracted from markdown: {response_text[:500]}")
-
-    try:
-        analysis = json.loads(response_text)
-        print(f"[CLAUDE DEBUG] Parsed analysis keys: {list(analysis.keys())}")
-        if "matched_categories" in analysis:
-            print(f"[CLAUDE DEBUG] Number of matched categories: {len(analysis['matched_categories'])}")
-        if "symptom_clusters" in analysis:
-            print(f"[CLAUDE DEBUG] Has old symptom_clusters format with {len(analysis['symptom_clusters'])} items")
-        
-        # If old format returned, convert to new format (fallback compatibility)
-        if "symptom_clusters" in analysis and "matched_categories" not in analysis:
-            print("[WARNING] Converting old symptom_clusters format to matched_categories")
-            analysis["matched_categories"] = []
-            for cluster in analysis.get("symptom_clusters", []):
-                analysis["matched_categories"].append({
-                    "category_id": "unknown",
-                    "category_name": cluster.get("category", "Other"),
-                    "confidence": "medium",
-                    "patient_symptoms": cluster.get("symptoms", []),
-                    "severity_indicators": cluster.get("severity_indicators", [])
-                })
-        
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] Failed to parse Claude response: {e}")
-        print(f"[ERROR] Response text: {response_text[:500]}")
-        # Return a basic structure if parsing fails
-        analysis = {
-            "error": "Failed to parse analysis",
-            "raw_response": response_text[:500],
-            "matched_categories": [],
-            "timeline": {"onset": "unknown", "trigger": "unknown", "progression": "unknown"},
-            "impact_summary": {},
-            "priority_concerns": [],
-            "clinical_notes": "Analysis parsing failed - manual review needed"
-        }
+    }
+
 
+def _record_usage(message, latency: float, details: dict = None):
+    """Observe a response's latency and token counts (prompt = uncached + cache reads + cache writes)."""
+    metrics.observe('intake_claude_seconds', latency, model=message.model)
+    usage = getattr(message, 'usage', None)
+    if not usage:
+        return
+    cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+    cache_write = getattr(usage, 'cache_creation_input_tokens', None) or 0
+    prompt_tokens = usage.input_tokens + cache_read + cache_write
+    metrics.observe('intake_claude_prompt_tokens', prompt_tokens, model=message.model)
+    metrics.observe('intake_claude_response_tokens', usage.output_tokens, model=message.model)
+    for kind, count in (('input', usage.input_tokens), ('cache_read', cache_read), ('cache_write', cache_write),
+                        ('output', usage.output_tokens)):
+        if count:
+            metrics.inc('intake_claude_tokens_total', count, kind=kind, model=message.model)
+    print(f"[ANALYZER DEBUG] Tokens: {prompt_tokens} prompt ({cache_read} read from cache, "
+          f"{cache_write} written to cache), {usage.output_tokens} output")
+    if details is not None:
+        details.update(prompt_tokens=prompt_tokens, cache_read_tokens=cache_read, cache_write_tokens=cache_write,
+                       output_tokens=usage.output_tokens)
+
+
+def _handle_response(cache_key: str, message, latency: float, draft: dict = None,
+                     symptom_categories: list = None, details: dict = None) -> dict:
+    print(f"[ANALYZER DEBUG] Claude responded successfully in {latency:.2f}s")
+    _record_usage(message, latency, details)
+    tool_name = ANALYSIS_TOOL_NAME if draft is None else REFINEMENT_TOOL_NAME
+    analysis = next((block.input for block in message.content
+                     if block.type == 'tool_use' and block.name == tool_name), None)
+    if not isinstance(analysis, dict):
+        raise ValueError(f"Claude did not return an analysis (stop reason: {message.stop_reason})")
+    if draft is not None:
+        analysis = merge_refinement(draft, analysis, symptom_categories)
+    print(f"[CLAUDE DEBUG] Matched categories: {[c.get('category_id') for c in analysis.get('matched_categories', [])]}")
+    if _cache:
+        _cache.put(cache_key, analysis)
     return analysis
+
+
+def analyze_symptoms(transcriptions: dict, api_key: str, model: str = "claude-sonnet-4-20250514", symptom_categories: list = None,
+                     details: dict = None) -> dict:
+    """
+    Analyze patient transcriptions to extract and categorize symptoms.
+
+    Args:
+        transcriptions: Dict with question_id keys and transcription text values
+        api_key: Anthropic API key
+        model: Claude model to use
+        symptom_categories: List of symptom category definitions
+        details: Optional dict filled with the request's token counts (prompt_tokens,
+            cache_read_tokens, cache_write_tokens, output_tokens); untouched on a cache hit
+
+    Returns:
+        Structured analysis dict with symptom clusters, timeline, and impact
+    """
+    if not api_key:
+        raise ValueError("Claude API key not configured")
+
+    cache_key = analysis_cache_key(transcriptions, model, symptom_categories)
+    cached = _cached_analysis(cache_key)
+    if cached is not None:
+        return cached
+
+    analysis_prompt = build_analysis_prompt(transcriptions)
+    started = time.perf_counter()
+    message = get_client(api_key).messages.create(**_request_params(model, analysis_prompt, symptom_categories))
+    return _handle_response(cache_key, message, time.perf_counter() - started, details=details)
+
+
+async def analyze_symptoms_async(transcriptions: dict, api_key: str, model: str = "claude-sonnet-4-20250514",
+                                 symptom_categories: list = None, on_category=None, details: dict = None) -> dict:
+    """
+    Async variant of analyze_symptoms using the shared AsyncAnthropic client.
+
+    With on_category, the response is streamed and on_category is called with each
+    matched_categories entry as soon as it has been generated (not for cached analyses);
+    the time to the first generated output is observed in intake_claude_first_token_seconds.
+    """
+    if not api_key:
+        raise ValueError("Claude API key not configured")
+
+    cache_key = analysis_cache_key(transcriptions, model, symptom_categories)
+    cached = _cached_analysis(cache_key)
+    if cached is not None:
+        return cached
+
+    analysis_prompt = build_analysis_prompt(transcriptions)
+    params = _request_params(model, analysis_prompt, symptom_categories)
+    client = get_async_client(api_key)
+    started = time.perf_counter()
+    if on_category is None:
+        message = await client.messages.create(**params)
+    else:
+        parser = CategoryStreamParser()
+        first_output = None
+        async with client.messages.stream(**params) as stream:
+            async for event in stream:
+                if event.type == 'input_json':
+                    if first_output is None:
+                        first_output = time.perf_counter()
+                        metrics.observe('intake_claude_first_token_seconds', first_output - started, model=model)
+                    for category in parser.feed(event.partial_json):
+                        on_category(category)
+            message = await stream.get_final_message()
+    return _handle_response(cache_key, message, time.perf_counter() - started, details=details)
+
+
+def submit_analysis(transcriptions: dict, api_key: str, model: str = "claude-sonnet-4-20250514",
+                    symptom_categories: list = None, on_category=None, details: dict = None):
+    """
+    Run analyze_symptoms_async on the process's background event loop.
+
+    The calling request thread is free as soon as this returns; many analyses can
+    be in flight on the one loop while they wait on Claude. on_category is called
+    and details filled from the loop's thread (see analyze_symptoms_async).
+
+    Returns:
+        concurrent.futures.Future resolving to the analysis dict
+    """
+    return asyncio.run_coroutine_threadsafe(
+        analyze_symptoms_async(transcriptions, api_key, model, symptom_categories, on_category, details=details),
+        _get_loop())
+
+
+async def refine_analysis_async(transcriptions: dict, draft: dict, draft_questions: list, api_key: str,
+                                model: str = "claude-sonnet-4-20250514", symptom_categories: list = None) -> dict:
+    """
+    Analyze a full set of answers by updating an earlier analysis of some of them.
+
+    Claude returns only what changes (see refinement_tool), which is much shorter
+    than a whole analysis; the merged result is cached under the full answers' key,
+    like analyze_symptoms_async.
+
+    Args:
+        transcriptions: Dict with question_id keys and transcription text values (all answers)
+        draft: Analysis of the answers in draft_questions
+        draft_questions: Question IDs the draft was made from
+        api_key: Anthropic API key
+        model: Claude model to use
+        symptom_categories: List of symptom category definitions
+
+    Returns:
+        The merged analysis dict
+    """
+    if not api_key:
+        raise ValueError("Claude API key not configured")
+
+    cache_key = analysis_cache_key(transcriptions, model, symptom_categories)
+    cached = _cached_analysis(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = build_refinement_prompt(transcriptions, draft, draft_questions)
+    params = _request_params(model, prompt, symptom_categories, refinement=True)
+    started = time.perf_counter()
+    message = await get_async_client(api_key).messages.create(**params)
+    return _handle_response(cache_key, message, time.perf_counter() - started, draft, symptom_categories)
+
+
+def submit_refinement(transcriptions: dict, draft: dict, draft_questions: list, api_key: str,
+                      model: str = "claude-sonnet-4-20250514", symptom_categories: list = None):
+    """Run refine_analysis_async on the background event loop; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(
+        refine_analysis_async(transcriptions, draft, draft_questions, api_key, model, symptom_categories),
+        _get_loop())
@@ -0,0 +1,174 @@
+"""
+Local symptom pre-matcher.
+Matches transcripts against the clinic's symptom categories with one precompiled
+phrase index (category names, description terms and everyday synonyms), giving
+provisional matched_categories with evidence quotes in milliseconds. Used to show
+results before Claude answers, optionally to shortlist the categories sent to
+Claude, and as the analysis when Claude is unavailable.
+"""
+
+import re
+
+# Words that are too general to identify a category on their own
+GENERIC_WORDS = {
+    'activity', 'after', 'at', 'being', 'changes', 'cold', 'effort', 'environments', 'foods', 'function', 'hot',
+    'improve', 'information', 'issues', 'medications', 'mental', 'over', 'physical', 'problems', 'rest',
+    'return', 'sensations', 'smells', 'sound', 'symptoms', 'time', 'unwell', 'upright', 'with', 'worse'
+}
+
+# Leading words stripped from description terms ("feeling lightheaded" -> "lightheaded")
+FILLER_PREFIXES = ('feeling ', 'feelings of ', 'frequent ', 'other ', 'unusual ', 'unusually ', 'changes to ',
+                   'changes in ', 'trouble ', 'difficulty ', 'strong reactions to ', 'many ')
+
+# A match preceded by one of these within a few words is not counted ("I don't have headaches")
+NEGATION = re.compile(r"\b(?:no(?!\s+longer)|never\s+had|without|"
+                      r"(?:don't|do\s+not|didn't|did\s+not|haven't|have\s+not|hasn't|not)\s+(?:have|had|get|got))"
+                      r"\s+(?:\w+\s+)?$", re.IGNORECASE)
+
+EVIDENCE_CHARS = 160
+
+
+def _description_terms(description: str) -> list:
+    text = description.lower().rstrip('.').replace(' such as ', ', ')
+    terms = []
+    for part in re.split(r",|\bor\b|\band\b", text):
+        term = part.strip()
+        for prefix in FILLER_PREFIXES:
+            if term.startswith(prefix):
+                term = term[len(prefix):]
+        words = term.split()
+        if 1 <= len(words) <= 3 and not all(word in GENERIC_WORDS for word in words):
+            terms.append(term)
+    return terms
+
+
+def _name_terms(name: str) -> list:
+    return [part.strip().lower() for part in re.split(r",|&|\band\b", name)
+            if part.strip() and part.strip().lower() not in GENERIC_WORDS]
+
+
+def _normalize(phrase: str) -> str:
+    return " ".join(phrase.lower().replace('’', "'").split())
+
+
+def _evidence(text: str, start: int, end: int) -> str:
+    """The sentence containing a match, trimmed to EVIDENCE_CHARS around it."""
+    sentence_start = max(text.rfind(ch, 0, start) for ch in '.!?\n') + 1
+    ends = [i for i in (text.find(ch, end) for ch in '.!?\n') if i != -1]
+    sentence_end = min(ends) + 1 if ends else len(text)
+    if sentence_end - sentence_start > EVIDENCE_CHARS:
+        half = (EVIDENCE_CHARS - (end - start)) // 2
+        sentence_start = max(sentence_start, start - half)
+        sentence_end = min(sentence_end, end + half)
+    return text[sentence_start:sentence_end].strip()
+
+
+class SymptomMatcher:
+    """Phrase index over a symptom taxonomy, compiled once into a single regular expression."""
+
+    def __init__(self, symptom_categories: list, synonyms: dict = None):
+        """
+        Args:
+            symptom_categories: Config.SYMPTOM_CATEGORIES-style list of {'id', 'name', 'description'}
+            synonyms: Optional {category_id: [phrase, ...]} of everyday wording
+        """
+        self.categories = {cat['id']: cat for cat in symptom_categories}
+        self._phrases = {}  # normalized phrase -> [category_id, ...]
+        for cat in symptom_categories:
+            terms = _name_terms(cat['name']) + _description_terms(cat['description'])
+            terms += (synonyms or {}).get(cat['id'], [])
+            for term in terms:
+                ids = self._phrases.setdefault(_normalize(term), [])
+                if cat['id'] not in ids:
+                    ids.append(cat['id'])
+
+        # Longest phrases first, so "chest pain" wins over "pain"; any whitespace between words
+        alternatives = [r"\s+".join(re.escape(word) for word in phrase.split())
+                        for phrase in sorted(self._phrases, key=len, reverse=True)]
+        self._pattern = re.compile(r"(?<![\w-])(?:" + "|".join(alternatives) + r")(?![\w-])", re.IGNORECASE)
+
+    @property
+    def phrase_count(self) -> int:
+        return len(self._phrases)
+
+    def match(self, transcriptions: dict) -> list:
+        """
+        Find categories mentioned in the answers.
+
+        Args:
+            transcriptions: Dict with question_id keys and transcription text values
+
+        Returns:
+            matched_categories entries (the analysis format) ordered by number of mentions,
+            each with the phrases found, up to three evidence quotes and the question_ids
+        """
+        found = {}
+        for question_id, text in sorted(transcriptions.items()):
+            text = (text or "").replace('’', "'")
+            for m in self._pattern.finditer(text):
+                if NEGATION.search(text[max(0, m.start() - 40):m.start()]):
+                    continue
+                phrase = _normalize(m.group(0))
+                for category_id in self._phrases.get(phrase, []):
+                    entry = found.setdefault(category_id, {'phrases': [], 'hits': 0, 'evidence': [],
+                                                           'question_ids': [], 'first': len(found)})
+                    entry['hits'] += 1
+                    if phrase not in entry['phrases']:
+                        entry['phrases'].append(phrase)
+                    quote = _evidence(text, m.start(), m.end())
+                    if quote not in entry['evidence']:
+                        entry['evidence'].append(quote)
+                    if question_id not in entry['question_ids']:
+                        entry['question_ids'].append(question_id)
+
+        ranked = sorted(found.items(), key=lambda item: (-item[1]['hits'], item[1]['first']))
+        return [{
+            'category_id': category_id,
+            'category_name': self.categories[category_id]['name'],
+            'confidence': 'medium' if len(entry['phrases']) >= 2 or entry['hits'] >= 3 else 'low',
+            'patient_symptoms': entry['phrases'],
+            'severity_indicators': entry['evidence'][:3],
+            'question_ids': entry['question_ids']
+        } for category_id, entry in ranked]
+
+    def provisional_analysis(self, transcriptions: dict, reason: str = None) -> dict:
+        """
+        Build a full analysis dict from the local matches alone.
+
+        Args:
+            transcriptions: Dict with question_id keys and transcription text values
+            reason: Why Claude's analysis is not being used (recorded as 'degraded')
+
+        Returns:
+            Analysis in the Claude format, flagged 'provisional'
+        """
+        matched = self.match(transcriptions)
+        analysis = {
+            'matched_categories': matched,
+            'priority_concerns': [entry['category_name'] for entry in matched[:3]],
+            'clinical_notes': "Automatic keyword match of the patient's answers; "
+                              "needs clinical review.",
+            'provisional': True
+        }
+        if reason:
+            analysis['degraded'] = reason
+        return analysis
+
+    def shortlist(self, transcriptions: dict) -> list:
+        """Categories worth sending to Claude: the matched ones, or all of them when nothing matched."""
+        matched = {entry['category_id'] for entry in self.match(transcriptions)}
+        return [cat for cat in self.categories.values() if cat['id'] in matched] or list(self.categories.values())
+
+
+_matcher = None
+
+
+def configure(symptom_categories: list, synonyms: dict = None):
+    """Build the process-wide matcher (once, at startup)."""
+    global _matcher
+    _matcher = SymptomMatcher(symptom_categories, synonyms)
+    print(f"[MATCHER] Indexed {_matcher.phrase_count} phrases over {len(_matcher.categories)} categories")
+
+
+def get_matcher() -> SymptomMatcher:
+    return _matcher
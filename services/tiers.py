@@ -0,0 +1,147 @@
+"""
+Load-adaptive transcription quality tiers.
+Steps down to cheaper Whisper settings (smaller model, greedy decoding) when the
+transcription queue backs up or recent latency climbs, and back up once load
+has eased. Thresholds have separate high/low marks plus a minimum time between
+switches, so the tier doesn't flap around a single boundary.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def parse_tiers(spec: str) -> list:
+    """
+    Parse a tier list such as "base:5,base:1,tiny:1" (model:beam_size, best first).
+
+    Returns:
+        List of {'name', 'model', 'beam_size'} dicts
+    """
+    tiers = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, beam = item.partition(':')
+        beam_size = int(beam) if beam else 5
+        tiers.append({'name': f"{model}-beam{beam_size}", 'model': model, 'beam_size': beam_size})
+    if not tiers:
+        raise ValueError(f"No transcription tiers in {spec!r}")
+    return tiers
+
+
+class TierController:
+    """Chooses the quality tier for each transcription from queue depth and recent p95 latency."""
+
+    def __init__(self, tiers: list, queue_high: int = 6, queue_low: int = 2,
+                 latency_high: float = 60.0, latency_low: float = 20.0,
+                 min_dwell_seconds: float = 30.0, window_seconds: float = 120.0):
+        """
+        Args:
+            tiers: Tier dicts from parse_tiers, best quality first
+            queue_high: Step down when this many jobs are queued or running
+            queue_low: Step up only when at most this many are
+            latency_high: Step down when recent p95 upload-to-transcript seconds reach this
+            latency_low: Step up only when recent p95 is at most this
+            min_dwell_seconds: Minimum time between tier changes
+            window_seconds: How far back latency samples count towards the p95
+        """
+        self.tiers = tiers
+        self.queue_high = queue_high
+        self.queue_low = queue_low
+        self.latency_high = latency_high
+        self.latency_low = latency_low
+        self.min_dwell_seconds = min_dwell_seconds
+        self.window_seconds = window_seconds
+        self._index = 0
+        self._changed_at = 0.0
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self._switches = 0
+
+    def _p95(self, now: float):
+        while self._latencies and self._latencies[0][0] < now - self.window_seconds:
+            self._latencies.popleft()
+        if not self._latencies:
+            return None
+        return float(np.percentile([latency for _, latency in self._latencies], 95))
+
+    def select(self, queue_depth: int) -> dict:
+        """Re-evaluate load and return the tier to use for the next transcription."""
+        now = time.time()
+        with self._lock:
+            p95 = self._p95(now)
+            if now - self._changed_at >= self.min_dwell_seconds:
+                overloaded = queue_depth >= self.queue_high or (p95 is not None and p95 >= self.latency_high)
+                relaxed = queue_depth <= self.queue_low and (p95 is None or p95 <= self.latency_low)
+                if overloaded and self._index < len(self.tiers) - 1:
+                    self._switch(self._index + 1, now, queue_depth, p95)
+                elif relaxed and self._index > 0:
+                    self._switch(self._index - 1, now, queue_depth, p95)
+            return dict(self.tiers[self._index])
+
+    def _switch(self, index: int, now: float, queue_depth: int, p95):
+        latency = 'n/a' if p95 is None else f"{p95:.1f}s"
+        print(f"[TIERS] {self.tiers[self._index]['name']} -> {self.tiers[index]['name']} "
+              f"(queue {queue_depth}, p95 {latency})")
+        self._index = index
+        self._changed_at = now
+        self._switches += 1
+
+    def record(self, latency_seconds: float):
+        """Add one finished transcription's upload-to-transcript latency."""
+        with self._lock:
+            self._latencies.append((time.time(), latency_seconds))
+
+    def stats(self) -> dict:
+        with self._lock:
+            p95 = self._p95(time.time())
+            return {
+                'tier': self.tiers[self._index]['name'],
+                'tiers': [tier['name'] for tier in self.tiers],
+                'p95_latency_seconds': None if p95 is None else round(p95, 2),
+                'samples': len(self._latencies),
+                'switches': self._switches
+            }
+
+
+_controller = TierController(parse_tiers("base:5"))
+
+
+def configure(spec: str = "base:5", **thresholds):
+    """Install the tier list (see parse_tiers) and TierController thresholds."""
+    global _controller
+    _controller = TierController(parse_tiers(spec), **thresholds)
+    print(f"[TIERS] Transcription tiers: {', '.join(t['name'] for t in _controller.tiers)}")
+
+
+def primary_tier() -> dict:
+    """The best-quality tier (used when the server is not under load)."""
+    return dict(_controller.tiers[0])
+
+
+def all_tiers() -> list:
+    return [dict(tier) for tier in _controller.tiers]
+
+
+def model_tiers() -> list:
+    """The best tier using each model, primary first (what to load and warm up)."""
+    first = {}
+    for tier in _controller.tiers:
+        first.setdefault(tier['model'], dict(tier))
+    return list(first.values())
+
+
+def select(queue_depth: int) -> dict:
+    return _controller.select(queue_depth)
+
+
+def record(latency_seconds: float):
+    _controller.record(latency_seconds)
+
+
+def stats() -> dict:
+    return _controller.stats()
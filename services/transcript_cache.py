@@ -0,0 +1,91 @@
+"""
+Transcription memoization by content fingerprint.
+Keys transcriptions by a hash of the uploaded bytes and by a hash of the decoded
+PCM, so a retried request or a re-upload of the same recording returns the
+stored text instead of running ffmpeg and Whisper again.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from services import metrics
+
+
+class TranscriptCache:
+    """Bounded process-wide LRU of fingerprint -> transcription."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max(0, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, *fingerprints):
+        """Return the transcription for the first known fingerprint, or None."""
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint and fingerprint in self._entries:
+                    self._entries.move_to_end(fingerprint)
+                    self.hits += 1
+                    metrics.inc('intake_cache_requests_total', cache='transcript', result='hit')
+                    return self._entries[fingerprint]
+            self.misses += 1
+        metrics.inc('intake_cache_requests_total', cache='transcript', result='miss')
+        return None
+
+    def put(self, transcription: str, *fingerprints):
+        if self.max_entries == 0 or transcription is None:
+            return
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint:
+                    self._entries[fingerprint] = transcription
+                    self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = TranscriptCache()
+
+
+def configure(max_entries: int = 512):
+    """Resize the process-wide cache (clears it)."""
+    global _cache
+    _cache = TranscriptCache(max_entries)
+
+
+def get_cache():
+    return _cache
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_audio(audio: np.ndarray) -> str:
+    """SHA-256 of decoded samples (same audio from a different container hashes the same)."""
+    return hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).data).hexdigest()
+
+
+def find_in_session(session: dict, upload_hash: str = None, audio_hash: str = None):
+    """Return a finished transcription from any question in the session with a matching fingerprint."""
+    for question in session['questions'].values():
+        if question.get('transcription') is None:
+            continue
+        if (upload_hash and question.get('upload_hash') == upload_hash) or \
+                (audio_hash and question.get('audio_hash') == audio_hash):
+            return question['transcription']
+    return None
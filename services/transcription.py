@@ -4,47 +4,379 @@ Uses CTranslate2 for 4x faster inference with 4x less memory than OpenAI Whisper
 """
 
 import os
-from faster_whisper import WhisperModel
+import threading
+import time
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+
+from services import metrics
+
+# Load each model once at module level for efficiency (one per quality tier in use)
+_models = {}
+_model_lock = threading.Lock()
+_model_paths = {}
+_model_states = {}
+
+
+def _state(model_name: str) -> dict:
+    return _model_states.setdefault(model_name, {
+        # not_loaded -> loading -> loaded (-> warming -> ready, or degraded if the warm-up failed), or error
+        'state': 'not_loaded',
+        'load_seconds': None,
+        'warmup_seconds': None,
+        'loaded_at': None,
+        'error': None
+    })
+
+
+# Optional cross-request batching scheduler (see configure_batching)
+_scheduler = None
+
+# Silence pre-pass settings (see configure_prepass)
+_prepass = {
+    'enabled': True,
+    'min_rms': 0.003,          # absolute speech threshold floor (about -50 dBFS)
+    'max_rms': 0.03,           # cap so loud, pause-free recordings don't drop soft speech
+    'noise_ratio': 2.5,        # speech must be this many times louder than the noise floor
+    'peak_ratio': 0.5,         # ... and the trim threshold stays this far below the loud frames
+    'min_speech_seconds': 0.2,  # less voiced audio than this counts as silent
+    'pad_seconds': 0.3,        # audio kept around each voiced region
+    'max_pause_seconds': 2.0   # longer pauses are shortened to this
+}
+FRAME_SAMPLES = 480  # 30 ms at 16 kHz
+
+# CTranslate2 thread budget and weight precision (see configure_model)
+_cpu_threads = 0
+_num_workers = 1
+_compute_type = "int8"
+
+
+def configure_model(cpu_threads: int = 0, num_workers: int = 1, compute_type: str = "int8"):
+    """
+    Set the model's CPU budget and precision (call before the model is loaded).
+
+    Args:
+        cpu_threads: Threads per transcription (0: CTranslate2 default)
+        num_workers: Transcriptions the model can run in parallel from different threads
+        compute_type: CTranslate2 compute type (int8, int8_float32, float32, ...)
+    """
+    global _cpu_threads, _num_workers, _compute_type
+    _cpu_threads = max(0, int(cpu_threads))
+    _num_workers = max(1, int(num_workers))
+    _compute_type = compute_type
 
-# Load model once at module level for efficiency
-_model = None
 
 def get_model(model_name: str = "base"):
-    """Get or load the Whisper model."""
-    global _model
-    if _model is None:
-        print(f"[TRANSCRIPTION] Loading faster-whisper model: {model_name}")
-        # Use int8 quantization on CPU for best memory efficiency
-        _model = WhisperModel(model_name, device="cpu", compute_type="int8")
-        print(f"[TRANSCRIPTION] Model loaded successfully")
-    return _model
+    """Get or load a Whisper model."""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+    with _model_lock:
+        if model_name not in _models:
+            print(f"[TRANSCRIPTION] Loading faster-whisper model: {model_name} ({_compute_type}, "
+                  f"cpu_threads={_cpu_threads or 'default'}, num_workers={_num_workers})")
+            state = _state(model_name)
+            state.update(state='loading', error=None)
+            started = time.time()
+            try:
+                # int8 quantization on CPU (the default) gives the best memory efficiency
+                _models[model_name] = WhisperModel(_model_paths.get(model_name, model_name), device="cpu",
+                                                   compute_type=_compute_type, cpu_threads=_cpu_threads,
+                                                   num_workers=_num_workers)
+            except Exception as e:
+                state.update(state='error', error=str(e))
+                raise
+            state.update(state='loaded', load_seconds=round(time.time() - started, 2), loaded_at=time.time())
+            print(f"[TRANSCRIPTION] Model loaded successfully in {state['load_seconds']}s")
+    return _models[model_name]
+
+
+def fetch_model(model_name: str = "base") -> str:
+    """
+    Download the model files if needed and read them once, so they sit in the OS page cache.
 
+    Safe to call before forking: nothing CTranslate2-related is created. Later
+    get_model() calls load from the returned local path without network checks.
 
-def transcribe_audio(audio_path: str, api_key: str = None, model: str = None) -> str:
+    Returns:
+        Local model directory
+    """
+    from faster_whisper.utils import download_model
+
+    started = time.time()
+    path = download_model(model_name)
+    size = 0
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            with open(file_path, 'rb') as f:
+                while True:
+                    block = f.read(8 * 1024 * 1024)
+                    if not block:
+                        break
+                    size += len(block)
+    _model_paths[model_name] = path
+    print(f"[TRANSCRIPTION] Fetched {model_name} ({size / 1e6:.0f} MB) in {time.time() - started:.1f}s")
+    return path
+
+
+def preload_model(model_name: str = "base", beam_size: int = 5):
     """
-    Transcribe an audio file using faster-whisper (local).
+    Load the model and run one warm-up inference on a short synthetic clip.
+
+    The state ends 'ready', or 'degraded' (with the error) if the model loaded but the
+    warm-up inference failed; the readiness probe decides what that means for traffic.
 
     Args:
-        audio_path: Path to the audio file (WAV)
+        model_name: Whisper model size
+        beam_size: Beam width of the tier that will use it, so the warm-up runs the same decoder
+    """
+    model = get_model(model_name)
+    state = _state(model_name)
+    state['state'] = 'warming'
+    started = time.time()
+    try:
+        # One second of a quiet tone over light noise: enough to exercise the encoder and decoder
+        t = np.arange(16000, dtype=np.float32) / 16000
+        rng = np.random.default_rng(0)
+        clip = (0.05 * np.sin(2 * np.pi * 220 * t) + 0.005 * rng.standard_normal(16000)).astype(np.float32)
+        segments, _ = model.transcribe(clip, beam_size=beam_size)
+        list(segments)
+    except Exception as e:
+        state.update(state='degraded', error=f"Warm-up failed: {e}", warmup_seconds=round(time.time() - started, 2))
+        print(f"[TRANSCRIPTION] Model {model_name} warm-up failed: {e}")
+        return
+    state.update(state='ready', error=None, warmup_seconds=round(time.time() - started, 2))
+    print(f"[TRANSCRIPTION] Model {model_name} warm-up finished in {state['warmup_seconds']}s")
+
+
+def model_state(model_name: str = "base") -> dict:
+    """Model readiness for the health check: state, load/warm-up seconds, and any load error."""
+    return dict(_state(model_name))
+
+
+def _reset_after_fork():
+    # A lock held by another thread at fork time would never be released in the child
+    global _model_lock
+    _model_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure_batching(window_ms: int = 50, max_batch_size: int = 8, language: str = None,
+                       model_name: str = "base", beam_size: int = 5):
+    """Route transcriptions for one model/beam size through a BatchScheduler that batches concurrent requests."""
+    global _scheduler
+    from services.batching import BatchScheduler
+    _scheduler = BatchScheduler(get_model, model_name=model_name, window_ms=window_ms,
+                                max_batch_size=max_batch_size, beam_size=beam_size, language=language)
+    print(f"[TRANSCRIPTION] Batching enabled (window {window_ms}ms, max batch {max_batch_size})")
+
+
+def get_batch_stats():
+    """Batching scheduler counters (queue wait vs compute), or None if batching is off."""
+    return _scheduler.stats() if _scheduler else None
+
+
+def configure_prepass(enabled: bool = True, min_rms: float = 0.003, max_pause_seconds: float = 2.0,
+                      max_rms: float = 0.03, noise_ratio: float = 2.5, peak_ratio: float = 0.5):
+    """
+    Configure the silence pre-pass that runs before Whisper.
+
+    Args:
+        enabled: Skip silent recordings and trim silence before inference
+        min_rms: Lowest RMS level (0-1 full scale) that can count as speech
+        max_pause_seconds: Pauses longer than this are shortened to it
+        max_rms: Highest trim threshold, however loud the background
+        noise_ratio: How many times louder than the noise floor speech must be
+        peak_ratio: Highest trim threshold as a fraction of the loud frames' level
+    """
+    _prepass.update(enabled=enabled, min_rms=float(min_rms), max_pause_seconds=float(max_pause_seconds),
+                    max_rms=float(max_rms), noise_ratio=float(noise_ratio), peak_ratio=float(peak_ratio))
+
+
+def detect_speech(audio: np.ndarray, sample_rate: int = 16000):
+    """
+    Energy-based voice activity pass over 30 ms frames.
+
+    A recording is silent only if less than min_speech_seconds of it rises above
+    the absolute min_rms level. Otherwise it is trimmed: the trim threshold adapts
+    to the noise floor (10th percentile frame RMS) within [min_rms, max_rms], but
+    stays below peak_ratio of the loud frames (95th percentile), since in
+    pause-free speech the "floor" is the speech itself. Voiced regions are padded,
+    leading and trailing silence is dropped and long pauses are shortened.
+
+    Args:
+        audio: Float32 mono samples
+        sample_rate: Sample rate of `audio`
+
+    Returns:
+        (trimmed audio, regions, report) - regions is a list of
+        (original_start, trimmed_start, length) in seconds for mapping timestamps
+        back; trimmed audio is None when no speech was found
+    """
+    frames = audio[:audio.shape[0] // FRAME_SAMPLES * FRAME_SAMPLES].reshape(-1, FRAME_SAMPLES)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1)) if len(frames) else np.zeros(0)
+    frame_seconds = FRAME_SAMPLES / sample_rate
+    original_seconds = audio.shape[0] / sample_rate
+
+    noise_floor = float(np.percentile(rms, 10)) if len(rms) else 0.0
+    peak = float(np.percentile(rms, 95)) if len(rms) else 0.0
+    speech_seconds = float((rms > _prepass['min_rms']).sum()) * frame_seconds
+    # At most peak_ratio of the peak (or min_rms), so a recording that is not silent keeps its speech
+    threshold = max(min(noise_floor * _prepass['noise_ratio'], _prepass['max_rms'], peak * _prepass['peak_ratio']),
+                    _prepass['min_rms'])
+
+    report = {
+        'threshold': round(threshold, 5),
+        'noise_floor': round(noise_floor, 5),
+        'peak': round(peak, 5),
+        'original_seconds': round(original_seconds, 2),
+        'speech_seconds': round(speech_seconds, 2)
+    }
+    if speech_seconds < _prepass['min_speech_seconds']:
+        report.update(silent=True, kept_seconds=0.0, skipped_seconds=round(original_seconds, 2))
+        return None, [], report
+
+    voiced = rms > threshold
+
+    # Pad voiced frames by pad_seconds on each side (a dilation via cumulative sums)
+    pad = int(round(_prepass['pad_seconds'] / frame_seconds))
+    counts = np.concatenate(([0], np.cumsum(voiced)))
+    index = np.arange(len(voiced))
+    keep = counts[np.minimum(index + pad + 1, len(voiced))] - counts[np.maximum(index - pad, 0)] > 0
+
+    # Region boundaries in frames: starts where keep turns on, ends where it turns off
+    edges = np.diff(np.concatenate(([0], keep.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    max_pause = int(round(_prepass['max_pause_seconds'] / frame_seconds))
+    pieces, regions, trimmed_frames = [], [], 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if i > 0:
+            # Keep up to max_pause of the gap before this region, split around the cut
+            gap = start - ends[i - 1]
+            if gap <= max_pause:
+                start = ends[i - 1]
+            else:
+                half = max_pause // 2
+                pieces.append(audio[ends[i - 1] * FRAME_SAMPLES:(ends[i - 1] + half) * FRAME_SAMPLES])
+                regions[-1][2] += half * frame_seconds
+                trimmed_frames += half
+                start -= max_pause - half
+        end_sample = audio.shape[0] if end == len(keep) else end * FRAME_SAMPLES
+        pieces.append(audio[start * FRAME_SAMPLES:end_sample])
+        if i > 0 and start == ends[i - 1]:
+            # Short pause: contiguous with the previous region in the original too
+            regions[-1][2] += (end - start) * frame_seconds
+        else:
+            regions.append([start * frame_seconds, trimmed_frames * frame_seconds, (end - start) * frame_seconds])
+        trimmed_frames += end - start
+
+    trimmed = np.concatenate(pieces)
+    kept_seconds = trimmed.shape[0] / sample_rate
+    report.update(silent=False, kept_seconds=round(kept_seconds, 2),
+                  skipped_seconds=round(original_seconds - kept_seconds, 2))
+    return trimmed, regions, report
+
+
+def _to_original_time(t: float, regions: list) -> float:
+    """Map a timestamp in trimmed audio back to the original recording."""
+    for original_start, trimmed_start, length in reversed(regions):
+        if t >= trimmed_start:
+            return round(original_start + min(t - trimmed_start, length), 2)
+    return round(t, 2)
+
+
+def transcribe_audio(audio, api_key: str = None, model: str = None, details: dict = None,
+                     on_segment=None, whisper_model: str = "base", beam_size: int = 5) -> str:
+    """
+    Transcribe audio using faster-whisper (local).
+
+    Args:
+        audio: Path to an audio file (WAV), or a float32 NumPy array of 16 kHz mono samples
         api_key: Not used (kept for API compatibility)
         model: Not used (kept for API compatibility)
+        details: Optional dict filled with timings (queue_wait_seconds, compute_seconds) and
+            the silence pre-pass report (prepass: thresholds, seconds skipped)
+        on_segment: Optional callback receiving {'text', 'start', 'end'} as each segment is decoded
+        whisper_model: Whisper model size to use (see services.tiers)
+        beam_size: Beam width (1 = greedy decoding)
 
     Returns:
         Transcription text
     """
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio file not found: {audio_path}")
+    if isinstance(audio, np.ndarray):
+        print(f"[TRANSCRIPTION DEBUG] In-memory audio: {audio.shape[0] / 16000:.1f}s "
+              f"({audio.nbytes} bytes)")
+    else:
+        if not os.path.exists(audio):
+            raise FileNotFoundError(f"Audio file not found: {audio}")
+
+        print(f"[TRANSCRIPTION DEBUG] Audio file: {audio}")
+        print(f"[TRANSCRIPTION DEBUG] File size: {os.path.getsize(audio)} bytes")
+
+    regions = []
+    report = None
+    if _prepass['enabled']:
+        # Skip Whisper entirely on silent recordings; trim silence and long pauses otherwise
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=16000)
+        started = time.time()
+        trimmed, regions, report = detect_speech(audio)
+        report['seconds'] = round(time.time() - started, 4)
+        print(f"[TRANSCRIPTION DEBUG] Pre-pass: {report}")
+        if details is not None:
+            details['prepass'] = report
+        if trimmed is None:
+            if details is not None:
+                details.update(queue_wait_seconds=0.0, compute_seconds=0.0)
+            print("[TRANSCRIPTION DEBUG] No speech detected, skipping Whisper")
+            metrics.inc('intake_silent_recordings_total')
+            return ""
+        audio = trimmed
+
+    if _scheduler is not None and _scheduler.accepts(whisper_model, beam_size):
+        # Batched: wait for our slot in the next batch
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=16000)
+        segments, timings = _scheduler.submit(audio).result()
+        # Segments arrive together when the batch finishes; forward each like the unbatched path
+        for segment in segments:
+            if on_segment:
+                on_segment({'text': segment['text'],
+                            'start': _to_original_time(segment['start'], regions),
+                            'end': _to_original_time(segment['end'], regions)})
+        transcription = " ".join(segment['text'] for segment in segments).strip()
+    else:
+        started = time.time()
+
+        # Load model and transcribe
+        loaded_model = get_model(whisper_model)
 
-    print(f"[TRANSCRIPTION DEBUG] Audio file: {audio_path}")
-    print(f"[TRANSCRIPTION DEBUG] File size: {os.path.getsize(audio_path)} bytes")
+        segments, info = loaded_model.transcribe(audio, beam_size=beam_size)
 
-    # Load model and transcribe
-    whisper_model = get_model("base")
+        # Collect all segment texts (segments is lazy: each one is decoded as we iterate)
+        texts = []
+        for segment in segments:
+            texts.append(segment.text)
+            if on_segment:
+                on_segment({'text': segment.text,
+                            'start': _to_original_time(segment.start, regions),
+                            'end': _to_original_time(segment.end, regions)})
+        transcription = " ".join(texts).strip()
+        timings = {'queue_wait_seconds': 0.0, 'compute_seconds': round(time.time() - started, 3)}
 
-    segments, info = whisper_model.transcribe(audio_path, beam_size=5)
+    if details is not None:
+        details.update(timings)
 
-    # Collect all segment texts
-    transcription = " ".join(segment.text for segment in segments).strip()
+    audio_seconds = audio.shape[0] / 16000 if isinstance(audio, np.ndarray) else info.duration
+    metrics.observe('intake_whisper_audio_seconds', audio_seconds, model=whisper_model)
+    metrics.observe('intake_whisper_wall_seconds', timings['compute_seconds'], model=whisper_model)
+    if audio_seconds:
+        metrics.observe('intake_whisper_realtime_factor', timings['compute_seconds'] / audio_seconds,
+                        model=whisper_model)
 
     print(f"[TRANSCRIPTION DEBUG] Raw transcription: '{transcription}'")
     print(f"[TRANSCRIPTION DEBUG] Transcription length: {len(transcription)}")
@@ -0,0 +1,205 @@
+"""
+Standalone transcription worker.
+
+    python -m services.worker               # WORKER_THREADS inference threads
+    python -m services.worker --threads 2
+
+With TRANSCRIPTION_BACKEND=spool the web workers only take uploads: each
+transcription job goes into the job spool (SPOOL_DIR), and worker processes
+claim it, decode the recording, run Whisper and write the transcript back to
+the spool and the session store, publishing the same progress events as
+in-process jobs. Inference then scales with the number of worker processes
+and threads, and web latency does not depend on it. Workers must run on the
+same host as the web workers: they share SPOOL_DIR, SESSION_DB_PATH and the
+upload folder.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from config import Config
+from services import events, metrics, speculation, symptom_matcher, tiers, transcript_cache
+from services.audio_extractor import extract_audio_array
+from services.ingest import check_decoded_duration, remove_recording
+from services.session_store import create_store
+from services.spool import JobSpool
+from services.transcription import configure_model, configure_prepass, preload_model, transcribe_audio
+
+
+def transcribe_job(spool: JobSpool, store, job: dict):
+    """Extract and transcribe one claimed job, storing the result if its recording is still current."""
+    session_id, question_id = job['session_id'], job['question_id']
+    current = {'recording_id': job['recording_id']}
+    details = {}
+    video_path = job['video_path']
+
+    if not store.update_question(session_id, question_id, expect=current, job_status='running'):
+        # Re-recorded or evicted since it was queued
+        spool.finish(job, 'superseded')
+        return
+    metrics.observe('intake_queue_wait_seconds', job['started_at'] - job['submitted_at'])
+
+    def publish_stage(stage, status, **extra):
+        events.publish(session_id, 'stage', dict({'question_id': question_id, 'stage': stage, 'status': status},
+                                                 **extra))
+
+    def publish_segment(segment):
+        events.publish(session_id, 'segment', dict(segment, question_id=question_id))
+
+    stage = 'extract'
+    try:
+        audio = spool.load_audio(job)
+        if audio is None:
+            publish_stage('extract', 'started')
+            audio = extract_audio_array(video_path)
+            check_decoded_duration(video_path, audio, Config.MIN_VIDEO_DURATION, Config.MAX_VIDEO_DURATION)
+            publish_stage('extract', 'done')
+
+        stage = 'transcribe'
+        if spool.cancelled(job):
+            # Session evicted while the recording was decoded
+            spool.finish(job, 'superseded')
+            return
+        audio_hash = transcript_cache.hash_audio(audio)
+        session = store.get(session_id)
+        transcription = transcript_cache.find_in_session(session, audio_hash=audio_hash) if session else None
+        if transcription is None:
+            transcription = transcript_cache.get_cache().get(audio_hash)
+        if transcription is not None:
+            # Same audio in a different file (e.g. re-encoded re-upload): skip inference
+            details['cached'] = 'audio'
+        else:
+            # Pick the quality tier from the load across all workers
+            tier = tiers.select(spool.queue_depth())
+            details['tier'] = tier['name']
+            publish_stage('transcribe', 'started')
+            transcription = transcribe_audio(audio, details=details, on_segment=publish_segment,
+                                             whisper_model=tier['model'], beam_size=tier['beam_size'])
+            publish_stage('transcribe', 'done')
+            tiers.record(time.time() - job['submitted_at'])
+    except Exception as e:
+        metrics.inc('intake_errors_total', stage=stage)
+        print(f"[WORKER] Job {job['job_id']} (q{question_id}) failed: {e}")
+        spool.finish(job, 'error', error=str(e))
+        if store.update_question(session_id, question_id, expect=current, video_path=None, audio_path=None,
+                                 job_status='error', job_error=str(e)):
+            publish_stage('transcribe', 'error', error=str(e))
+        return
+    finally:
+        remove_recording(video_path)
+
+    if not spool.finish(job, 'done', result=transcription, details=details):
+        print(f"[WORKER] Job {job['job_id']} (q{question_id}) was cancelled, result dropped")
+        return
+    transcript_cache.get_cache().put(transcription, job['upload_hash'], audio_hash)
+    if store.update_question(session_id, question_id, expect=current,
+                             transcription=transcription,
+                             transcribed_at=datetime.now().isoformat(),
+                             timings=details, video_path=None, audio_path=None,
+                             audio_hash=audio_hash,
+                             tier=details.get('tier'),
+                             job_status='done'):
+        events.publish(session_id, 'transcription', {'question_id': question_id, 'transcription': transcription})
+        speculation.on_transcription(session_id)
+    print(f"[WORKER] Job {job['job_id']} (q{question_id}) finished in {time.time() - job['started_at']:.1f}s "
+          f"(queued {job['started_at'] - job['submitted_at']:.1f}s)")
+
+
+def run(spool: JobSpool, store, stopping: threading.Event, poll_seconds: float = 0.5):
+    """Claim and transcribe jobs until `stopping` is set."""
+    while not stopping.is_set():
+        try:
+            job = spool.claim()
+        except Exception as e:
+            print(f"[WORKER] Could not claim a job: {e}")
+            job = None
+        if job is None:
+            stopping.wait(poll_seconds)
+            continue
+        try:
+            transcribe_job(spool, store, job)
+        except Exception as e:
+            print(f"[WORKER] Job {job['job_id']} could not be recorded: {e}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Transcribe recordings queued in the job spool")
+    parser.add_argument('--spool', default=Config.SPOOL_DIR, help="job spool directory")
+    parser.add_argument('--db', default=Config.SESSION_DB_PATH, help="SQLite session store")
+    parser.add_argument('--threads', type=int, default=Config.WORKER_THREADS, help="parallel transcriptions")
+    parser.add_argument('--poll', type=float, default=0.5, help="seconds between checks of an empty queue")
+    args = parser.parse_args(argv)
+
+    store = create_store('sqlite', args.db)
+    events.configure(store)
+    spool = JobSpool(args.spool)
+    metrics.configure(Config.METRICS_DIR)
+
+    threads = max(1, args.threads)
+    configure_model(Config.WHISPER_CPU_THREADS, threads, Config.WHISPER_COMPUTE_TYPE)
+    configure_prepass(Config.SILENCE_PREPASS, Config.SILENCE_MIN_RMS, Config.SILENCE_MAX_PAUSE_SECONDS,
+                      max_rms=Config.SILENCE_MAX_RMS, noise_ratio=Config.SILENCE_NOISE_RATIO,
+                      peak_ratio=Config.SILENCE_PEAK_RATIO)
+    transcript_cache.configure(Config.TRANSCRIPT_CACHE_SIZE)
+    tiers.configure(
+        Config.TRANSCRIPTION_TIERS,
+        queue_high=Config.TIER_QUEUE_HIGH,
+        queue_low=Config.TIER_QUEUE_LOW,
+        latency_high=Config.TIER_P95_HIGH_SECONDS,
+        latency_low=Config.TIER_P95_LOW_SECONDS,
+        min_dwell_seconds=Config.TIER_MIN_DWELL_SECONDS
+    )
+    if Config.SPECULATIVE_ANALYSIS:
+        # Speculative analyses start here, as each answer is transcribed
+        from services.symptom_analyzer import configure_client
+        configure_client(
+            max_connections=Config.CLAUDE_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.CLAUDE_MAX_KEEPALIVE,
+            timeout=Config.CLAUDE_TIMEOUT,
+            connect_timeout=Config.CLAUDE_CONNECT_TIMEOUT,
+            max_retries=Config.CLAUDE_MAX_RETRIES,
+            base_url=Config.CLAUDE_BASE_URL
+        )
+        symptom_matcher.configure(Config.SYMPTOM_CATEGORIES, Config.SYMPTOM_SYNONYMS)
+        speculation.configure(store, True, Config.CLAUDE_API_KEY, Config.CLAUDE_MODEL, Config.SYMPTOM_CATEGORIES,
+                              Config.ANALYSIS_SHORTLIST,
+                              run_timeout=Config.CLAUDE_TIMEOUT * (Config.CLAUDE_MAX_RETRIES + 1))
+    if Config.WHISPER_BATCHING:
+        from services.transcription import configure_batching
+        configure_batching(Config.WHISPER_BATCH_WINDOW_MS, Config.WHISPER_BATCH_MAX_SIZE, Config.WHISPER_LANGUAGE,
+                           model_name=tiers.primary_tier()['model'], beam_size=tiers.primary_tier()['beam_size'])
+
+    # Warm every tier's model before taking jobs, so none waits on a cold start
+    for tier in tiers.model_tiers():
+        preload_model(tier['model'], tier['beam_size'])
+
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        print("[WORKER] Stopping after the current jobs")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Batched jobs only wait on the scheduler, so claim enough of them at once for a batch to fill
+    claimers = max(threads, Config.WHISPER_BATCH_MAX_SIZE) if Config.WHISPER_BATCHING else threads
+    workers = [threading.Thread(target=run, args=(spool, store, stopping, args.poll), name=f"worker-{i}")
+               for i in range(claimers)]
+    for thread in workers:
+        thread.start()
+    print(f"[WORKER] Transcribing jobs from {args.spool} with {threads} model workers and {claimers} threads "
+          f"(pid {os.getpid()})")
+    while any(thread.is_alive() for thread in workers):
+        for thread in workers:
+            thread.join(timeout=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,7 @@ const state = {
     mediaRecorder: null,
     recordedChunks: [],
     recordedBlobs: {},
+    uploads: {},
     isRecording: false,
     recordingStartTime: null,
     timerInterval: null
@@ -68,6 +69,7 @@ const elements = {
 
 // Initialize application
 async function init() {
+    document.body.classList.toggle('audio-only', Boolean(window.AUDIO_ONLY_CAPTURE));
     setupEventListeners();
 }
 
@@ -139,8 +141,14 @@ async function initCamera() {
     elements.cameraError.classList.add('hidden');
 
     try {
+        // In audio-only mode the camera only feeds the on-screen preview, so a small one will do
         const stream = await navigator.mediaDevices.getUserMedia({
-            video: {
+            video: window.AUDIO_ONLY_CAPTURE ? {
+                width: { ideal: 320 },
+                height: { ideal: 240 },
+                frameRate: { ideal: 15 },
+                facingMode: 'user'
+            } : {
                 width: { ideal: 1280 },
                 height: { ideal: 720 },
                 facingMode: 'user'
@@ -224,8 +232,22 @@ function showControls(mode) {
 }
 
 // Recording Handlers
-function handleStartRecording() {
-    state.recordedChunks = [];
+function recordingFormat() {
+    // Audio-only mode records just the microphone as Opus at speech bitrate
+    if (window.AUDIO_ONLY_CAPTURE) {
+        const mimeType = ['audio/webm;codecs=opus', 'audio/ogg;codecs=opus', 'audio/webm']
+            .find(type => MediaRecorder.isTypeSupported(type));
+        if (mimeType) {
+            return {
+                mimeType,
+                media: 'audio',
+                extension: mimeType.startsWith('audio/ogg') ? 'ogg' : 'webm',
+                stream: new MediaStream(state.mediaStream.getAudioTracks()),
+                options: { mimeType, audioBitsPerSecond: 32000 }
+            };
+        }
+        console.warn('Audio-only recording not supported by this browser, recording video');
+    }
 
     // Determine supported mime type
     let mimeType = 'video/webm;codecs=vp9,opus';
@@ -235,12 +257,25 @@ function handleStartRecording() {
             mimeType = 'video/webm';
         }
     }
+    return { mimeType, media: 'video', extension: 'webm', stream: state.mediaStream, options: { mimeType } };
+}
 
-    state.mediaRecorder = new MediaRecorder(state.mediaStream, { mimeType });
+function handleStartRecording() {
+    state.recordedChunks = [];
+
+    const format = recordingFormat();
+    const mimeType = format.mimeType;
+    state.recordingFormat = format;
+    state.mediaRecorder = new MediaRecorder(format.stream, format.options);
+
+    // Stream chunks to the server while recording so decoding starts right away
+    const upload = createChunkUpload(state.currentQuestion, format.media, mimeType);
+    state.uploads[state.currentQuestion] = upload;
 
     state.mediaRecorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
             state.recordedChunks.push(event.data);
+            enqueueChunk(upload, event.data);
         }
     };
 
@@ -248,12 +283,14 @@ function handleStartRecording() {
         const blob = new Blob(state.recordedChunks, { type: mimeType });
         state.recordedBlobs[state.currentQuestion] = blob;
 
-        // Show playback
+        // Show playback (an audio recording plays behind the live preview)
         const url = URL.createObjectURL(blob);
         elements.playbackVideo.src = url;
-        elements.playbackVideo.classList.remove('hidden');
-        elements.recordingPreview.classList.add('hidden');
-        
+        if (format.media === 'video') {
+            elements.playbackVideo.classList.remove('hidden');
+            elements.recordingPreview.classList.add('hidden');
+        }
+
         // Show play button (video starts paused)
         elements.videoPlayButton.classList.remove('hidden');
 
@@ -289,11 +326,17 @@ function updateTimer() {
     const minutes = Math.floor(elapsed / 60);
     const seconds = elapsed % 60;
     elements.recordingTimer.textContent = `${minutes}:${seconds.toString().padStart(2, '0')}`;
+
+    // The server rejects answers over the limit, so stop there
+    if (elapsed >= window.MAX_RECORDING_SECONDS) {
+        handleStopRecording();
+    }
 }
 
 function handleRerecord() {
-    // Clear recorded blob
+    // Clear recorded blob (the next recording starts a new streaming upload)
     delete state.recordedBlobs[state.currentQuestion];
+    delete state.uploads[state.currentQuestion];
 
     // Pause and hide playback video
     elements.playbackVideo.pause();
@@ -336,14 +379,22 @@ async function handleContinue() {
     elements.continueBtn.textContent = 'Uploading...';
 
     try {
-        const formData = new FormData();
-        formData.append('video', blob, `q${state.currentQuestion}.webm`);
-        formData.append('question_id', state.currentQuestion);
+        // Chunks were streamed during recording; fall back to a single upload if that failed
+        let result = await completeChunkUpload(state.uploads[state.currentQuestion]);
 
-        const result = await apiCall('/api/video/upload', 'POST', formData);
+        if (!result || !result.success) {
+            const formData = new FormData();
+            const format = state.recordingFormat;
+            formData.append(format.media, blob, `q${state.currentQuestion}.${format.extension}`);
+            formData.append('question_id', state.currentQuestion);
+
+            result = await apiCall('/api/video/upload', 'POST', formData);
+        }
 
         if (!result.success) {
-            throw new Error(result.error || 'Upload failed');
+            const uploadError = new Error(result.error || 'Upload failed');
+            uploadError.fromServer = Boolean(result.error);
+            throw uploadError;
         }
 
         // Move to next question or processing
@@ -358,7 +409,8 @@ async function handleContinue() {
 
     } catch (error) {
         console.error('Upload error:', error);
-        alert('Failed to upload video. Please try again.');
+        // Show the server's reason (e.g. too short or too large) when there is one
+        alert(error.fromServer ? error.message : 'Failed to upload video. Please try again.');
     } finally {
         elements.continueBtn.disabled = false;
         elements.continueBtn.innerHTML = `
@@ -370,6 +422,89 @@ async function handleContinue() {
     }
 }
 
+// Streaming (chunked) upload
+function createChunkUpload(questionId, media = 'video', mimeType = '') {
+    return {
+        questionId,
+        media,
+        mimeType,
+        uploadId: createUploadId(),
+        nextSeq: 0,
+        queue: Promise.resolve(),
+        failed: false
+    };
+}
+
+function createUploadId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+function enqueueChunk(upload, data) {
+    const seq = upload.nextSeq++;
+    // Chunks are sent strictly in order; each waits for the previous one
+    upload.queue = upload.queue.then(() => sendChunk(upload, seq, data));
+}
+
+async function sendChunk(upload, seq, data, attempt = 0) {
+    if (upload.failed) return;
+
+    // media and mimetype name the server's partial file after the finished recording
+    const params = `question_id=${upload.questionId}&upload_id=${upload.uploadId}` +
+        `&media=${upload.media}&mimetype=${encodeURIComponent(upload.mimeType)}`;
+    try {
+        const response = await fetch(`/api/video/chunk?${params}&seq=${seq}`, {
+            method: 'POST',
+            body: data
+        });
+        if (response.ok) return;
+        if (response.status === 413) {
+            // Over the size limit: retrying cannot help
+            upload.failed = true;
+            return;
+        }
+        throw new Error(`Chunk ${seq} rejected (${response.status})`);
+    } catch (error) {
+        if (attempt >= 4) {
+            console.error('Chunk upload failed, will upload the full recording instead:', error);
+            upload.failed = true;
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+
+        // Resume: skip the resend if the server already stored this chunk
+        try {
+            const progress = await apiCall(`/api/video/chunk?${params}`);
+            if (progress.next_seq > seq) return;
+        } catch (progressError) {
+            // Still offline; retry the chunk anyway
+        }
+        return sendChunk(upload, seq, data, attempt + 1);
+    }
+}
+
+async function completeChunkUpload(upload) {
+    if (!upload || upload.failed || upload.nextSeq === 0) return null;
+
+    await upload.queue;
+    if (upload.failed) return null;
+
+    try {
+        return await apiCall('/api/video/chunk/complete', 'POST', {
+            question_id: upload.questionId,
+            upload_id: upload.uploadId,
+            total_chunks: upload.nextSeq,
+            media: upload.media,
+            mimetype: upload.mimeType
+        });
+    } catch (error) {
+        console.error('Completing chunked upload failed:', error);
+        return null;
+    }
+}
+
 // Processing
 async function processResponses() {
     const transcriptions = {};
@@ -377,12 +512,24 @@ async function processResponses() {
     // Show complete screen early with loading states
     showCompleteScreenProgressive();
 
-    // Transcribe each question (only those that were recorded)
+    // Render transcription text as it is decoded (the requests below remain the source of truth)
+    const progressStream = openProgressStream();
+
+    // Collect each question's transcription (only those that were recorded)
     for (let i = 1; i <= state.totalQuestions; i++) {
         updateProcessingStep(i, 'active');
 
         try {
-            const result = await apiCall(`/api/transcribe/${i}`, 'POST', {});
+            // Transcription started at upload time; the server long-polls until it's done
+            let result = await apiCall(`/api/transcribe/${i}`, 'POST', {});
+            while (result.pending || result.queued) {
+                if (result.queued) {
+                    // The server is at capacity (429): show our place in line and ask again when told
+                    showQueuePosition(i, result.position);
+                    await new Promise(resolve => setTimeout(resolve, result.retry_after * 1000));
+                }
+                result = await apiCall(`/api/transcribe/${i}`, 'POST', {});
+            }
             if (result.success) {
                 // Store transcription even if it's an empty string
                 transcriptions[i] = result.transcription !== undefined ? result.transcription : null;
@@ -407,7 +554,7 @@ async function processResponses() {
     updateProcessingStep('analyze', 'active');
 
     try {
-        const analysisResult = await apiCall('/api/analyze', 'POST', {});
+        const analysisResult = await requestAnalysis(progressStream);
         if (analysisResult.success) {
             updateProcessingStep('analyze', 'complete');
 
@@ -424,12 +571,112 @@ async function processResponses() {
         updateAnalysisDisplay(null, true);
     }
 
+    if (progressStream) {
+        progressStream.close();
+    }
+
     // Stop camera stream
     if (state.mediaStream) {
         state.mediaStream.getTracks().forEach(track => track.stop());
     }
 }
 
+// Analysis runs in the background on the server; the result arrives on the event stream
+function requestAnalysis(progressStream) {
+    if (!progressStream || progressStream.readyState === EventSource.CLOSED) {
+        return apiCall('/api/analyze', 'POST', {});
+    }
+
+    return new Promise((resolve) => {
+        let pollTimer = null;
+        let polls = 0;
+        const finish = (result) => {
+            clearInterval(pollTimer);
+            resolve(result);
+        };
+
+        // Local keyword matches first, then Claude's categories one by one while the
+        // rest of the analysis is generated
+        const categories = [];
+        progressStream.addEventListener('analysis_provisional', (event) => {
+            const provisional = JSON.parse(event.data).analysis;
+            if (categories.length === 0 && provisional.matched_categories.length > 0) {
+                updateAnalysisDisplay(provisional, false, true);
+            }
+        });
+        progressStream.addEventListener('analysis_category', (event) => {
+            categories.push(JSON.parse(event.data).category);
+            updateAnalysisDisplay({ matched_categories: categories }, false, true);
+        });
+        progressStream.addEventListener('analysis', (event) => {
+            finish({ success: true, analysis: JSON.parse(event.data).analysis });
+        });
+        progressStream.addEventListener('stage', (event) => {
+            const data = JSON.parse(event.data);
+            if (data.stage === 'analyze' && data.status === 'error') {
+                finish({ success: false, error: data.error });
+            }
+        });
+
+        apiCall('/api/analyze?background', 'POST', {}).then((response) => {
+            if (!response.pending) {
+                finish(response);
+                return;
+            }
+            // Fallback in case the event stream is blocked by a proxy
+            pollTimer = setInterval(async () => {
+                polls += 1;
+                try {
+                    const summary = await apiCall('/api/summary');
+                    if (summary.analysis) {
+                        finish({ success: true, analysis: summary.analysis });
+                    } else if (polls >= 60) {
+                        finish({ success: false, error: 'Analysis timed out' });
+                    }
+                } catch (error) {
+                    // Keep waiting for the event stream
+                }
+            }, 5000);
+        }).catch((error) => finish({ success: false, error: error.message }));
+    });
+}
+
+// Live progress via Server-Sent Events
+function openProgressStream() {
+    if (!window.EventSource) return null;
+
+    const source = new EventSource('/api/session/events');
+    const partialText = {};
+
+    source.addEventListener('stage', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.stage === 'analyze') {
+            if (data.status === 'started') showAnalysisLoading();
+            return;
+        }
+        if (data.stage === 'transcribe' && data.status === 'started') {
+            partialText[data.question_id] = '';
+            updateProcessingStep(data.question_id, 'active');
+        }
+    });
+
+    source.addEventListener('segment', (event) => {
+        const data = JSON.parse(event.data);
+        partialText[data.question_id] = (partialText[data.question_id] || '') + data.text;
+        updateTranscriptionDisplay(data.question_id, partialText[data.question_id].trim(), false, true);
+    });
+
+    source.addEventListener('transcription', (event) => {
+        const data = JSON.parse(event.data);
+        updateProcessingStep(data.question_id, 'complete');
+        updateTranscriptionDisplay(data.question_id, data.transcription);
+    });
+
+    source.addEventListener('analysis', () => source.close());
+
+    return source;
+}
+
 function updateProcessingStep(step, status) {
     const stepId = typeof step === 'number' ? `step-transcribe-${step}` : `step-${step}`;
     const stepElement = document.getElementById(stepId);
@@ -482,12 +729,13 @@ function showCompleteScreenProgressive() {
     elements.analysisSummary.innerHTML = '<p><span class="spinner small"></span> Waiting for transcriptions to complete...</p>';
 }
 
-function updateTranscriptionDisplay(questionId, transcription, isError = false) {
+function updateTranscriptionDisplay(questionId, transcription, isError = false, isPartial = false) {
     const element = document.getElementById(`transcription-${questionId}`);
     if (!element) return;
 
     const textElement = element.querySelector('.transcription-text');
-    
+    textElement.classList.toggle('partial', isPartial);
+
     if (isError) {
         textElement.innerHTML = '<em style="color: #d32f2f;">Transcription failed</em>';
     } else if (transcription === null || transcription === undefined) {
@@ -499,11 +747,20 @@ function updateTranscriptionDisplay(questionId, transcription, isError = false)
     }
 }
 
+function showQueuePosition(questionId, position) {
+    const element = document.getElementById(`transcription-${questionId}`);
+    if (!element) return;
+
+    const textElement = element.querySelector('.transcription-text');
+    textElement.classList.add('partial');
+    textElement.innerHTML = `<em>Waiting in line for transcription (position ${position})...</em>`;
+}
+
 function showAnalysisLoading() {
     elements.analysisSummary.innerHTML = '<p><span class="spinner small"></span> Analyzing your symptoms...</p>';
 }
 
-function updateAnalysisDisplay(analysis, isError = false) {
+function updateAnalysisDisplay(analysis, isError = false, isPartial = false) {
     console.log('[DEBUG] Analysis received:', analysis);
     
     if (isError || !analysis) {
@@ -534,6 +791,10 @@ function updateAnalysisDisplay(analysis, isError = false) {
         `;
     }
 
+    if (isPartial) {
+        analysisHtml += '<p><span class="spinner small"></span> Preparing notes for your care team...</p>';
+    }
+
     // If no matched categories, show a message
     if (!analysisHtml) {
         analysisHtml = '<p>Analysis complete. Our clinical team will review your responses.</p>';
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Keep the app's SQLite store and metrics out of the checkout when tests import it
+_scratch = tempfile.mkdtemp(prefix='longcovid-intake-tests-')
+os.environ.setdefault('SESSION_DB_PATH', os.path.join(_scratch, 'sessions.db'))
+os.environ.setdefault('METRICS_DIR', os.path.join(_scratch, 'metrics'))
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from services import symptom_analyzer
+from services.symptom_analyzer import AnalysisCache, analysis_cache_key
+
+ANSWERS = {1: "I get tired after a short walk", 2: "Brain fog most afternoons", 3: "My heart races when I stand"}
+CATEGORIES = [{'id': 'fatigue', 'name': 'Fatigue'}, {'id': 'cognitive', 'name': 'Cognitive'}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(symptom_analyzer.time, 'time', lambda: now[0])
+    return now
+
+
+def analysis(n):
+    return {'matched_categories': [{'id': f'c{n}'}], 'summary': f'analysis {n}'}
+
+
+def test_entries_expire_after_the_ttl(clock, tmp_path):
+    cache = AnalysisCache(max_entries=4, ttl_seconds=60, db_path=str(tmp_path / 'cache.db'))
+    cache.put('k', analysis(1))
+
+    clock[0] += 60
+    assert cache.get('k') == analysis(1)
+    clock[0] += 1
+    assert cache.get('k') is None
+    # Expired on disk too, not just in memory
+    assert AnalysisCache(max_entries=4, ttl_seconds=60, db_path=cache.db_path).get('k') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = AnalysisCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', analysis(1))
+    cache.put('b', analysis(2))
+    assert cache.get('a') == analysis(1)  # b is now the oldest
+
+    cache.put('c', analysis(3))
+
+    assert cache.get('b') is None
+    assert cache.get('a') == analysis(1) and cache.get('c') == analysis(3)
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+
+
+def test_evicted_entries_are_read_back_from_disk(clock, tmp_path):
+    cache = AnalysisCache(max_entries=1, ttl_seconds=60, db_path=str(tmp_path / 'cache.db'))
+    cache.put('a', analysis(1))
+    cache.put('b', analysis(2))
+
+    assert cache.get('a') == analysis(1)
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_returned_analyses_are_copies(clock):
+    cache = AnalysisCache()
+    cache.put('k', analysis(1))
+    cache.get('k')['matched_categories'].clear()
+    assert cache.get('k') == analysis(1)
+
+
+def test_each_thread_reuses_its_connection(tmp_path):
+    cache = AnalysisCache(db_path=str(tmp_path / 'cache.db'))
+    first = cache._connect()
+    cache.put('k', analysis(1))
+    cache.get('k')
+    assert cache._connect() is first
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_key_depends_on_answers_model_and_categories():
+    key = analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES)
+
+    # Whitespace does not change what Claude is asked
+    assert analysis_cache_key({q: f"  {text}\n" for q, text in ANSWERS.items()},
+                              'claude-sonnet-4-20250514', CATEGORIES) == key
+    assert analysis_cache_key(ANSWERS, 'claude-3-5-haiku-20241022', CATEGORIES) != key
+    assert analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES[:1]) != key
+    assert analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES[::-1]) != key
+    assert analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514') != key
+    assert analysis_cache_key({**ANSWERS, 3: "My heart races when I sit"}, 'claude-sonnet-4-20250514',
+                              CATEGORIES) != key
+
+
+def test_key_depends_on_the_prompt_version(monkeypatch):
+    key = analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES)
+    monkeypatch.setattr(symptom_analyzer, 'PROMPT_VERSION', symptom_analyzer.PROMPT_VERSION + 1)
+    assert analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES) != key
+
+
+def test_prompt_and_key_follow_the_configured_questions(monkeypatch):
+    from config import Config
+
+    prompt = symptom_analyzer.build_analysis_prompt(ANSWERS)
+    for question in Config.QUESTIONS:
+        assert f"### Question {question['id']}: {question['title']}\n\"{question['text']}\"" in prompt
+
+    key = analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES)
+    reworded = ((1, "Main Concerns", "What bothers you most?"),) + symptom_analyzer.INTERVIEW_QUESTIONS[1:]
+    monkeypatch.setattr(symptom_analyzer, 'INTERVIEW_QUESTIONS', reworded)
+    assert analysis_cache_key(ANSWERS, 'claude-sonnet-4-20250514', CATEGORIES) != key
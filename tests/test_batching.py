@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import batching
+from services.batching import BatchScheduler
+
+
+class FakePipeline:
+    built = 0
+
+    def __init__(self, model):
+        FakePipeline.built += 1
+
+    def forward(self, features, tokenizer, metadata, options):
+        # One segment per chunk whose text identifies the request's audio
+        return [[{'text': f"voice {feature[0, 0]:.0f}", 'start': meta['offset'], 'end': meta['duration']}]
+                for feature, meta in zip(features, metadata)]
+
+
+FAKE_API = SimpleNamespace(
+    get_speech_timestamps=lambda audio, options: [{'start': 0, 'end': audio.shape[0]}],
+    VadOptions=lambda **kwargs: None,
+    collect_chunks=lambda audio, timestamps, max_duration: (
+        [audio], [{'offset': 0.0, 'duration': audio.shape[0] / batching.SAMPLE_RATE}]),
+    pad_or_trim=lambda features: features,
+    Tokenizer=lambda *args, **kwargs: None,
+    TranscriptionOptions=lambda **kwargs: kwargs,
+    get_suppressed_tokens=lambda tokenizer, tokens: [],
+    BatchedInferencePipeline=FakePipeline
+)
+
+
+class FakeModel:
+    hf_tokenizer = None
+    model = SimpleNamespace(is_multilingual=False)
+
+    def feature_extractor(self, chunk):
+        return np.full((1, 4), chunk[0])
+
+    def transcribe(self, audio, beam_size=5, language=None):
+        segment = SimpleNamespace(text=f"voice {audio[0]:.0f}", start=0.0, end=audio.shape[0] / batching.SAMPLE_RATE)
+        return iter([segment]), None
+
+
+def submit_together(scheduler, *levels):
+    futures = [scheduler.submit(np.full(batching.SAMPLE_RATE, float(level), dtype=np.float32)) for level in levels]
+    return [future.result(timeout=10) for future in futures]
+
+
+@pytest.mark.parametrize('api', [FAKE_API, None], ids=['batched', 'transcribe-fallback'])
+def test_concurrent_requests_get_their_own_segments(api, monkeypatch):
+    monkeypatch.setattr(batching, '_api', api)
+    FakePipeline.built = 0
+    model = FakeModel()
+    scheduler = BatchScheduler(lambda name: model, window_ms=300)
+
+    (first, timings), (second, _) = submit_together(scheduler, 1, 2)
+
+    assert first == [{'text': "voice 1", 'start': 0.0, 'end': 1.0}]
+    assert second == [{'text': "voice 2", 'start': 0.0, 'end': 1.0}]
+    stats = scheduler.stats()
+    assert (stats['requests'], stats['batches'], timings['batch_requests']) == (2, 1, 2)
+    # One batch's wall time, counted once however many requests shared it
+    assert stats['compute_seconds'] == pytest.approx(timings['compute_seconds'], abs=1e-3)
+
+    submit_together(scheduler, 3)
+    assert FakePipeline.built == (1 if api else 0)
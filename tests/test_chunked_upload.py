@@ -0,0 +1,42 @@
+import os
+
+from services import chunked_upload
+
+
+def test_audio_only_ogg_upload_keeps_its_container(tmp_path):
+    import app
+
+    folder = str(tmp_path)
+    upload_id = 'a' * 32
+    mimetype = 'audio/ogg;codecs=opus'
+    part = {'media': 'audio', 'extension': app.recording_extension(mimetype)}
+    for seq, data in enumerate([b'OggS', b'rest']):
+        chunked_upload.append_chunk(folder, 2, upload_id, seq, data, decode=False, **part)
+    assert sorted(os.listdir(folder)) == [
+        f'q2_{upload_id}_audio.ogg.part', f'q2_{upload_id}_audio.ogg.part.json']
+
+    path = os.path.join(folder, app.recording_filename(2, upload_id, 'audio', mimetype))
+    assert chunked_upload.complete(folder, 2, upload_id, 2, path, **part) is None
+    assert os.listdir(folder) == [f'q2_{upload_id}_audio.ogg']
+    with open(path, 'rb') as f:
+        assert f.read() == b'OggSrest'
+
+
+def test_complete_request_passes_the_mimetype_through(tmp_path, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.Config, 'UPLOAD_FOLDER', str(tmp_path))
+    checked = []
+    monkeypatch.setattr(app, 'check_recording', lambda video_path, audio=None: checked.append(video_path) or 'stop')
+    client = app.app.test_client()
+    session_id = client.post('/api/session/start').get_json()['session_id']
+    upload_id = 'b' * 32
+    query = f'question_id=1&upload_id={upload_id}&media=audio&mimetype=audio%2Fogg%3Bcodecs%3Dopus'
+
+    assert client.post(f'/api/video/chunk?{query}&seq=0', data=b'OggS').status_code == 200
+    assert client.get(f'/api/video/chunk?{query}').get_json()['next_seq'] == 1
+    client.post('/api/video/chunk/complete', json={
+        'question_id': 1, 'upload_id': upload_id, 'total_chunks': 1,
+        'media': 'audio', 'mimetype': 'audio/ogg;codecs=opus'})
+
+    assert checked == [os.path.join(str(tmp_path), session_id, f'q1_{upload_id}_audio.ogg')]
@@ -0,0 +1,28 @@
+import pytest
+
+from services import events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app as intake_app
+
+    monkeypatch.setattr(events, '_max_streams', 1)
+    client = intake_app.app.test_client()
+    client.post('/api/session/start?test')
+    return client
+
+
+def test_streams_past_the_cap_are_told_not_to_reconnect(client):
+    first = client.get('/api/session/events')
+    assert first.status_code == 200 and first.mimetype == 'text/event-stream'
+    assert events.open_streams() == 1
+
+    refused = client.get('/api/session/events')
+    assert refused.status_code == 204
+
+    first.close()
+    assert events.open_streams() == 0
+    second = client.get('/api/session/events')
+    assert second.status_code == 200
+    second.close()
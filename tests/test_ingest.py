@@ -0,0 +1,161 @@
+import hashlib
+import io
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from services import ingest
+
+BOUNDARY = 'XyZzYboundary'
+
+
+class Trickle(io.RawIOBase):
+    """Request body that hands out at most `step` bytes per read and counts what was consumed."""
+
+    def __init__(self, data, step):
+        self.data, self.step, self.consumed = data, step, 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.step if size < 0 else min(size, self.step)
+        piece = self.data[self.consumed:self.consumed + size]
+        self.consumed += len(piece)
+        return piece
+
+
+def multipart(payload, field='video'):
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="question_id"\r\n\r\n2\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="answer.webm"\r\n'
+            f'Content-Type: video/webm\r\n\r\n').encode() + payload + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+@pytest.mark.parametrize('step', [1, 2, 5, len(BOUNDARY) + 3, 4096])
+def test_boundary_split_across_reads(tmp_path, step):
+    # Looks like the start of a boundary but is file data
+    payload = (b'\x1a\x45\xdf\xa3' + b'\r\n--' + BOUNDARY[:-1].encode() + b'!' + bytes(range(256))) * 8
+
+    fields, files = ingest.receive_multipart(Trickle(multipart(payload), step), BOUNDARY, str(tmp_path), 10 ** 6)
+
+    assert fields == {'question_id': '2'}
+    upload = files['video']
+    assert upload['filename'] == 'answer.webm' and upload['mimetype'] == 'video/webm'
+    assert upload['size'] == len(payload)
+    assert upload['sha256'] == hashlib.sha256(payload).hexdigest()
+    with open(upload['path'], 'rb') as f:
+        assert f.read() == payload
+
+
+def test_oversize_upload_is_refused_before_the_body_is_read(tmp_path):
+    body = Trickle(multipart(b'\0' * (4 * 1024 * 1024)), ingest.CHUNK_SIZE)
+
+    with pytest.raises(ingest.UploadTooLarge):
+        ingest.receive_multipart(body, BOUNDARY, str(tmp_path), 256 * 1024)
+
+    assert body.consumed <= 256 * 1024 + 2 * ingest.CHUNK_SIZE
+    assert os.listdir(tmp_path) == []
+
+
+def test_body_ending_mid_part_is_rejected(tmp_path):
+    body = multipart(b'frames' * 100)[:-40]
+
+    with pytest.raises(ValueError):
+        ingest.receive_multipart(Trickle(body, 4096), BOUNDARY, str(tmp_path), 10 ** 6)
+    assert os.listdir(tmp_path) == []
+
+
+# WebM
+
+def ebml_size(n):
+    return (0x10000000 | n).to_bytes(4, 'big')
+
+
+def element(element_id, data):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + ebml_size(len(data)) + data
+
+
+def simple_block(timecode):
+    return element(ingest.SIMPLE_BLOCK, b'\x81' + struct.pack('>h', timecode) + b'\x80' + b'opus' * 10)
+
+
+def cluster(timecode, block_times):
+    return element(ingest.CLUSTER, element(ingest.CLUSTER_TIMECODE, timecode.to_bytes(2, 'big'))
+                   + b''.join(simple_block(t) for t in block_times))
+
+
+def webm(clusters, duration=None):
+    info = element(ingest.TIMECODE_SCALE, (1_000_000).to_bytes(3, 'big'))
+    if duration is not None:
+        info += element(ingest.DURATION, struct.pack('>d', duration * 1000))
+    # MediaRecorder streams the Segment with an unknown size
+    segment = ingest.SEGMENT.to_bytes(4, 'big') + b'\x01' + b'\xff' * 7
+    return element(ingest.EBML_HEADER, element(0x4282, b'webm')) + segment + element(ingest.INFO, info) + clusters
+
+
+def probe(tmp_path, data, name='answer.webm'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return ingest.probe_recording(str(path))
+
+
+def test_webm_duration_from_the_last_block(tmp_path):
+    data = webm(cluster(0, [0, 1000, 2000]) + cluster(5000, [0, 1000]))
+    assert probe(tmp_path, data) == {'format': 'webm', 'duration': 6.0}
+
+
+def test_webm_duration_element_wins(tmp_path):
+    data = webm(cluster(0, [0]), duration=42.5)
+    assert probe(tmp_path, data)['duration'] == pytest.approx(42.5)
+
+
+def test_truncated_webm_uses_the_blocks_before_the_cut(tmp_path):
+    # Recording stopped mid-write: the last block's header is cut off
+    data = webm(cluster(0, [0]) + cluster(5000, [0, 1000, 2000]))
+    cut = data.rindex(ingest.SIMPLE_BLOCK.to_bytes(1, 'big') + ebml_size(0)[:1]) + 1
+    assert probe(tmp_path, data[:cut])['duration'] == 6.0
+
+
+def test_malformed_webm_has_no_duration(tmp_path):
+    header = element(ingest.EBML_HEADER, element(0x4282, b'webm'))
+    assert probe(tmp_path, header + b'\x00' * 64) == {'format': 'webm', 'duration': None}
+    assert probe(tmp_path, header + element(ingest.INFO, b'')) == {'format': 'webm', 'duration': None}
+    assert probe(tmp_path, b'RIFF' + b'\x00' * 64) == {'format': None, 'duration': None}
+
+
+# Ogg
+
+def ogg_page(granule, payload, sequence):
+    return (b'OggS' + bytes([0, 0]) + struct.pack('<qII', granule, 1, sequence) + b'\0' * 4
+            + bytes([1, len(payload)]) + payload)
+
+
+def test_ogg_duration_from_the_last_finished_page(tmp_path):
+    opus_head = b'OpusHead' + bytes([1, 1]) + struct.pack('<HIhB', 312, 48000, 0, 0)
+    pages = [ogg_page(0, opus_head, 0), ogg_page(0, b'OpusTags', 1)]
+    pages += [ogg_page(48000 * (i + 1) + 312, b'\0' * 200, i + 2) for i in range(7)]
+    # A page where no packet finishes carries granule -1 and is skipped
+    pages.append(ogg_page(-1, b'\0' * 200, 9))
+
+    assert probe(tmp_path, b''.join(pages), 'answer.ogg') == {'format': 'ogg', 'duration': 7.0}
+
+
+# Containers the probe cannot time
+
+def test_untimed_recordings_are_checked_once_decoded(tmp_path):
+    mp4 = tmp_path / 'answer.mp4'
+    mp4.write_bytes(b'\0\0\0\x18ftypmp42' + b'\0' * 64)
+    assert ingest.probe_recording(str(mp4)) == {'format': 'mp4', 'duration': None}
+
+    ingest.check_decoded_duration(str(mp4), np.zeros(30 * 16000, dtype=np.float32), 5, 180)
+    with pytest.raises(ValueError, match='too long'):
+        ingest.check_decoded_duration(str(mp4), np.zeros(200 * 16000, dtype=np.float32), 5, 180)
+    with pytest.raises(ValueError, match='too short'):
+        ingest.check_decoded_duration(str(mp4), np.zeros(2 * 16000, dtype=np.float32), 5, 180)
+
+    # Timed at upload already: the decode is not re-checked
+    timed = tmp_path / 'answer.webm'
+    timed.write_bytes(webm(cluster(0, [0, 1000])))
+    ingest.check_decoded_duration(str(timed), np.zeros(200 * 16000, dtype=np.float32), 5, 180)
@@ -0,0 +1,71 @@
+import os
+import time
+
+import pytest
+
+from services.janitor import Janitor
+from services.session_store import create_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return create_store('sqlite', str(tmp_path / 'sessions.db'))
+
+
+def add_session(store, upload_folder, session_id, completed=False, idle_seconds=0):
+    store.create(session_id, '2026-01-01T00:00:00', [1, 2, 3])
+    os.makedirs(os.path.join(upload_folder, session_id))
+    with open(os.path.join(upload_folder, session_id, 'q1_video.webm'), 'wb') as f:
+        f.write(b'x' * 100)
+    store.append_event(session_id, 'stage', {})
+    if completed:
+        store.update(session_id, status='completed', analysis={'matched_categories': []})
+    with store._transaction() as conn:
+        conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time() - idle_seconds, session_id))
+
+
+def test_idle_completed_sessions_keep_their_analysis(store, tmp_path):
+    uploads = str(tmp_path / 'uploads')
+    add_session(store, uploads, 'abandoned', idle_seconds=3 * 3600)
+    add_session(store, uploads, 'done', completed=True, idle_seconds=3 * 3600)
+    add_session(store, uploads, 'expired', completed=True, idle_seconds=100 * 86400)
+    evicted = []
+    janitor = Janitor(store, uploads, ttl_seconds=7200, completed_ttl_seconds=90 * 86400, on_evict=evicted.append)
+
+    report = janitor.sweep()
+
+    assert (report['idle'], report['released'], report['expired']) == (1, 1, 1)
+    assert store.get('abandoned') is None and store.get('expired') is None
+    assert store.get('done')['analysis'] == {'matched_categories': []}
+    assert not os.path.exists(os.path.join(uploads, 'done'))
+    assert store.events_since('done') == []
+    assert sorted(evicted) == ['abandoned', 'done', 'expired']
+
+    # Scratch state is only released once
+    assert janitor.sweep()['released'] == 0
+
+
+def test_session_cap_ignores_completed_sessions(store, tmp_path):
+    uploads = str(tmp_path / 'uploads')
+    for i in range(3):
+        add_session(store, uploads, f"done{i}", completed=True, idle_seconds=100 - i)
+    add_session(store, uploads, 'old', idle_seconds=50)
+    add_session(store, uploads, 'new')
+
+    report = Janitor(store, uploads, ttl_seconds=0, max_sessions=1).sweep()
+
+    assert report['over_cap'] == 1 and store.get('old') is None and store.get('new') is not None
+    assert all(store.get(f"done{i}") for i in range(3))
+
+
+def test_completed_sessions_expire_with_the_idle_ttl_by_default(store, tmp_path):
+    from config import Config
+
+    assert Config.COMPLETED_SESSION_TTL_SECONDS == Config.SESSION_TTL_SECONDS
+    uploads = str(tmp_path / 'uploads')
+    add_session(store, uploads, 'done', completed=True, idle_seconds=Config.SESSION_TTL_SECONDS + 60)
+
+    report = Janitor(store, uploads, ttl_seconds=Config.SESSION_TTL_SECONDS,
+                     completed_ttl_seconds=Config.COMPLETED_SESSION_TTL_SECONDS).sweep()
+
+    assert report['expired'] == 1 and store.get('done') is None
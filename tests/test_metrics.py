@@ -0,0 +1,101 @@
+import json
+import os
+import re
+
+import pytest
+
+from services import metrics
+
+DEAD_PID = 999_999_999
+SAMPLE = re.compile(r'^([a-z_]+)(?:\{(.*)\})? (\S+)$')
+
+
+def parse(text):
+    """Prometheus text format -> ({name: (type, help)}, {(name, labels): value})."""
+    families, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, help_text = line[len('# HELP '):].split(' ', 1)
+            families[name] = [None, help_text]
+        elif line.startswith('# TYPE '):
+            name, kind = line[len('# TYPE '):].split(' ')
+            families[name][0] = kind
+        else:
+            name, labels, value = SAMPLE.match(line).groups()
+            pairs = tuple(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or ''))
+            samples[(name, pairs)] = float(value)
+    return {name: tuple(family) for name, family in families.items()}, samples
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """Empty metrics for this process, shared through a fresh directory."""
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_histograms', {})
+    monkeypatch.setattr(metrics, '_gauge_callbacks', {})
+    monkeypatch.setattr(metrics, '_directory', str(tmp_path))
+    monkeypatch.setattr(metrics, '_pid_alive', lambda pid: pid != DEAD_PID)
+    return tmp_path
+
+
+def write_worker(directory, pid, counters=(), histograms=()):
+    with open(os.path.join(directory, f'worker-{pid}.json'), 'w') as f:
+        json.dump({'counters': list(counters), 'histograms': list(histograms), 'gauges': []}, f)
+
+
+def test_render_parses_as_prometheus_text(registry):
+    metrics.inc('intake_errors_total', stage='upload')
+    metrics.inc('intake_errors_total', 2, stage='transcribe')
+    metrics.inc('intake_cache_requests_total', cache='transcript', result='say "hi"\n')
+    for seconds in (0.01, 0.3, 0.3, 500):
+        metrics.observe('intake_claude_seconds', seconds)
+    metrics.register_gauge('intake_event_streams', lambda: 3)
+
+    families, samples = parse(metrics.render(gauges={'intake_active_sessions': 7}))
+
+    assert families['intake_errors_total'] == ('counter', "Failures by pipeline stage")
+    assert families['intake_claude_seconds'][0] == 'histogram'
+    assert samples[('intake_errors_total', (('stage', 'transcribe'),))] == 2
+    assert samples[('intake_errors_total', (('stage', 'upload'),))] == 1
+    assert samples[('intake_cache_requests_total', (('cache', 'transcript'), ('result', 'say \\"hi\\"\\n')))] == 1
+    assert samples[('intake_claude_seconds_bucket', (('le', '0.05'),))] == 1
+    assert samples[('intake_claude_seconds_bucket', (('le', '0.5'),))] == 3
+    assert samples[('intake_claude_seconds_bucket', (('le', '300'),))] == 3
+    assert samples[('intake_claude_seconds_bucket', (('le', '+Inf'),))] == 4
+    assert samples[('intake_claude_seconds_count', ())] == 4
+    assert samples[('intake_claude_seconds_sum', ())] == pytest.approx(500.61)
+    assert samples[('intake_event_streams', ())] == 3
+    assert samples[('intake_active_sessions', ())] == 7
+    # Metrics with no data are left out
+    assert 'intake_queue_wait_seconds' not in families
+
+
+def test_live_workers_are_summed(registry):
+    metrics.inc('intake_errors_total', stage='upload')
+    write_worker(registry, 1, counters=[['intake_errors_total', [['stage', 'upload']], 4]])
+
+    _, samples = parse(metrics.render())
+
+    assert samples[('intake_errors_total', (('stage', 'upload'),))] == 5
+    assert os.path.exists(os.path.join(registry, 'worker-1.json'))
+
+
+def test_exited_workers_counts_are_retained(registry):
+    buckets = len(metrics.SECONDS_BUCKETS) + 1
+    metrics.inc('intake_errors_total', stage='upload')
+    write_worker(registry, DEAD_PID,
+                 counters=[['intake_errors_total', [['stage', 'upload']], 4]],
+                 histograms=[['intake_claude_seconds', [], [1] + [0] * (buckets - 1) + [0.02]]])
+
+    first = parse(metrics.render())[1]
+    assert not os.path.exists(os.path.join(registry, f'worker-{DEAD_PID}.json'))
+
+    # Later scrapes still count the exited worker, and fold in the next one that exits
+    write_worker(registry, DEAD_PID, counters=[['intake_errors_total', [['stage', 'upload']], 10]])
+    second = parse(metrics.render())[1]
+    third = parse(metrics.render())[1]
+
+    assert first[('intake_errors_total', (('stage', 'upload'),))] == 5
+    assert first[('intake_claude_seconds_count', ())] == 1
+    assert second[('intake_errors_total', (('stage', 'upload'),))] == 15
+    assert third == second
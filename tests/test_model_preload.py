@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import tiers, transcription
+
+
+class FakeModel:
+    def __init__(self, error=None):
+        self.error = error
+        self.beam_sizes = []
+
+    def transcribe(self, audio, beam_size=5):
+        self.beam_sizes.append(beam_size)
+        if self.error:
+            raise self.error
+        return iter([SimpleNamespace(text="hello")]), None
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    def install(model):
+        monkeypatch.setattr(transcription, 'get_model', lambda name: model)
+        monkeypatch.setitem(transcription._model_states, 'fake', {
+            'state': 'loaded', 'load_seconds': 0.1, 'warmup_seconds': None, 'loaded_at': 0.0, 'error': None})
+        return model
+    return install
+
+
+def test_warm_up_uses_the_tier_beam_and_marks_the_model_ready(fake_model):
+    model = fake_model(FakeModel())
+    transcription.preload_model('fake', beam_size=1)
+
+    assert model.beam_sizes == [1]
+    assert transcription.model_state('fake')['state'] == 'ready'
+
+
+def test_failed_warm_up_is_degraded_not_ready(fake_model):
+    fake_model(FakeModel(RuntimeError("illegal instruction")))
+    transcription.preload_model('fake')
+
+    state = transcription.model_state('fake')
+    assert state['state'] == 'degraded'
+    assert "illegal instruction" in state['error']
+
+
+def test_health_is_503_for_a_degraded_model(monkeypatch):
+    import app as intake_app
+
+    monkeypatch.setattr(intake_app, 'model_state', lambda name: {'state': 'degraded', 'error': "Warm-up failed"})
+    response = intake_app.app.test_client().get('/health')
+
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'degraded'
+
+
+def test_model_tiers_warm_each_model_with_its_best_tier(monkeypatch):
+    monkeypatch.setattr(tiers, '_controller', tiers.TierController(tiers.parse_tiers("base:5,base:1,tiny:1")))
+    assert [(tier['model'], tier['beam_size']) for tier in tiers.model_tiers()] == [('base', 5), ('tiny', 1)]
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from services import pipeline
+from services.pipeline import fair_pick
+
+
+def job(session_id, submitted_at, answers=3, status='queued', started=None):
+    return {'session_id': session_id, 'submitted_at': submitted_at, 'answers': answers, 'status': status,
+            'inference_started_at': started}
+
+
+def reference_pick(ready, jobs):
+    # The straightforward per-job rescan fair_pick must agree with
+    ahead, keys = {}, []
+    for entry in ready:
+        session_jobs = [other for other in jobs if other['session_id'] == entry['session_id']]
+        served = sum(1 for other in session_jobs
+                     if other['inference_started_at'] and other['inference_started_at'] >= entry['submitted_at'])
+        remaining = entry['answers'] - sum(1 for other in session_jobs if other['status'] == 'done')
+        keys.append((served + ahead.get(entry['session_id'], 0), remaining, entry['submitted_at']))
+        ahead[entry['session_id']] = ahead.get(entry['session_id'], 0) + 1
+    return min(range(len(ready)), key=keys.__getitem__)
+
+
+def test_a_sessions_later_answers_wait_behind_other_first_answers():
+    a1, a2, a3, b1 = job('a', 1), job('a', 2), job('a', 3), job('b', 4)
+    ready = [a1, a2, a3, b1]
+    assert fair_pick(ready, ready) == 0
+
+    a1['inference_started_at'] = 5
+    ready = [a2, a3, b1]
+    assert ready[fair_pick(ready, [a1] + ready)] is b1
+
+
+def test_equally_served_sessions_closest_to_completion_go_first():
+    earlier = job('new', 1)
+    nearly_done = job('old', 2)
+    done = [job('old', 0, status='done', started=0.5), job('old', 0.2, status='done', started=0.6)]
+    ready = [earlier, nearly_done]
+    assert ready[fair_pick(ready, ready + done)] is nearly_done
+
+
+def test_matches_the_rescanning_order():
+    rng = random.Random(7)
+    for _ in range(200):
+        jobs = []
+        for i in range(rng.randint(1, 12)):
+            status = rng.choice(['queued', 'running', 'done'])
+            jobs.append(job(rng.choice('abcd'), rng.random() * 10, answers=3, status=status,
+                            started=rng.random() * 10 if status != 'queued' else None))
+        ready = sorted((j for j in jobs if j['inference_started_at'] is None), key=lambda j: j['submitted_at'])
+        if ready:
+            assert fair_pick(ready, jobs) == reference_pick(ready, jobs)
+
+
+@pytest.fixture
+def bounded_queue(monkeypatch):
+    import app  # noqa: F401  (importing the app configures the pipeline; override it afterwards)
+
+    monkeypatch.setattr(pipeline, '_queue_limit', 2)
+    monkeypatch.setattr(pipeline, '_max_workers', 1)
+    monkeypatch.setattr(pipeline, '_average_seconds', 10.0)
+    yield
+    for session_id in {key[0] for key in list(pipeline._jobs) + list(pipeline._waitlist)}:
+        pipeline.discard(session_id)
+
+
+def test_admission_refuses_past_the_queue_limit_and_keeps_the_place_in_line(bounded_queue):
+    pipeline.admit('a', 1)
+    pipeline.admit('b', 1)
+
+    with pytest.raises(pipeline.QueueFull) as first:
+        pipeline.admit('c', 1)
+    with pytest.raises(pipeline.QueueFull) as second:
+        pipeline.admit('d', 1)
+    assert (first.value.position, first.value.retry_after) == (3, 10)
+    assert (second.value.position, second.value.retry_after) == (4, 20)
+
+    # A slot frees up: it goes to the request refused first
+    pipeline.discard('a')
+    with pytest.raises(pipeline.QueueFull):
+        pipeline.admit('d', 1)
+    assert pipeline.admit('c', 1)['status'] == 'queued'
+
+
+def test_transcribe_answers_429_with_position_and_retry_after(bounded_queue):
+    from app import app, session_store
+
+    pipeline.admit('a', 1)
+    pipeline.admit('b', 1)
+    client = app.test_client()
+    session_id = client.post('/api/session/start?test').get_json()['session_id']
+    session_store.update_question(session_id, 1, video_path='/tmp/q1.webm', recording_id='r1')
+
+    response = client.post('/api/transcribe/1')
+
+    body = response.get_json()
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(body['retry_after']) == '10'
+    assert (body['position'], body['question_id'], body['queued']) == (3, 1, True)
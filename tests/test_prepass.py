@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services import transcription
+from services.transcription import detect_speech, transcribe_audio
+
+SAMPLE_RATE = 16000
+
+
+def continuous_speech(rms: float, seconds: float = 20.0) -> np.ndarray:
+    """Pause-free, syllable-rate modulated noise at the given overall RMS."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = np.random.default_rng(0).standard_normal(t.shape[0]) * (1 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    return (signal * rms / np.sqrt(np.mean(signal ** 2))).astype(np.float32)
+
+
+@pytest.fixture(autouse=True)
+def prepass_defaults():
+    transcription.configure_prepass(True, 0.003, 2.0)
+
+
+@pytest.mark.parametrize('rms', [0.02, 0.012, 0.008])
+def test_continuous_low_level_speech_is_kept(rms):
+    audio = continuous_speech(rms)
+    trimmed, regions, report = detect_speech(audio)
+
+    assert not report['silent']
+    assert report['threshold'] < report['peak']
+    assert report['speech_seconds'] > 15
+    assert trimmed.shape[0] / SAMPLE_RATE > 19
+
+
+def test_silence_and_hiss_are_skipped():
+    for audio in (np.zeros(5 * SAMPLE_RATE, dtype=np.float32),
+                  np.random.default_rng(1).standard_normal(5 * SAMPLE_RATE).astype(np.float32) * 0.001):
+        trimmed, regions, report = detect_speech(audio)
+        assert report['silent'] and trimmed is None
+
+
+def test_leading_and_trailing_silence_is_trimmed():
+    quiet = np.zeros(3 * SAMPLE_RATE, dtype=np.float32)
+    audio = np.concatenate([quiet, continuous_speech(0.02, 5.0), quiet])
+    trimmed, regions, report = detect_speech(audio)
+
+    assert 5 <= report['kept_seconds'] < 6
+    assert regions[0][0] == pytest.approx(2.7, abs=0.05)
+
+
+def test_soft_answer_reaches_whisper(monkeypatch):
+    class Segment:
+        text, start, end = " I get tired easily", 0.0, 20.0
+
+    class Model:
+        def transcribe(self, audio, **kwargs):
+            return iter([Segment()]), None
+
+    monkeypatch.setattr(transcription, 'get_model', lambda name: Model())
+    details = {}
+    assert transcribe_audio(continuous_speech(0.008), details=details) == "I get tired easily"
+    assert not details['prepass']['silent']
+
+
+def test_trim_threshold_settings():
+    audio = continuous_speech(0.02)
+    report = detect_speech(audio)[2]
+    # Default: the noise floor x 2.5 would be above the speech, so half the peak wins
+    assert report['threshold'] == pytest.approx(report['peak'] * 0.5, abs=1e-4)
+
+    transcription.configure_prepass(True, 0.003, 2.0, max_rms=0.004)
+    assert detect_speech(audio)[2]['threshold'] == pytest.approx(0.004)
+    transcription.configure_prepass(True, 0.003, 2.0, noise_ratio=1.0)
+    assert detect_speech(audio)[2]['threshold'] == pytest.approx(report['noise_floor'], abs=1e-4)
+    transcription.configure_prepass(True, 0.003, 2.0, peak_ratio=0.3)
+    assert detect_speech(audio)[2]['threshold'] == pytest.approx(report['peak'] * 0.3, abs=1e-4)
@@ -0,0 +1,41 @@
+import json
+
+from config import Config
+from services import reanalyze
+from services.session_store import create_store
+from services.symptom_analyzer import analysis_cache_key
+
+ANSWERS = {1: "I get brain fog", 2: "Since March", 3: "I had to stop working"}
+
+
+def add_analyzed_session(store, session_id, categories):
+    store.create(session_id, '2026-01-01T00:00:00', [1, 2, 3])
+    for question_id, text in ANSWERS.items():
+        store.update_question(session_id, question_id, transcription=text)
+    store.update(session_id, status='completed', analysis={'matched_categories': []},
+                 analysis_key=analysis_cache_key(ANSWERS, Config.CLAUDE_MODEL, categories),
+                 analysis_categories=[cat['id'] for cat in categories])
+
+
+def test_shortlisted_sessions_are_unchanged_under_the_same_taxonomy(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'CLAUDE_API_KEY', 'test-key')
+    db = str(tmp_path / 'sessions.db')
+    store = create_store('sqlite', db)
+    add_analyzed_session(store, 'full', Config.SYMPTOM_CATEGORIES)
+    add_analyzed_session(store, 'shortlisted', Config.SYMPTOM_CATEGORIES[:2])
+    # Analyzed with a category since removed from the taxonomy: must be re-run
+    add_analyzed_session(store, 'stale', Config.SYMPTOM_CATEGORIES[:1] + [
+        {'id': 'retired', 'name': 'Retired', 'description': 'No longer in the taxonomy'}])
+    monkeypatch.setattr(reanalyze, 'run_analyses', _fake_run_analyses)
+
+    reanalyze.main(['--db', db, '--out', str(tmp_path / 'out')])
+
+    with open(tmp_path / 'out' / 'report.json') as f:
+        totals = json.load(f)['totals']
+    assert (totals['sessions'], totals['unchanged']) == (3, 2)
+    assert _fake_run_analyses.sessions == ['stale']
+
+
+async def _fake_run_analyses(jobs, *args, **kwargs):
+    _fake_run_analyses.sessions = [job[0] for job in jobs]
+    return []
@@ -0,0 +1,29 @@
+import pytest
+
+from services.session_store import MAX_EVENTS_PER_SESSION, create_store
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_event_log_keeps_newest_events_per_session(backend, tmp_path):
+    store = create_store(backend, str(tmp_path / 'sessions.db'))
+    for i in range(MAX_EVENTS_PER_SESSION + 20):
+        store.append_event('a', 'segment', {'i': i})
+    store.append_event('b', 'segment', {'i': 0})
+
+    events = store.events_since('a')
+    assert len(events) == MAX_EVENTS_PER_SESSION
+    assert events[0][2] == {'i': 20} and events[-1][2] == {'i': MAX_EVENTS_PER_SESSION + 19}
+    assert len(store.events_since('b')) == 1
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_update_with_expect_only_applies_when_fields_match(backend, tmp_path):
+    store = create_store(backend, str(tmp_path / 'sessions.db'))
+    store.create('a', '2026-01-01T00:00:00', [1])
+    run = {'key': 'k1', 'questions': [1], 'answers': {'1': "Brain fog"}, 'started_at': 1.5}
+
+    assert store.update('a', expect={'speculation': None, 'analysis': None}, speculation=run)
+    assert not store.update('a', expect={'speculation': None}, speculation={'key': 'k2'})
+    assert store.update('a', expect={'speculation': run}, speculation=dict(run, status='done'))
+    assert store.get('a')['speculation']['status'] == 'done'
+    assert not store.update('missing', expect={'speculation': None}, speculation=run)
@@ -0,0 +1,35 @@
+from concurrent.futures import Future
+
+from services import speculation, symptom_analyzer
+from services.session_store import create_store
+
+
+def test_run_replaced_by_newer_answers_is_discarded(tmp_path, monkeypatch):
+    store = create_store('sqlite', str(tmp_path / 'sessions.db'))
+    store.create('a', '2026-01-01T00:00:00', [1, 2])
+    speculation.configure(store, enabled=True, api_key='test-key', model='stub',
+                          symptom_categories=[{'id': 'brain_fog', 'name': 'Brain Fog', 'description': ''}])
+    futures = []
+
+    def fake_submit(*args, **kwargs):
+        futures.append(Future())
+        return futures[-1]
+
+    monkeypatch.setattr(symptom_analyzer, 'submit_analysis', fake_submit)
+    store.update_question('a', 1, transcription="Brain fog")
+    speculation.on_transcription('a')
+    speculation.on_transcription('a')  # same answers, run in flight: not started again
+    assert len(futures) == 1
+    first_key = store.get('a')['speculation']['key']
+
+    # The patient re-records: a new run replaces the first before it finishes
+    store.update_question('a', 1, transcription="Headaches")
+    speculation.on_transcription('a')
+    futures[0].set_result({'matched_categories': [], 'stale': True})
+
+    run = store.get('a')['speculation']
+    assert run['key'] != first_key and run['status'] == 'running'
+    futures[1].set_result({'matched_categories': []})
+    assert store.get('a')['speculation']['status'] == 'done'
+    assert speculation.result('a', run['key']) == {'matched_categories': []}
+    speculation.configure(None)
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from services import spool as spool_module
+from services.spool import JobSpool
+
+DEAD_PID = 999_999_999
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool_module, '_pid_alive', lambda pid: pid != DEAD_PID)
+    return JobSpool(str(tmp_path / 'spool'))
+
+
+def submit(spool, session_id, question_id, audio=None):
+    return spool.submit(session_id, question_id, f'rec-{session_id}-{question_id}', f'/uploads/{session_id}.webm',
+                        audio=audio, answers=3)
+
+
+def spooled_audio(spool):
+    return sorted(name for name in os.listdir(spool.directory) if name.endswith('.f32'))
+
+
+def test_each_job_is_claimed_once_in_fair_order(spool):
+    submit(spool, 'a', 1)
+    submit(spool, 'a', 2)
+    submit(spool, 'b', 1)
+
+    first = spool.claim(worker_pid=1)
+    second = spool.claim(worker_pid=2)
+    third = spool.claim(worker_pid=3)
+
+    # b's only answer goes before a's second one
+    assert [(job['session_id'], job['question_id']) for job in (first, second, third)] == [('a', 1), ('b', 1), ('a', 2)]
+    assert spool.claim(worker_pid=4) is None
+    assert spool.stats() == {'queued': 0, 'running': 3, 'busy_workers': 3}
+
+
+def test_resubmission_supersedes_the_queued_job(spool):
+    old = submit(spool, 'a', 1, audio=np.zeros(160, dtype=np.float32))
+    new = submit(spool, 'a', 1)
+
+    assert spool.get('a', 1)['job_id'] == new['job_id']
+    assert spool.claim(worker_pid=1)['job_id'] == new['job_id']
+    assert old['audio_file'] not in spooled_audio(spool)
+
+
+def test_jobs_of_an_exited_worker_are_requeued(spool):
+    audio = np.arange(320, dtype=np.float32)
+    submitted = submit(spool, 'a', 1, audio=audio)
+    assert spool.claim(worker_pid=DEAD_PID)['job_id'] == submitted['job_id']
+    assert spool.stats()['running'] == 1
+
+    # The next claim after the worker died picks the job up again, spooled audio intact
+    requeued = spool.claim(worker_pid=2)
+    assert requeued['job_id'] == submitted['job_id']
+    assert requeued['worker_pid'] == 2
+    np.testing.assert_array_equal(spool.load_audio(requeued), audio)
+    assert spool.claim(worker_pid=3) is None
+
+
+def test_discard_cancels_running_jobs_instead_of_deleting_them(spool):
+    running = submit(spool, 'a', 1, audio=np.zeros(160, dtype=np.float32))
+    spool.claim(worker_pid=1)
+    queued = submit(spool, 'a', 2, audio=np.zeros(160, dtype=np.float32))
+
+    spool.discard('a')
+
+    assert spool.get('a', 2) is None
+    assert spool.get('a', 1)['status'] == 'cancelled'
+    assert spooled_audio(spool) == [running['audio_file']]
+    assert queued['audio_file'] not in spooled_audio(spool)
+
+    # The worker holding it learns it was cancelled, and finishing it removes the row
+    assert spool.cancelled(running)
+    assert spool.finish(running, 'done', result='transcript') is False
+    assert spool.get('a', 1) is None
+    assert spooled_audio(spool) == []
+
+
+def test_cancelled_jobs_of_an_exited_worker_are_dropped(spool):
+    job = submit(spool, 'a', 1, audio=np.zeros(160, dtype=np.float32))
+    spool.claim(worker_pid=DEAD_PID)
+    spool.discard('a')
+
+    assert spool.claim(worker_pid=1) is None
+    assert spool.get('a', 1) is None
+    assert job['audio_file'] not in spooled_audio(spool)
+
+
+def test_finish_keeps_the_result(spool):
+    submit(spool, 'a', 1)
+    job = spool.claim(worker_pid=1)
+
+    assert spool.finish(job, 'done', result='transcript', details={'tier': 'base'}) is True
+    stored = spool.get('a', 1)
+    assert (stored['status'], stored['result'], stored['details']) == ('done', 'transcript', {'tier': 'base'})
+    assert not spool.cancelled(job)
+    assert spool.queue_depth() == 0
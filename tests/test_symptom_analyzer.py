@@ -0,0 +1,106 @@
+import anthropic
+import pytest
+
+from benchmarks.stub_claude import ANALYSIS, StubClaudeServer
+from config import Config
+from services import symptom_analyzer
+from services.symptom_analyzer import (
+    ANALYSIS_TOOL_NAME, analyze_symptoms, configure_cache, configure_client, get_client, submit_analysis
+)
+
+CATEGORIES = Config.SYMPTOM_CATEGORIES
+ANSWERS = {1: "I can't focus at work", 2: "Since my infection in March", 3: "I had to cut my hours"}
+
+
+@pytest.fixture
+def stub(request):
+    """A running stub server; parametrize indirectly with StubClaudeServer kwargs."""
+    server = StubClaudeServer(**getattr(request, 'param', {}))
+    url = server.start()
+    configure_client(base_url=url, max_retries=2, timeout=5.0)
+    configure_cache(max_entries=0)
+    yield server
+    server.stop()
+    configure_client()
+
+
+def test_analysis_is_read_from_the_tool_call(stub):
+    details = {}
+    assert analyze_symptoms(ANSWERS, 'test-key', symptom_categories=CATEGORIES, details=details) == ANALYSIS
+    assert details['output_tokens'] == 120
+    assert details['cache_write_tokens'] > 0
+
+
+def test_response_without_the_tool_call_is_an_error(stub):
+    message = get_client('test-key').messages.create(
+        model='stub', max_tokens=16, messages=[{'role': 'user', 'content': 'hello'}])
+    with pytest.raises(ValueError, match="did not return an analysis"):
+        symptom_analyzer._handle_response('key', message, 0.0)
+
+
+def test_requests_share_one_pooled_connection(stub):
+    for question in range(1, 4):
+        analyze_symptoms({**ANSWERS, question: "Worse after exercise"}, 'test-key', symptom_categories=CATEGORIES)
+    assert len(stub.requests) == 3
+    assert stub.connections == 1
+    # Identical system prompt and tools: only the first request writes the cache
+    details = {}
+    analyze_symptoms(ANSWERS, 'test-key', symptom_categories=CATEGORIES, details=details)
+    assert details['cache_read_tokens'] > 0 and details['cache_write_tokens'] == 0
+
+
+@pytest.mark.parametrize('stub', [{'errors': [529, 500]}], indirect=True)
+def test_overloaded_and_server_errors_are_retried(stub):
+    assert analyze_symptoms(ANSWERS, 'test-key') == ANALYSIS
+    assert len(stub.requests) == 3
+
+
+@pytest.mark.parametrize('stub', [{'errors': [529, 529, 529]}], indirect=True)
+def test_gives_up_after_max_retries(stub):
+    with pytest.raises(anthropic.APIStatusError) as excinfo:
+        analyze_symptoms(ANSWERS, 'test-key')
+    assert excinfo.value.status_code == 529
+    assert len(stub.requests) == 3
+
+
+@pytest.mark.parametrize('stub', [{'latency': 1.0}], indirect=True)
+def test_slow_responses_time_out(stub):
+    configure_client(base_url=stub.base_url, max_retries=1, timeout=0.2)
+    with pytest.raises(anthropic.APITimeoutError):
+        analyze_symptoms(ANSWERS, 'test-key')
+    assert len(stub.requests) == 2
+
+
+def test_streamed_categories_arrive_before_the_result(stub):
+    categories = []
+    future = submit_analysis(ANSWERS, 'test-key', on_category=categories.append)
+    assert future.result(timeout=10) == ANALYSIS
+    assert categories == ANALYSIS['matched_categories']
+
+
+def test_failed_analysis_falls_back_to_the_keyword_matcher(stub, monkeypatch):
+    import app as intake_app
+
+    monkeypatch.setattr(Config, 'CLAUDE_API_KEY', 'test-key')
+    monkeypatch.setattr(Config, 'ANALYSIS_FALLBACK', True)
+    configure_client(base_url=stub.base_url, max_retries=0)
+    stub.errors = [500]
+    client = intake_app.app.test_client()
+    session_id = client.post('/api/session/start?test').get_json()['session_id']
+    intake_app.session_store.update_question(session_id, 1, transcription="Brain fog since March")
+
+    response = client.post('/api/analyze?test')
+
+    body = response.get_json()
+    assert response.status_code == 200 and body['degraded']
+    assert body['analysis']['provisional']
+    assert 'brain_fog' in [c['category_id'] for c in body['analysis']['matched_categories']]
+    assert intake_app.session_store.get(session_id)['analysis'] == body['analysis']
+
+
+def test_prefixes_below_the_cache_minimum_are_sent_without_a_breakpoint(stub):
+    details = {}
+    analyze_symptoms(ANSWERS, 'test-key', symptom_categories=CATEGORIES[:2], details=details)
+    assert details['cache_write_tokens'] == 0
+    analyze_symptoms(ANSWERS, 'test-key', symptom_categories=CATEGORIES, details=details)
+    assert details['cache_write_tokens'] > 0
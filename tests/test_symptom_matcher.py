@@ -0,0 +1,91 @@
+import pytest
+
+from services.symptom_matcher import EVIDENCE_CHARS, SymptomMatcher
+
+CATEGORIES = [
+    {'id': 'headache', 'name': 'Headaches', 'description': 'Headaches or migraines.'},
+    {'id': 'fatigue', 'name': 'Fatigue', 'description': 'Feeling exhausted, low energy.'},
+    {'id': 'smell', 'name': 'Smell & Taste', 'description': 'Loss of smell or taste.'},
+]
+SYNONYMS = {'headache': ['pounding head']}
+
+
+@pytest.fixture
+def matcher():
+    return SymptomMatcher(CATEGORIES, SYNONYMS)
+
+
+def matched_ids(matcher, text):
+    return [entry['category_id'] for entry in matcher.match({1: text})]
+
+
+@pytest.mark.parametrize('text', [
+    "I don't have headaches",
+    "I don’t get headaches",
+    "I do not have bad headaches",
+    "I haven't had migraines",
+    "I've never had migraines",
+    "No headaches at all",
+    "Some days without headaches",
+    "I did not get any headaches",
+])
+def test_negated_mentions_are_not_counted(matcher, text):
+    assert matched_ids(matcher, text) == []
+
+
+@pytest.mark.parametrize('text', [
+    "I get headaches",
+    "I no longer have headaches",            # "no longer" describes a change, not an absence
+    "I don't have really bad headaches",     # the negation is more than one word away
+    "Not sure why, but the headaches are back",
+])
+def test_other_mentions_are_counted(matcher, text):
+    assert matched_ids(matcher, text) == ['headache']
+
+
+def test_matches_are_ranked_and_quoted(matcher):
+    answers = {
+        1: "I am exhausted all day. My pounding head wakes me up.",
+        2: "Headaches every afternoon, and I can't smell coffee.",
+        3: "Migraines too. So exhausted.",
+    }
+    matched = matcher.match(answers)
+
+    assert [entry['category_id'] for entry in matched] == ['headache', 'fatigue', 'smell']
+    headache = matched[0]
+    assert headache['patient_symptoms'] == ['pounding head', 'headaches', 'migraines']
+    assert headache['confidence'] == 'medium'
+    assert headache['question_ids'] == [1, 2, 3]
+    assert headache['severity_indicators'] == ["My pounding head wakes me up.",
+                                               "Headaches every afternoon, and I can't smell coffee.",
+                                               "Migraines too."]
+    assert matched[2]['confidence'] == 'low'
+
+
+def test_evidence_is_trimmed_around_the_match(matcher):
+    before = "I have been struggling with a lot of things lately, " * 4
+    after = " which then lasts for the rest of the day and most of the evening, " * 4
+    text = f"Short one. {before}and the headaches start{after}. Another."
+
+    quote = matcher.match({1: text})[0]['severity_indicators'][0]
+
+    assert 'headaches' in quote
+    assert len(quote) <= EVIDENCE_CHARS
+    assert not quote.startswith('Short one') and 'Another' not in quote
+    # Centered on the match
+    assert abs(quote.index('headaches') - (len(quote) - quote.index('headaches') - len('headaches'))) <= 2
+
+
+def test_shortlist_falls_back_to_every_category(matcher):
+    assert [cat['id'] for cat in matcher.shortlist({1: "I can't taste anything and I'm exhausted"})] == \
+        ['fatigue', 'smell']
+    assert matcher.shortlist({1: "Nothing in particular"}) == CATEGORIES
+    assert matcher.shortlist({1: "No headaches"}) == CATEGORIES
+
+
+def test_provisional_analysis_flags_the_fallback(matcher):
+    analysis = matcher.provisional_analysis({1: "Headaches and fatigue"}, reason='Claude unavailable')
+
+    assert analysis['provisional'] is True
+    assert analysis['degraded'] == 'Claude unavailable'
+    assert analysis['priority_concerns'] == ['Headaches', 'Fatigue']
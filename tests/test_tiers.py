@@ -0,0 +1,72 @@
+import pytest
+
+from services import tiers
+from services.tiers import TierController, parse_tiers
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tiers.time, 'time', clock)
+    return clock
+
+
+def test_parse_tiers():
+    assert parse_tiers("base:5, tiny") == [{'name': 'base-beam5', 'model': 'base', 'beam_size': 5},
+                                           {'name': 'tiny-beam5', 'model': 'tiny', 'beam_size': 5}]
+    with pytest.raises(ValueError):
+        parse_tiers(" , ")
+
+
+def test_steps_down_under_load_and_back_up_with_hysteresis(clock):
+    controller = TierController(parse_tiers("base:5,base:1,tiny:1"), queue_high=6, queue_low=2,
+                                min_dwell_seconds=30)
+
+    assert controller.select(5)['name'] == 'base-beam5'
+    assert controller.select(6)['name'] == 'base-beam1'
+    # Still overloaded, but within the dwell time of the last switch
+    clock.now += 10
+    assert controller.select(9)['name'] == 'base-beam1'
+    clock.now += 30
+    assert controller.select(9)['name'] == 'tiny-beam1'
+    clock.now += 30
+    assert controller.select(9)['name'] == 'tiny-beam1'  # no tier below the last
+
+    # Between the marks nothing changes; at or below the low mark it steps back up, one tier per dwell
+    clock.now += 60
+    assert controller.select(4)['name'] == 'tiny-beam1'
+    assert controller.select(2)['name'] == 'base-beam1'
+    assert controller.select(0)['name'] == 'base-beam1'
+    clock.now += 30
+    assert controller.select(0)['name'] == 'base-beam5'
+    assert controller.stats()['switches'] == 4
+
+
+def test_p95_latency_keeps_the_tier_down_until_it_falls_below_the_low_mark(clock):
+    controller = TierController(parse_tiers("base:5,tiny:1"), latency_high=60, latency_low=20,
+                                min_dwell_seconds=0, window_seconds=120)
+    for _ in range(20):
+        controller.record(90)
+    assert controller.select(0)['name'] == 'tiny-beam1'
+
+    # Short queue but recent latency still high: stays down
+    assert controller.select(0)['name'] == 'tiny-beam1'
+    # Once the slow samples age out of the window, it recovers
+    clock.now += 121
+    controller.record(5)
+    assert controller.select(0)['name'] == 'base-beam5'
+
+
+def test_a_single_tier_never_degrades(clock):
+    controller = TierController(parse_tiers("base:5"), min_dwell_seconds=0)
+    controller.record(500)
+    assert controller.select(100)['name'] == 'base-beam5'
+    assert controller.stats()['switches'] == 0
@@ -0,0 +1,63 @@
+import numpy as np
+
+from services.transcript_cache import TranscriptCache, find_in_session, hash_audio, hash_file
+
+
+def test_hit_by_either_fingerprint():
+    cache = TranscriptCache(max_entries=8)
+    cache.put("I get tired easily", 'upload-1', 'audio-1')
+
+    assert cache.get('upload-1') == "I get tired easily"
+    # A re-encoded upload has a new file hash but the same decoded audio
+    assert cache.get('upload-2', 'audio-1') == "I get tired easily"
+    assert cache.get('upload-2', 'audio-2') is None
+    assert cache.get(None, None) is None
+    assert cache.stats() == {'entries': 2, 'hits': 2, 'misses': 2}
+
+
+def test_least_recently_used_fingerprints_are_evicted():
+    cache = TranscriptCache(max_entries=2)
+    cache.put("first", 'a')
+    cache.put("second", 'b')
+    cache.get('a')
+
+    cache.put("third", 'c')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == "first" and cache.get('c') == "third"
+    assert cache.stats()['entries'] == 2
+
+
+def test_disabled_cache_and_missing_transcriptions_store_nothing():
+    off = TranscriptCache(max_entries=0)
+    off.put("text", 'a')
+    assert off.get('a') is None
+
+    cache = TranscriptCache()
+    cache.put(None, 'a')
+    cache.put("text", None, '')
+    assert cache.stats()['entries'] == 0
+
+
+def test_fingerprints(tmp_path):
+    first, copy, other = tmp_path / 'first.webm', tmp_path / 'copy.webm', tmp_path / 'other.webm'
+    first.write_bytes(b'\x1a\x45\xdf\xa3' * 300_000)
+    copy.write_bytes(b'\x1a\x45\xdf\xa3' * 300_000)
+    other.write_bytes(b'\x1a\x45\xdf\xa3' * 300_000 + b'\0')
+    assert hash_file(str(first)) == hash_file(str(copy)) != hash_file(str(other))
+
+    samples = np.linspace(-1, 1, 16000, dtype=np.float32)
+    # Same samples, whatever the array's dtype or layout
+    assert hash_audio(samples) == hash_audio(samples.astype(np.float64)) == hash_audio(samples[::-1][::-1].copy())
+    assert hash_audio(samples) != hash_audio(samples[:-1])
+
+
+def test_find_in_session_matches_finished_questions_only():
+    session = {'questions': {
+        1: {'transcription': "done", 'upload_hash': 'u1', 'audio_hash': 'a1'},
+        2: {'transcription': None, 'upload_hash': 'u2', 'audio_hash': 'a2'},
+    }}
+    assert find_in_session(session, upload_hash='u1') == "done"
+    assert find_in_session(session, audio_hash='a1') == "done"
+    assert find_in_session(session, upload_hash='u2', audio_hash='a2') is None
+    assert find_in_session(session) is None